@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 #-*- coding:utf-8 -*-
 """Helioviewer.org Status Information Conky Script
 
@@ -14,9 +14,48 @@ Example usage:
   text_buffer_size 1024
   ${voffset 4}${execpi 5 ~/.conky/helioviewer_status.py}
 
+Starting Python and connecting to Helioviewer.org on every conky update is
+costly, so the script can instead be left running as a daemon. It keeps one
+HTTP keep-alive connection open, only downloads the status again when it
+has changed (using ETag and Last-Modified), and writes the snippet to a
+file whenever it changes. conky then only has to read that file:
+
+  ~/.conky/helioviewer_status.py --daemon --output ~/.conky/helioviewer_status.txt &
+
+  text_buffer_size 1024
+  ${voffset 4}${catp ~/.conky/helioviewer_status.txt}
+
+Several servers, such as the API mirrors, can be given with --url, each
+optionally named. They are queried concurrently, each with its own timeout,
+and their status is merged into one line per instrument, showing the status
+of the server furthest behind. When that server lags noticeably behind the
+others, its name is shown after the time. Servers that cannot be reached
+are listed at the end:
+
+  ~/.conky/helioviewer_status.py --daemon --output ~/.conky/helioviewer_status.txt \
+      --url main=http://www.helioviewer.org/api/?action=getStatus \
+      --url mirror=http://mirror.example.org/api/?action=getStatus &
+
+With --history, every poll is also recorded in a status history (see
+status_history.py, which has to be next to this script), and --sparklines
+then renders a sparkline of how far behind each instrument has been, from
+the history alone, without querying any server:
+
+  ${execpi 60 ~/.conky/helioviewer_status.py --history ~/.conky/status.hist --sparklines 1h}
+
+Until the history has a complete bucket at that resolution, or if it cannot
+be read, a "no data yet" line is shown instead.
 """
-from urllib2 import urlopen
+import os
+import sys
 import json
+import time
+import asyncio
+import argparse
+import http.client
+from urllib.parse import urljoin, urlsplit
+
+from status_history import HistoryError, LagHistory, RESOLUTIONS
 
 # Conky formatting parameters'
 # Better: allow user to specify as command-line arguments
@@ -26,51 +65,417 @@ CONKY_COLOR_NUM = 3
 CONKY_VOFFSET = 0
 CONKY_ALIGNC = 60
 
+HV_QUERY_URL = "http://www.helioviewer.org/api/?action=getStatus"
+
+# Status icon colors
+COLORS = {
+    1: "green",
+    2: "yellow",
+    3: "orange",
+    4: "red",
+    5: "gray"
+}
+
+# Characters of a sparkline, from the lowest value to the highest
+SPARKS = "\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+
+# A server whose data for an instrument is this many seconds further behind
+# than the most up to date server's is named in the merged view
+NODE_LAG_THRESHOLD = 10 * 60
+
+# Redirects followed by a query, as urllib does, and how many of them in a row
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
 def main():
     """Main"""
-    HV_QUERY_URL = "http://www.helioviewer.org/api/?action=getStatus"
-    
-    # Status icon colors
-    colors = {
-        1: "green",
-        2: "yellow",
-        3: "orange",
-        4: "red",
-        5: "gray"
-    }
-
-    # Query Helioviewer.org
-    response = urlopen(HV_QUERY_URL).read()
-    instruments = json.loads(response)
-    
-    # Generate conky snippet
+    parser = argparse.ArgumentParser(description="Display the Helioviewer.org data status in conky.")
+    parser.add_argument("--url", action="append", dest="urls", metavar="[NAME=]URL",
+                        help="getStatus URL to query, optionally named; may be given "
+                             "several times to merge the status of several servers "
+                             "(default: %s)" % HV_QUERY_URL)
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running, and write the snippet to --output whenever it changes")
+    parser.add_argument("--output", help="file to write the snippet to in daemon mode")
+    parser.add_argument("--interval", type=float, default=5,
+                        help="seconds between queries in daemon mode (default: 5)")
+    parser.add_argument("--timeout", type=float, default=10,
+                        help="seconds to wait for each server (default: 10)")
+    parser.add_argument("--history", help="status history to record each poll in")
+    parser.add_argument("--sparklines", choices=[name for name, seconds in RESOLUTIONS],
+                        help="instead of querying the servers, print a sparkline of each "
+                             "instrument's history at this resolution; requires --history")
+    parser.add_argument("--points", type=int, default=24,
+                        help="number of points in each sparkline (default: 24)")
+    args = parser.parse_args()
+
+    if args.sparklines:
+        if not args.history:
+            parser.error("--sparklines requires --history")
+        # A history that is missing, empty or unreadable is shown as having
+        # no data yet rather than as a traceback in conky
+        try:
+            history = LagHistory(args.history)
+        except (OSError, HistoryError) as e:
+            print(e, file=sys.stderr)
+            text = ""
+        else:
+            try:
+                text = render_sparklines(history, args.sparklines, args.points)
+            finally:
+                history.close()
+        sys.stdout.write(text or render_no_history())
+        return
+
+    history = LagHistory(args.history, writable=True) if args.history else None
+    pollers = [StatusPoller(url, args.timeout, name)
+               for name, url in parse_urls(args.urls or [HV_QUERY_URL])]
+
+    if args.daemon:
+        if not args.output:
+            parser.error("--daemon requires --output")
+        asyncio.run(run_daemon(pollers, args.output, args.interval, history))
+    else:
+        # Query Helioviewer.org
+        text = asyncio.run(poll_once(pollers, history))
+        if text is None:
+            sys.exit(1)
+        sys.stdout.write(text)
+
+def parse_urls(urls):
+    """Returns the name and URL of each [NAME=]URL argument. Servers are
+    named after their host unless a name is given."""
+    servers = []
+    for url in urls:
+        name, sep, rest = url.partition("=")
+        if sep and "://" in rest and "/" not in name:
+            servers.append((name, rest))
+        else:
+            servers.append((urlsplit(url).hostname, url))
+    return servers
+
+def render(instruments):
+    """Returns the conky snippet for the status of each instrument"""
     voffset = "${voffset %d}" % CONKY_VOFFSET
     font = "${font %s:size=%0.1f}" % (CONKY_FONT, CONKY_FONT_SIZE)
     color = "${color%d}" % CONKY_COLOR_NUM
     alignc = "${alignc %d}" % CONKY_ALIGNC
 
-    # Iterate through instruments in sorted order
-    iterator = iter(sorted(instruments.iteritems()))
+    lines = []
 
-    for inst, status in iterator:
+    # Iterate through instruments in sorted order
+    for inst, status in sorted(instruments.items()):
         # Ignore non-active datasets (30 days or more behind real-time)
         if status['secondsBehind'] > (30 * 24 * 60 * 60):
             continue
 
         # Status icon
-        icon = "${offset 3}${font Webdings:size=%0.1f}${color %s}n${font}  " % (CONKY_FONT_SIZE * 0.85, colors[status['level']])
-        
+        icon = "${offset 3}${font Webdings:size=%0.1f}${color %s}n${font}  " % (CONKY_FONT_SIZE * 0.85, COLORS[status['level']])
+
         # Time
-        if status['secondsBehind'] < (60 * 60):
-            time = "%d minutes" % (status['secondsBehind'] / 60)
-        elif status['secondsBehind'] < (24 * 60 * 60):
-            time = "%0.1f hours" % (status['secondsBehind'] / (60 * 60.))
+        lag = format_lag(status['secondsBehind'])
+
+        # Server lagging behind the others, when merged
+        if 'node' in status:
+            lag += " (%s)" % status['node']
+
+        lines.append(voffset + icon + font + color + alignc + inst + "${alignr}" + lag + "${font}\n")
+
+    return "".join(lines)
+
+def format_lag(seconds):
+    """Returns a number of seconds behind in minutes, hours or days"""
+    if seconds < (60 * 60):
+        return "%d minutes" % (seconds / 60)
+    elif seconds < (24 * 60 * 60):
+        return "%0.1f hours" % (seconds / (60 * 60.))
+    else:
+        return "%0.1f days" % (seconds / (24 * 60 * 60.))
+
+def render_sparklines(history, resolution, points, now=None):
+    """Returns the conky snippet showing, for each instrument, a sparkline
+    of its mean secondsBehind over the last complete buckets of a rollup
+    of the history, and the greatest secondsBehind over that time. Each
+    sparkline is scaled from 0 to its highest point; buckets without polls
+    are left blank."""
+    seconds = dict(RESOLUTIONS)[resolution]
+    now = time.time() if now is None else now
+    end = int(now) - int(now) % seconds
+    start = end - points * seconds
+
+    series = {}
+    for bucket, inst, count, least, mean, greatest, level in history.rollup(resolution, start, end):
+        means, worst = series.setdefault(inst, ([None] * points, [0, 0]))
+        means[(bucket - start) // seconds] = mean
+        worst[0] = max(worst[0], greatest)
+        worst[1] = max(worst[1], level)
+
+    voffset = "${voffset %d}" % CONKY_VOFFSET
+    font = "${font %s:size=%0.1f}" % (CONKY_FONT, CONKY_FONT_SIZE)
+    color = "${color%d}" % CONKY_COLOR_NUM
+    alignc = "${alignc %d}" % CONKY_ALIGNC
+
+    lines = []
+    for inst, (means, (greatest, level)) in sorted(series.items()):
+        # Ignore non-active datasets, as render() does
+        latest = [mean for mean in means if mean is not None][-1]
+        if latest > (30 * 24 * 60 * 60):
+            continue
+
+        icon = "${offset 3}${font Webdings:size=%0.1f}${color %s}n${font}  " % (CONKY_FONT_SIZE * 0.85, COLORS[level])
+        top = max(mean for mean in means if mean is not None) or 1
+        spark = "".join(" " if mean is None else SPARKS[min(int(mean / top * len(SPARKS)), len(SPARKS) - 1)]
+                        for mean in means)
+        lines.append(voffset + icon + font + color + alignc + inst + "${alignr}" + spark +
+                     " " + format_lag(greatest) + "${font}\n")
+
+    return "".join(lines)
+
+def merge(statuses):
+    """Merges the status of several servers, given as a list of (name,
+    instruments) pairs, into one. For each instrument the status of the
+    server furthest behind is kept, and if that is more than
+    NODE_LAG_THRESHOLD behind the most up to date server, or at a worse
+    level, its name is added to the status as "node"."""
+    merged = {}
+    for name, instruments in statuses:
+        for inst, status in instruments.items():
+            merged.setdefault(inst, []).append((name, status))
+
+    result = {}
+    for inst, nodes in merged.items():
+        name, worst = max(nodes, key=lambda node: (node[1]['secondsBehind'], node[1]['level']))
+        best = min(nodes, key=lambda node: (node[1]['secondsBehind'], node[1]['level']))[1]
+        status = dict(worst)
+        if (worst['secondsBehind'] - best['secondsBehind'] > NODE_LAG_THRESHOLD or
+                worst['level'] > best['level']):
+            status['node'] = name
+        result[inst] = status
+    return result
+
+def render_unreachable(names):
+    """Returns the conky snippet listing servers that could not be queried"""
+    voffset = "${voffset %d}" % CONKY_VOFFSET
+    font = "${font %s:size=%0.1f}" % (CONKY_FONT, CONKY_FONT_SIZE)
+    alignc = "${alignc %d}" % CONKY_ALIGNC
+    icon = "${offset 3}${font Webdings:size=%0.1f}${color %s}n${font}  " % (CONKY_FONT_SIZE * 0.85, COLORS[4])
+
+    return "".join(voffset + icon + font + "${color%d}" % CONKY_COLOR_NUM + alignc + name +
+                   "${alignr}unreachable${font}\n" for name in names)
+
+def render_no_history():
+    """Returns the conky snippet shown by --sparklines when the history has
+    nothing to show"""
+    voffset = "${voffset %d}" % CONKY_VOFFSET
+    font = "${font %s:size=%0.1f}" % (CONKY_FONT, CONKY_FONT_SIZE)
+    alignc = "${alignc %d}" % CONKY_ALIGNC
+
+    return (voffset + font + "${color%d}" % CONKY_COLOR_NUM + alignc + "Status history" +
+            "${alignr}no data yet${font}\n")
+
+class StatusPoller(object):
+    """Queries the getStatus of one server over a single keep-alive
+    connection, which is reopened when the server closes it. Each query is
+    conditional on the ETag and Last-Modified of the last response, so an
+    unchanged status is answered with a 304 and no body. Redirects are
+    followed, up to MAX_REDIRECTS of them, and permanent ones (301 and 308)
+    are kept for later queries."""
+
+    def __init__(self, url, timeout=10, name=None):
+        self.name = name or urlsplit(url).hostname
+        self.url = url
+        self.timeout = timeout
+        self._origin = None
+        self._reader = None
+        self._writer = None
+        self._etag = None
+        self._last_modified = None
+        self.instruments = None
+
+    async def poll(self):
+        """Queries the status, and returns True if it has changed since the
+        last call. The status is then in self.instruments. Raises
+        asyncio.TimeoutError if the server takes longer than the timeout."""
+        try:
+            return await asyncio.wait_for(self._poll(), self.timeout)
+        except BaseException:
+            # Whatever was left unread makes the connection unusable
+            self.close()
+            raise
+
+    async def _poll(self):
+        url = self.url
+        for hop in range(MAX_REDIRECTS + 1):
+            status, reason, response, body = await self._get(url)
+            if status not in REDIRECTS or "location" not in response:
+                break
+            url = urljoin(url, response["location"])
+            if status in (301, 308):
+                self.url = url
         else:
-            time = "%0.1f days" % (status['secondsBehind'] / (24 * 60 * 60.))
+            raise http.client.HTTPException("%s: more than %d redirects" % (self.url, MAX_REDIRECTS))
 
-        # Print snippet
-        print (voffset + icon + font + color + alignc + inst + "${alignr}" + time  + "${font}")
+        if status == 304:
+            return False
+        if status != 200:
+            raise http.client.HTTPException("%s %d %s" % (url, status, reason))
 
-if __name__ == '__main__':
-    main()
+        self._etag = response.get("etag")
+        self._last_modified = response.get("last-modified")
+        instruments = json.loads(body)
+        changed = instruments != self.instruments
+        self.instruments = instruments
+        return changed
+
+    async def _get(self, url):
+        """Sends a conditional GET for url, on the open connection if it is
+        to the same server, and returns the response as _request() does"""
+        parts = urlsplit(url)
+        ssl = parts.scheme == "https"
+        origin = (parts.hostname, parts.port or (443 if ssl else 80), ssl)
+        if origin != self._origin:
+            self.close()
+            self._origin = origin
 
+        headers = ["Host: %s" % parts.netloc, "Accept: application/json"]
+        if self._etag:
+            headers.append("If-None-Match: %s" % self._etag)
+        if self._last_modified:
+            headers.append("If-Modified-Since: %s" % self._last_modified)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        request = ("GET %s HTTP/1.1\r\n%s\r\n\r\n" % (path, "\r\n".join(headers))).encode("latin-1")
+
+        if self._writer is None:
+            return await self._request(request)
+        try:
+            return await self._request(request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The server closed the connection while it was idle
+            self.close()
+            return await self._request(request)
+
+    async def _request(self, request):
+        """Sends a request to self._origin and returns the status, reason,
+        headers (with lower case names) and body of the response"""
+        host, port, ssl = self._origin
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                host, port, ssl=True if ssl else None)
+        self._writer.write(request)
+        await self._writer.drain()
+
+        reader = self._reader
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("connection closed by %s" % host)
+        version, status, reason = (line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+            if not line:
+                break
+            name, sep, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status == 304 or status == 204 or 100 <= status < 200:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if not size:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            # Trailers, up to an empty line
+            while (await reader.readline()).strip():
+                pass
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection", "").lower() == "close" or version == "HTTP/1.0":
+            self.close()
+        return status, reason, headers, body
+
+    def close(self):
+        """Closes the connection; the next poll opens a new one"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+async def poll_all(pollers, history=None):
+    """Queries every server concurrently, and returns the conky snippet for
+    their merged status, or None if none of them could be queried. Errors
+    are reported on stderr. The merged status is recorded in history, if
+    given."""
+    results = await asyncio.gather(*[poller.poll() for poller in pollers], return_exceptions=True)
+
+    statuses = []
+    unreachable = []
+    for poller, result in zip(pollers, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, asyncio.TimeoutError):
+                result = "no response in %g seconds" % poller.timeout
+            print("%s: %s" % (poller.name, result), file=sys.stderr)
+            unreachable.append(poller.name)
+        else:
+            statuses.append((poller.name, poller.instruments))
+
+    if not statuses:
+        return None
+    instruments = merge(statuses)
+    if history is not None:
+        history.append(time.time(), instruments)
+    return render(instruments) + render_unreachable(unreachable)
+
+async def poll_once(pollers, history=None):
+    """Queries every server once, and returns the conky snippet"""
+    try:
+        return await poll_all(pollers, history)
+    finally:
+        for poller in pollers:
+            poller.close()
+        if history is not None:
+            history.close()
+
+async def run_daemon(pollers, output, interval, history=None):
+    """Polls the servers every interval seconds, and writes the snippet to
+    output whenever it changes. If no server can be reached, the last
+    snippet is left in place."""
+    loop = asyncio.get_running_loop()
+    snippet = None
+
+    try:
+        while True:
+            start = loop.time()
+            text = await poll_all(pollers, history)
+            if text is not None and text != snippet:
+                write_snippet(output, text)
+                snippet = text
+            await asyncio.sleep(max(0, interval - (loop.time() - start)))
+    finally:
+        for poller in pollers:
+            poller.close()
+        if history is not None:
+            history.close()
+
+def write_snippet(path, text):
+    """Writes a file through a temporary file, so conky never reads a
+    partial one"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,243 @@
+#-*- coding:utf-8 -*-
+"""Helioviewer.org Status History
+
+Keeps the status polled by helioviewer_status.py, so that trends in how far
+behind the data for each instrument is can be looked at later.
+
+A history is a set of files next to each other, all append-only:
+
+  status.hist        one record per poll and instrument: the time of the
+                     poll, the instrument, its secondsBehind and its level
+  status.hist.names  the instrument names, one per line; records refer to
+                     them by line number
+  status.hist.1m     rollups of the records: for each instrument and each
+  status.hist.1h     minute, hour or day, the number of polls, the least,
+  status.hist.1d     greatest and total secondsBehind, and the worst level
+
+Records are fixed-width binary structs after a short header, 11 bytes for
+a poll and 27 for a rollup, so a year of 5 second polls of 20 instruments
+takes about 1.4 GB, and the rollups a fraction of that. Records are in time
+order, so reads memory-map a file and find where a time range starts by
+binary search; how long a query takes depends on the range asked for, not
+on how long the history is. Each rollup is built from the one below it as
+buckets are completed, and the incomplete buckets are recomputed from the
+file below when a history is opened for writing, so nothing is lost when
+the poller is stopped or crashes.
+"""
+import os
+import mmap
+import struct
+
+MAGIC = b"HVLAG"
+VERSION = 1
+
+# Magic, version, and the size of the records that follow
+HEADER = struct.Struct("<5sBH")
+# Time of the poll, secondsBehind, instrument, level
+RECORD = struct.Struct("<IIHB")
+# Start of the bucket, instrument, number of polls, least, greatest and total
+# secondsBehind, worst level
+ROLLUP = struct.Struct("<IHIIIQB")
+
+# Name and length in seconds of each rollup, each built from the one before
+RESOLUTIONS = (("1m", 60), ("1h", 60 * 60), ("1d", 24 * 60 * 60))
+
+MAX_SECONDS = 2 ** 32 - 1
+
+class HistoryError(Exception):
+    pass
+
+class _Table(object):
+    """A file of fixed-width records in the order of their first field,
+    after a header"""
+
+    def __init__(self, path, record, writable=False):
+        self.path = path
+        self.record = record
+        self.writable = writable
+
+        if writable:
+            self._file = open(path, "a+b")
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._file.write(HEADER.pack(MAGIC, VERSION, record.size))
+                self._file.flush()
+        else:
+            self._file = open(path, "rb")
+
+        self._file.seek(0)
+        magic, version, size = HEADER.unpack(self._file.read(HEADER.size).ljust(HEADER.size, b"\0"))
+        if magic != MAGIC or version != VERSION or size != record.size:
+            raise HistoryError("%s is not a version %d status history file" % (path, VERSION))
+
+        # A record left incomplete by a crash is dropped
+        extra = (os.fstat(self._file.fileno()).st_size - HEADER.size) % record.size
+        if extra and writable:
+            self._file.truncate(os.fstat(self._file.fileno()).st_size - extra)
+
+    def __len__(self):
+        return (os.fstat(self._file.fileno()).st_size - HEADER.size) // self.record.size
+
+    def read(self, start=None, end=None):
+        """Returns the records whose first field is in [start, end), as
+        tuples"""
+        count = len(self)
+        if not count:
+            return []
+        with mmap.mmap(self._file.fileno(), HEADER.size + count * self.record.size,
+                       access=mmap.ACCESS_READ) as data:
+            first = 0 if start is None else self._bisect(data, count, start)
+            last = count if end is None else self._bisect(data, count, end)
+            if first >= last:
+                return []
+            size = self.record.size
+            return list(self.record.iter_unpack(data[HEADER.size + first * size:HEADER.size + last * size]))
+
+    def last(self):
+        """Returns the last record, or None if there is none"""
+        count = len(self)
+        if not count:
+            return None
+        self._file.seek(HEADER.size + (count - 1) * self.record.size)
+        return self.record.unpack(self._file.read(self.record.size))
+
+    def _bisect(self, data, count, value):
+        """Returns the index of the first record whose first field is at
+        least value"""
+        size = self.record.size
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<I", data, HEADER.size + middle * size)[0] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def append(self, records):
+        """Appends records, given as tuples"""
+        if records:
+            self._file.write(b"".join(self.record.pack(*record) for record in records))
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class LagHistory(object):
+    """The status history kept in the files starting with path; see the
+    module documentation. Opening it for writing creates it if needed."""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self.names = []
+        if os.path.exists(path + ".names"):
+            with open(path + ".names", encoding="utf-8") as f:
+                self.names = f.read().splitlines()
+        self._ids = dict((name, i) for i, name in enumerate(self.names))
+
+        self._polls = _Table(path, RECORD, writable)
+        self._rollups = [(name, seconds, _Table("%s.%s" % (path, name), ROLLUP, writable))
+                         for name, seconds in RESOLUTIONS]
+        self._last = 0
+        if writable:
+            self._names = open(path + ".names", "a", encoding="utf-8")
+            self._buckets = [None] * len(RESOLUTIONS)
+            self._open = [{} for resolution in RESOLUTIONS]
+            self._recover()
+
+    def append(self, timestamp, instruments):
+        """Records a poll made at a time, in seconds since the epoch, whose
+        result was instruments, as returned by getStatus"""
+        # Records have to stay in time order, even if the clock goes back
+        timestamp = max(int(timestamp), self._last)
+        self._last = timestamp
+
+        records = [(timestamp, min(max(int(status['secondsBehind']), 0), MAX_SECONDS),
+                    self._id(name), status['level'])
+                   for name, status in sorted(instruments.items())]
+        self._polls.append(records)
+        self._add(0, [(t, instrument, 1, seconds, seconds, seconds, level)
+                      for t, seconds, instrument, level in records])
+
+    def polls(self, start=None, end=None):
+        """Returns the polls made in [start, end), as (time, instrument,
+        secondsBehind, level) tuples"""
+        return [(t, self.names[instrument], seconds, level)
+                for t, seconds, instrument, level in self._polls.read(start, end)]
+
+    def rollup(self, resolution, start=None, end=None):
+        """Returns the rollups at a resolution, one of "1m", "1h" and "1d",
+        of the buckets starting in [start, end), as (start, instrument,
+        polls, least, mean, greatest, level) tuples. Buckets still being
+        filled are left out."""
+        for name, seconds, table in self._rollups:
+            if name == resolution:
+                return [(bucket, self.names[instrument], count, least, total / count, greatest, level)
+                        for bucket, instrument, count, least, greatest, total, level
+                        in table.read(start, end)]
+        raise ValueError("unknown resolution %r" % resolution)
+
+    def close(self):
+        self._polls.close()
+        for name, seconds, table in self._rollups:
+            table.close()
+        if self.writable:
+            self._names.close()
+
+    def _id(self, name):
+        """Returns the number of an instrument, adding it to the names
+        file if it is new"""
+        if name not in self._ids:
+            self._ids[name] = len(self.names)
+            self.names.append(name)
+            self._names.write(name.replace("\n", " ") + "\n")
+            self._names.flush()
+        return self._ids[name]
+
+    def _add(self, level, rows):
+        """Adds rows, as (time, instrument, polls, least, greatest, total,
+        level) tuples in time order, to the open buckets of a rollup. A
+        bucket is written out, and added to the next rollup, once a row for
+        a later bucket comes."""
+        name, seconds, table = self._rollups[level]
+        accumulators = self._open[level]
+        for t, instrument, count, least, greatest, total, worst in rows:
+            bucket = t - t % seconds
+            if self._buckets[level] is not None and bucket > self._buckets[level]:
+                done = [(self._buckets[level], i) + tuple(accumulators[i]) for i in sorted(accumulators)]
+                table.append(done)
+                if level + 1 < len(self._rollups):
+                    self._add(level + 1, done)
+                accumulators.clear()
+            if self._buckets[level] is None or bucket > self._buckets[level]:
+                self._buckets[level] = bucket
+
+            accumulator = accumulators.get(instrument)
+            if accumulator is None:
+                accumulators[instrument] = [count, least, greatest, total, worst]
+            else:
+                accumulator[0] += count
+                accumulator[1] = min(accumulator[1], least)
+                accumulator[2] = max(accumulator[2], greatest)
+                accumulator[3] += total
+                accumulator[4] = max(accumulator[4], worst)
+
+    def _recover(self):
+        """Refills the open buckets of each rollup from the file below it,
+        from the end of its last complete bucket on, starting from the
+        coarsest, so that buckets completed on the way are added to rollups
+        that have already been refilled"""
+        last = self._polls.last()
+        if last is not None:
+            self._last = last[0]
+
+        for level in reversed(range(len(self._rollups))):
+            name, seconds, table = self._rollups[level]
+            done = table.last()
+            start = done[0] + seconds if done else None
+            if level == 0:
+                rows = [(t, instrument, 1, seconds_behind, seconds_behind, seconds_behind, worst)
+                        for t, seconds_behind, instrument, worst in self._polls.read(start)]
+            else:
+                rows = self._rollups[level - 1][2].read(start)
+            self._add(level, rows)
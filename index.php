@@ -73,8 +73,23 @@
         	}
 	}
 
+	// Content-hashed names of the built bundles, which can be cached for
+	// good. Written by the build, see resources/build/bundles.json.
+	$assets = array();
+	if (is_file('resources/compressed/assets.json')) {
+		$assets = json_decode(file_get_contents('resources/compressed/assets.json'), true);
+	}
+
+	function asset($file) {
+		global $assets;
+		if (isset($assets[$file])) {
+			return '/' . $assets[$file];
+		}
+		return '/' . $file . '?v=' . filemtime($file);
+	}
+
 	function attr($attr, $file) {
-		return $attr . '="/' . $file . '?v=' . filemtime($file) . '"';
+		return $attr . '="' . asset($file) . '"';
 	}
 
 ?><!DOCTYPE html>
@@ -142,7 +157,7 @@
 	<?php
 	} else {
 	?>
-		<link rel="stylesheet" href="/resources/compressed/helioviewer.min.css?v=<?=filemtime('resources/compressed/helioviewer.min.css')?>" />
+		<link rel="stylesheet" <?=attr('href', 'resources/compressed/helioviewer.min.css');?> />
 	<?php
 	}
 	?>
@@ -1988,7 +2003,13 @@ if($is_mobile_view) {
 	} else {
 	?>
 	<!-- Helioviewer JavaScript -->
-		<script src="/resources/compressed/helioviewer.min.js?v=<?=filemtime('resources/compressed/helioviewer.min.js')?>" type="text/javascript"></script>
+		<script type="text/javascript">
+			// Parts of the client loaded on demand by loadChunk(), see resources/build/bundles.json
+			var chunkURLs = {
+				"timeline": "<?=asset('resources/compressed/helioviewer-timeline.min.js');?>"
+			};
+		</script>
+		<script <?=attr('src', 'resources/compressed/helioviewer.min.js');?> type="text/javascript"></script>
 	<?php
 	}
 	?>
@@ -0,0 +1,416 @@
+#!/usr/bin/python3
+"""
+jsmin benchmark and regression suite
+
+Runs each minifier engine over every file in resources/js and over the
+concatenated web client bundle, assembled from the file list in
+resources/build/bundles.json. For each input it reports the best wall time
+of several runs, the throughput and the output size ratio, then the totals
+and the peak RSS of the process.
+
+Every output is checked against golden.json, which holds the SHA-256 and
+size of what the current JavascriptMinify produces for each input, or the
+error it raises: some files in resources/js, such as JSX, are only
+minifiable in the context of a bundle or not at all. Any engine that is
+meant to replace it has to match byte for byte, and fail where it fails.
+After a deliberate change to the output, regenerate the goldens with
+--update-golden.
+
+It also measures the cost of generating a source map along with the output:
+SourceMapMinify and the encoding of its mappings, against JavascriptMinify
+alone, as the median over at least 15 pairs of runs, in CPU time. The
+benchmark fails if that overhead is above --max-map-overhead.
+
+When node is on the PATH, each program in MANGLE_CASES is also run before
+and after mangle.mangle(), and has to print the same: these are the cases
+of scoping that renaming has got wrong before.
+
+Results can be written as JSON with --json, and a previous result given with
+--baseline, to see what a commit did to performance.
+
+The engines are the original character-at-a-time implementation in
+reference.py and the block-buffered one in jsmin.py. Others can be given as
+module:Class, importable from this directory.
+
+Example usage:
+
+  ./benchmark.py
+  ./benchmark.py --engine jsmin --repeat 10 --json results.json
+  ./benchmark.py --engine jsmin --engine myjsmin:FastMinify --baseline results.json
+  ./benchmark.py --update-golden
+"""
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import argparse
+import platform
+import resource
+import importlib
+import statistics
+import shutil
+import subprocess
+from io import StringIO
+
+import jsmin
+import mangle
+import reference
+import sourcemap
+
+BUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(os.path.dirname(BUILD_DIR))
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.json')
+
+ENGINES = {
+    'reference': reference.JavascriptMinify,
+    'jsmin': jsmin.JavascriptMinify,
+}
+
+BUNDLE = 'bundle:web'
+
+# Minimum number of runs the source map overhead is measured over
+MAP_OVERHEAD_RUNS = 15
+
+# Programs, as jsmin outputs them, that have to print the same once mangled
+MANGLE_CASES = [
+    # A default parameter refers to the enclosing a, not to the var of the body
+    'function f(){var a=1;function g(b=a){var a=2;return b}return g()}console.log(f())',
+    'function f(){var a=1;function g({x=a}){let a=2;return x}return g({})}console.log(f())',
+    'function f(){var a=1;return function h(b=a,c=h){var a=2;return[b,typeof c]}()}console.log(f())',
+    # A var of the body that is also a parameter starts with its value
+    'function f(){function g(a=1){var a;return a}return g()}console.log(f())',
+]
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description='Benchmark the JavaScript minifier and check its output.')
+    parser.add_argument('files', nargs='*', help='JavaScript files to use instead of resources/js')
+    parser.add_argument('--engine', action='append', dest='engines',
+                        help='engine to run: %s or module:Class (default: all built-in)' % ', '.join(ENGINES))
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per input')
+    parser.add_argument('--max-map-overhead', type=float, default=20,
+                        help='maximum source map overhead, in percent of the minify time (default: 20)')
+    parser.add_argument('--json', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='write the output of jsmin.JavascriptMinify to golden.json and exit')
+    parser.add_argument('-v', '--verbose', action='store_true', help='report every file, not just the totals')
+    args = parser.parse_args()
+
+    files = args.files or jsTreeFiles()
+    inputs = [(relative(path), read(path)) for path in files]
+    inputs.append((BUNDLE, concat(webBundleFiles())))
+
+    if args.update_golden:
+        updateGolden(inputs)
+        return 0
+
+    golden = loadGolden()
+    engines = [(name, loadEngine(name)) for name in args.engines or ENGINES]
+    results = {
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'engines': {},
+    }
+    failed = False
+
+    for name, engine in engines:
+        print('%s:' % name)
+        result = runEngine(engine, inputs, args.repeat, args.verbose)
+        mismatches = checkGolden(result['outputs'], golden)
+        del result['outputs']
+        result['goldenMismatches'] = mismatches
+        results['engines'][name] = result
+
+        total = result['total']
+        print('  %-50s %8.3f s %8.2f MB/s %6.1f%%' % ('all files', total['seconds'], total['mbps'], total['ratio'] * 100))
+        bundle = result['bundle']
+        if bundle:
+            print('  %-50s %8.3f s %8.2f MB/s %6.1f%%' % (BUNDLE, bundle['seconds'], bundle['mbps'], bundle['ratio'] * 100))
+        if result['errors']:
+            print('  %d inputs raised an error' % len(result['errors']))
+
+        if mismatches:
+            failed = True
+            print('  FAIL: output differs from golden.json for %d inputs:' % len(mismatches))
+            for key in mismatches:
+                print('    %s' % key)
+        else:
+            print('  OK: output matches golden.json')
+
+    mangleFailures = checkMangle()
+    results['mangleFailures'] = mangleFailures
+    if mangleFailures is None:
+        print('mangle checks skipped: node is not on the PATH')
+    elif mangleFailures:
+        failed = True
+        print('FAIL: mangle() changes what %d programs print:' % len(mangleFailures))
+        for source in mangleFailures:
+            print('    %s' % source)
+    else:
+        print('OK: mangle() keeps what %d programs print' % len(MANGLE_CASES))
+
+    overhead = mapOverhead(inputs[-1][1], args.repeat)
+    results['mapOverhead'] = overhead
+    if overhead > args.max_map_overhead:
+        failed = True
+        print('FAIL: source map overhead is %.1f%%, above %g%%' % (overhead, args.max_map_overhead))
+    else:
+        print('OK: source map overhead is %.1f%%' % overhead)
+
+    # ru_maxrss is in kilobytes on Linux
+    results['peakRssKb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('Peak RSS: %.1f MB' % (results['peakRssKb'] / 1024))
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 1 if failed else 0
+
+def runEngine(engine, inputs, repeat, verbose):
+    """Times an engine on each input and returns its results, along with the
+    outputs keyed like golden.json"""
+    files = {}
+    outputs = {}
+    seconds = 0
+    size = 0
+    outSize = 0
+    bundle = None
+    errors = []
+
+    for key, source in inputs:
+        try:
+            best, output = timeit(engine, source, repeat)
+        except Exception as e:
+            # Recorded for the golden check, and left out of the timings
+            outputs[key] = e
+            errors.append(key)
+            if verbose:
+                print('  %-50s %s' % (key, type(e).__name__))
+            continue
+
+        outputs[key] = output
+        stats = measure(source, output, best)
+
+        if key == BUNDLE:
+            bundle = stats
+            continue
+
+        files[key] = stats
+        seconds += best
+        size += stats['bytes']
+        outSize += stats['outputBytes']
+
+        if verbose:
+            print('  %-50s %8.4f s %8.2f MB/s %6.1f%%' % (key, best, stats['mbps'], stats['ratio'] * 100))
+
+    return {
+        'files': files,
+        'errors': errors,
+        'bundle': bundle,
+        'total': {
+            'bytes': size,
+            'outputBytes': outSize,
+            'seconds': seconds,
+            'mbps': size / seconds / 1e6,
+            'ratio': outSize / size,
+        },
+        'outputs': outputs,
+    }
+
+def measure(source, output, seconds):
+    """Returns the statistics of one minified input"""
+    size = len(source.encode('utf-8'))
+    outSize = len(output.encode('utf-8'))
+    return {
+        'bytes': size,
+        'outputBytes': outSize,
+        'seconds': seconds,
+        'mbps': size / seconds / 1e6,
+        'ratio': outSize / size if size else 1,
+    }
+
+def mapOverhead(source, repeat):
+    """Returns the cost of generating a source map, in percent of the minify
+    time, after checking that it leaves the output unchanged"""
+    # Each run with a source map is timed right after one without, in CPU
+    # time, and the median of the ratios taken, so a run slowed down by the
+    # rest of the machine counts for little.
+    ratios = []
+    for i in range(max(repeat, MAP_OVERHEAD_RUNS)):
+        plain, output = timeit(jsmin.JavascriptMinify, source, 1, time.process_time)
+        elapsed, mapped = timeit(minifyWithMap, source, 1, time.process_time)
+        ratios.append(elapsed / plain)
+
+    if mapped != output:
+        raise AssertionError('output differs when generating a source map')
+
+    return (statistics.median(ratios) - 1) * 100
+
+def minifyWithMap(source):
+    """Minifies a string and encodes the source map for it"""
+    minifier = jsmin.SourceMapMinify()
+    outstream = StringIO()
+    minifier.minify(StringIO(source), outstream)
+    output = outstream.getvalue()
+    sourcemap.encode(minifier.mappings(), output)
+    return output
+
+def timeit(engine, source, repeat, clock=time.perf_counter):
+    """Returns the best time of several runs and the minified output. The
+    engine is either a minifier class or a function of the source. Runs are
+    timed by clock, by default in wall time."""
+    best = None
+
+    for i in range(repeat):
+        start = clock()
+        if isinstance(engine, type):
+            outstream = StringIO()
+            engine().minify(StringIO(source), outstream)
+            output = outstream.getvalue()
+        else:
+            output = engine(source)
+        elapsed = clock() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, output
+
+def loadEngine(name):
+    """Returns the minifier class for an engine name or module:Class"""
+    if name in ENGINES:
+        return ENGINES[name]
+
+    module, sep, cls = name.partition(':')
+    if not sep:
+        raise SystemExit('Unknown engine: %s' % name)
+
+    return getattr(importlib.import_module(module), cls)
+
+def loadGolden():
+    """Returns the golden digests, keyed by input"""
+    with open(GOLDEN) as f:
+        return json.load(f)
+
+def updateGolden(inputs):
+    """Writes the digests of the output of the current JavascriptMinify"""
+    golden = {}
+
+    for key, source in inputs:
+        try:
+            output = timeit(jsmin.JavascriptMinify, source, 1)[1]
+        except Exception as e:
+            output = e
+        golden[key] = digest(output)
+
+    with open(GOLDEN, 'w') as f:
+        json.dump(golden, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    print('Wrote %d golden outputs to %s' % (len(golden), GOLDEN))
+
+def checkGolden(outputs, golden):
+    """Returns the inputs whose output does not match its golden digest.
+    Inputs without one are not checked."""
+    return sorted(key for key, output in outputs.items()
+                  if key in golden and digest(output) != golden[key])
+
+def checkMangle():
+    """Returns the programs of MANGLE_CASES that print something else, or
+    fail, once mangled, or None if node is not on the PATH"""
+    node = shutil.which('node')
+    if not node:
+        return None
+
+    def run(source):
+        result = subprocess.run([node, '-e', source], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True)
+        return result.returncode, result.stdout
+
+    return [source for source in MANGLE_CASES
+            if run(mangle.mangle(source)[0]) != run(source)]
+
+def digest(output):
+    """Returns what golden.json records for an output, or for the exception
+    raised instead"""
+    if isinstance(output, Exception):
+        return {'error': type(output).__name__}
+
+    data = output.encode('utf-8')
+    return {'sha256': hashlib.sha256(data).hexdigest(), 'bytes': len(data)}
+
+def compare(results, path):
+    """Prints the change in total time of each engine since a baseline"""
+    with open(path) as f:
+        baseline = json.load(f)
+
+    print('Compared to %s (%s):' % (path, baseline.get('commit') or 'unknown commit'))
+
+    for name, result in results['engines'].items():
+        if name not in baseline['engines']:
+            continue
+        for part in ('total', 'bundle'):
+            if not result[part] or not baseline['engines'][name][part]:
+                continue
+            before = baseline['engines'][name][part]['seconds']
+            after = result[part]['seconds']
+            print('  %-10s %-7s %8.3f s -> %8.3f s %+6.1f%%' % (name, part, before, after, (after / before - 1) * 100))
+
+def gitCommit():
+    """Returns the commit the tree is at, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def jsTreeFiles():
+    """Returns every JavaScript file in resources/js"""
+    pattern = os.path.join(ROOT_DIR, 'resources', 'js', '**', '*.js*')
+    return sorted(path for path in glob.glob(pattern, recursive=True)
+                  if path.endswith(('.js', '.jsx')))
+
+def relative(path):
+    """Returns a path relative to the root of the repository"""
+    return os.path.relpath(os.path.abspath(path), ROOT_DIR).replace(os.sep, '/')
+
+def webBundleFiles():
+    """Returns the JavaScript files in the "web" bundle of bundles.json"""
+    manifest = os.path.join(BUILD_DIR, 'bundles.json')
+
+    with open(manifest) as f:
+        spec = json.load(f)
+
+    root = os.path.join(BUILD_DIR, spec['root'])
+
+    for bundle in spec['bundles']:
+        if bundle['name'] == 'web':
+            return [os.path.join(root, name) for name in bundle['files']]
+
+def read(path):
+    """Reads a file the way concat() does"""
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def concat(files):
+    """Concatenates files the way Ant's <concat fixlastline="true"> does"""
+    parts = []
+
+    for path in files:
+        text = read(path)
+        if not text.endswith('\n'):
+            text += '\n'
+        parts.append(text)
+
+    return ''.join(parts)
+
+if __name__ == '__main__':
+    sys.exit(main())
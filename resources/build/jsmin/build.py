@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+"""
+Asset build
+
+Builds everything bundles.json describes in one process, phase after phase:
+
+  js           the JavaScript bundles and their chunks, see jsmin.buildBundles()
+  css          the stylesheets, see cssmin.buildStylesheets()
+  precompress  the .gz and .br copies of what was built, see precompress.py
+
+Each phase streams its sources through the minifier into the final output,
+header first, with no intermediate file, and the phases share one
+interpreter, so none of them pays for starting Python or for reading what
+another one wrote. The wall and CPU time of each phase, its worker
+processes included, are reported on stderr; a phase whose CPU time is far
+below its wall time is waiting on something other than the minifier.
+--timings writes them as JSON as well.
+
+--profile and --trace turn on the instrumentation of instrument.py: the
+time, CPU time and bytes in and out of every file minified, stylesheet
+built and output written, call counts and, with --sample, samples of the
+minifier's call stack, written as JSON and in the Chrome trace event format
+respectively. The slowest files and the most sampled functions are reported
+on stderr.
+
+Example usage:
+
+  ./build.py --manifest ../bundles.json
+  ./build.py --manifest ../bundles.json --cache-dir ../../compressed/.cache/jsmin
+  ./build.py --manifest ../bundles.json --phase js --phase css --timings timings.json
+  ./build.py --manifest ../bundles.json --jobs 1 --sample 1 --profile profile.json --trace trace.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from collections import OrderedDict
+
+import instrument
+from cssmin import buildStylesheets
+from depgraph import SplitError
+from jsmin import VERSION, buildBundles
+from minifycache import MinifyCache
+from precompress import PATTERNS, precompress
+
+PHASES = ('js', 'css', 'precompress')
+
+def build(manifest, phases=PHASES, jobs=None, cache=None):
+    """run the phases of the build of a manifest, in order, and return the
+       timings of each, as an OrderedDict by phase of dicts with the wall
+       and CPU seconds, and the CPU time as a percentage of the wall time.
+    """
+    timings = OrderedDict()
+    for phase in PHASES:
+        if phase not in phases:
+            continue
+        wall, cpu = time.perf_counter(), _cpuTime()
+        with instrument.span(phase):
+            if phase == 'js':
+                buildBundles(manifest, jobs, cache)
+            elif phase == 'css':
+                buildStylesheets(manifest, jobs)
+            else:
+                precompress(builtFiles(manifest), jobs)
+        wall, cpu = time.perf_counter() - wall, _cpuTime() - cpu
+        timings[phase] = {'wall': wall, 'cpu': cpu,
+                          'cpuPercent': cpu * 100.0 / wall if wall else 0.0}
+    return timings
+
+def builtFiles(manifest):
+    """return the minified files in the directories the outputs of a
+       manifest are written to, as precompress.py finds them."""
+    with open(manifest, encoding='utf-8') as f:
+        spec = json.load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(manifest)),
+                        spec.get('root', '.'))
+
+    outputs = []
+    for bundle in spec.get('bundles', []):
+        outputs.append(bundle['output'])
+        outputs.extend(chunk['output'] for chunk in bundle.get('chunks', {}).values())
+    outputs.extend(entry['output'] for entry in spec.get('stylesheets', []))
+
+    directories = sorted(set(os.path.normpath(os.path.dirname(os.path.join(root, output)))
+                             for output in outputs))
+    return sorted(set(path for directory in directories for pattern in PATTERNS
+                      for path in glob.glob(os.path.join(glob.escape(directory), pattern))))
+
+def reportTimings(timings):
+    """print the timings returned by build() and their total to stderr."""
+    for phase, timing in timings.items():
+        print('%-12s %8.3fs wall %8.3fs cpu %5.0f%%' % (
+                  phase, timing['wall'], timing['cpu'], timing['cpuPercent']),
+              file=sys.stderr)
+    wall = sum(timing['wall'] for timing in timings.values())
+    cpu = sum(timing['cpu'] for timing in timings.values())
+    print('%-12s %8.3fs wall %8.3fs cpu %5.0f%%' % (
+              'total', wall, cpu, cpu * 100.0 / wall if wall else 0.0),
+          file=sys.stderr)
+
+def _cpuTime():
+    """return the CPU time used by this process and by the worker processes
+       it has waited for."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the JavaScript bundles, stylesheets and '
+                    'precompressed copies of a manifest in one process, and '
+                    'report how long each phase took.')
+    parser.add_argument('-m', '--manifest', required=True,
+                        help='JSON manifest describing the assets to build')
+    parser.add_argument('-p', '--phase', action='append', choices=PHASES,
+                        dest='phases',
+                        help='phase to run; may be given more than once '
+                             '(default: all, in the order %s)' % ', '.join(PHASES))
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--cache-dir',
+                        help='directory in which to cache the minified output '
+                             'of each JavaScript file')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='maximum size of the cache in MB (default: 64)')
+    parser.add_argument('--timings', help='file to write the timings to, as JSON')
+    parser.add_argument('--profile',
+                        help='file to write the time of every file and output '
+                             'to, as JSON')
+    parser.add_argument('--trace',
+                        help='file to write the time of every file and output '
+                             'to, in the Chrome trace event format')
+    parser.add_argument('--sample', type=float, nargs='?', const=instrument.DEFAULT_INTERVAL * 1e3,
+                        metavar='MS',
+                        help='with --profile or --trace, also sample the call '
+                             'stack of the minifiers every MS milliseconds of '
+                             'CPU time (default: %g)' % (instrument.DEFAULT_INTERVAL * 1e3))
+    args = parser.parse_args()
+
+    if args.sample and not (args.profile or args.trace):
+        parser.error('--sample requires --profile or --trace')
+    if args.profile or args.trace:
+        instrument.enable(args.sample and args.sample / 1e3)
+
+    cache = None
+    if args.cache_dir:
+        cache = MinifyCache(args.cache_dir, VERSION, args.cache_size * 1024 * 1024)
+
+    try:
+        timings = build(args.manifest, args.phases or PHASES, args.jobs, cache)
+    except SplitError as e:
+        sys.exit(str(e))
+
+    reportTimings(timings)
+    if instrument.enabled():
+        recorder = instrument.disable()
+        instrument.report(recorder)
+        if args.profile:
+            instrument.writeJSON(args.profile, recorder)
+        if args.trace:
+            instrument.writeTrace(args.trace, recorder)
+    if args.timings:
+        with open(args.timings, 'w', encoding='utf-8') as f:
+            json.dump(timings, f, indent=4)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""
+cssmin benchmark against the YUI Compressor
+
+Minifies each stylesheet of resources/build/bundles.json, concatenated the
+way buildStylesheets() concatenates it, with cssmin in this process, with
+cssmin.py in a new process, and with the YUI Compressor jar the build used
+to run, which has to start a JVM for each stylesheet. For each it reports
+the best wall time of several runs, the output size and the gzipped output
+size.
+
+The whole CSS step is timed too: the stylesheets minified in parallel
+worker processes, as cssmin.py --manifest does, against the jar run once
+per stylesheet, one after the other, as build.xml did.
+
+The jar is skipped if java is not on the PATH.
+
+Example usage:
+
+  ./cssbenchmark.py
+  ./cssbenchmark.py --repeat 10 --json results.json
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import cssmin
+from jsmin import concatFiles
+
+BUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(os.path.dirname(BUILD_DIR))
+MANIFEST = os.path.join(BUILD_DIR, 'bundles.json')
+JAR = os.path.join(BUILD_DIR, 'yuicompressor', 'yuicompressor-2.4.2.jar')
+CSSMIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cssmin.py')
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description='Benchmark cssmin against the YUI Compressor.')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per stylesheet')
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    stylesheets = loadStylesheets()
+    java = shutil.which('java') if os.path.exists(JAR) else None
+    if java is None:
+        print('java or %s not found, skipping the YUI Compressor' % os.path.relpath(JAR, ROOT_DIR))
+
+    results = {'repeat': args.repeat, 'stylesheets': {}}
+    for name, source in stylesheets:
+        print('%s (%d bytes):' % (name, len(source.encode('utf-8'))))
+        result = results['stylesheets'][name] = {}
+        result['cssmin'] = report('cssmin', *timeit(cssmin.cssmin, source, args.repeat))
+        result['cssmin.py'] = report('cssmin.py', *timeit(runCssmin, source, args.repeat))
+        if java:
+            result['yuicompressor'] = report('yuicompressor', *timeit(runJar, source, args.repeat))
+
+    print('whole CSS step:')
+    sources = [source for name, source in stylesheets]
+    results['step'] = {'cssmin': bestOf(lambda: minifyParallel(sources), args.repeat)}
+    print('  %-15s %8.3f s' % ('cssmin', results['step']['cssmin']))
+    if java:
+        results['step']['yuicompressor'] = bestOf(lambda: [runJar(source) for source in sources], args.repeat)
+        print('  %-15s %8.3f s' % ('yuicompressor', results['step']['yuicompressor']))
+        print('  %-15s %8.1fx' % ('speedup', results['step']['yuicompressor'] / results['step']['cssmin']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 0
+
+def loadStylesheets():
+    """Returns the name and concatenated source of each stylesheet in the manifest"""
+    with open(MANIFEST) as f:
+        spec = json.load(f)
+
+    root = os.path.join(BUILD_DIR, spec['root'])
+    return [(stylesheet['name'], ''.join(concatFiles(cssmin.stylesheetFiles(root, stylesheet))))
+            for stylesheet in spec['stylesheets']]
+
+def report(name, seconds, output):
+    """Prints and returns the statistics of one minifier on one stylesheet"""
+    data = output.encode('utf-8')
+    stats = {
+        'seconds': seconds,
+        'outputBytes': len(data),
+        'gzipBytes': len(gzip.compress(data, compresslevel=9, mtime=0)),
+    }
+    print('  %-15s %8.3f s %8d bytes %8d gzipped' % (name, seconds, stats['outputBytes'], stats['gzipBytes']))
+    return stats
+
+def timeit(minify, source, repeat):
+    """Returns the best wall time of several runs of a function of the source,
+    and its output"""
+    best = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = minify(source)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, output
+
+def bestOf(function, repeat):
+    """Returns the best wall time of several runs of a function"""
+    return timeit(lambda source: function(), None, repeat)[0]
+
+def minifyParallel(sources):
+    """Minifies several stylesheets in worker processes, as buildStylesheets() does"""
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(cssmin.cssmin, sources))
+
+def runCssmin(source):
+    """Minifies a stylesheet with cssmin.py in a new process"""
+    return subprocess.run([sys.executable, CSSMIN], input=source.encode('utf-8'),
+                          stdout=subprocess.PIPE, check=True).stdout.decode('utf-8')
+
+def runJar(source):
+    """Minifies a stylesheet with the YUI Compressor, in a new JVM"""
+    return subprocess.run(['java', '-jar', JAR, '--type', 'css', '--charset', 'utf-8'],
+                          input=source.encode('utf-8'), stdout=subprocess.PIPE,
+                          check=True).stdout.decode('utf-8')
+
+if __name__ == '__main__':
+    sys.exit(main())
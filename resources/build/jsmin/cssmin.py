@@ -0,0 +1,626 @@
+#!/usr/bin/python3
+"""
+CSS minifier
+
+A pure Python replacement for the YUI Compressor step of the build. The input
+is read in blocks and tokenized in a single pass; comments and whitespace are
+dropped as it goes, and what is left is parsed into rules. Only comments
+starting with /*! are kept, for licenses.
+
+Within each declaration value, numbers lose their leading and trailing zeros,
+zero lengths lose their unit, rgb() colors become hex colors and hex colors
+are shortened where they can be. Four-sided margin and padding values are
+shortened the same way. Custom properties, filters and anything inside
+calc() are left as they are.
+
+Duplicate rules are merged where that cannot change the cascade: a rule
+identical to a later one in the same block is dropped, neighbouring rules
+with the same selector are joined, and a declaration repeated later in the
+same rule is dropped. Rules with the same declarations but different
+selectors are not joined, since a browser drops the whole of a rule one of
+whose selectors it does not understand. Keyframes are left alone. As rules
+have to be seen before they can be merged, the output is written once the
+input has been read.
+
+Example usage:
+
+  ./cssmin.py < helioviewer.css > helioviewer.min.css
+  ./cssmin.py -o helioviewer.min.css ../../css/helioviewer-base.css ../../css/helioviewer-web.css
+  ./cssmin.py --manifest ../bundles.json
+"""
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+import itertools
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+from jsmin import BLOCK_SIZE, concatFiles, recordAssets, versionOutput
+from output import tmpFile, writeParts
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>/\*[^*]*\*+(?:[^*/][^*]*\*+)*/)
+  | (?P<string>"(?:[^"\\\n]|\\[\s\S])*"|'(?:[^'\\\n]|\\[\s\S])*')
+  | (?P<url>url\(\s*(?:[^\s"'()\\]|\\[\s\S])*\s*\))
+  | (?P<word>(?:[^\s"'{};:,()\[\]=>+~!/*\\]|\\[\s\S])+)
+  | (?P<open>/\*|["'])
+  | (?P<punct>[\s\S])
+""", re.VERBOSE | re.IGNORECASE)
+
+# At-rules whose block holds rules rather than declarations. Rules are not
+# merged within keyframes.
+_RULE_BLOCKS = re.compile(r'@(?:-[a-z]+-)?(?:media|supports|document|container|'
+                          r'layer|scope|starting-style|keyframes)$', re.IGNORECASE)
+_KEYFRAMES = re.compile(r'@(?:-[a-z]+-)?keyframes$', re.IGNORECASE)
+
+# Punctuation around which whitespace is dropped, in selectors, at-rule
+# preludes and declaration values: the first set is what whitespace may be
+# dropped before, the second what it may be dropped after.
+_SELECTOR = (frozenset('>+~,)]='), frozenset('>+~,([='))
+_PRELUDE = (frozenset(',)'), frozenset(',('))
+_VALUE = (frozenset(',)/!'), frozenset(',(/!'))
+
+# Value transforms. Strings and url()s have been replaced by \003 by then,
+# and whitespace collapsed.
+_NUMBER = re.compile(r'(?<![\w.#\\-])([+-]?)(\d*)\.(\d+)(?![\d.])')
+_ZERO_LENGTH = re.compile(r'(?<![\w.#\\-])[+-]?0+(?:px|em|rem|ex|ch|vw|vh|vmin|vmax|'
+                          r'cm|mm|in|pt|pc|q)(?![\w%-])', re.IGNORECASE)
+_RGB = re.compile(r'\brgba?\((\d+),(\d+),(\d+)(?:,(?:1|100%))?\)', re.IGNORECASE)
+_HEX = re.compile(r'(?<![\w#])#([0-9a-f]{6}|[0-9a-f]{3})(?![\w-])', re.IGNORECASE)
+_MATH = re.compile(r'\b(?:calc|min|max|clamp)\(', re.IGNORECASE)
+_IMPORTANT = re.compile(r'!important$', re.IGNORECASE)
+
+# Properties whose values are left as they are, besides custom properties:
+# old IE filters take colors in forms of their own.
+_RAW = frozenset(['filter', '-ms-filter'])
+# Properties whose zero lengths keep their unit: a unitless zero in flex is a
+# flex factor to some browsers.
+_KEEP_UNITS = re.compile(r'(?:-[a-z]+-)?flex')
+# Properties whose one to four values apply to the four sides of a box
+_SIDES = frozenset(['margin', 'padding'])
+
+class UnterminatedComment(Exception):
+    pass
+
+class UnterminatedString(Exception):
+    pass
+
+class UnbalancedBraces(Exception):
+    pass
+
+def cssmin(css):
+    """minify a string of CSS and return the result."""
+    outs = StringIO()
+    CSSMinify().minify(StringIO(css), outs)
+    return outs.getvalue()
+
+class CSSMinify(object):
+
+    def minify(self, instream, outstream):
+        for block in self.iterMinify(instream):
+            outstream.write(block)
+
+    def iterMinify(self, instream):
+        """minify what is read from instream, yielding the output in blocks.
+           instream is closed once it has been read.
+        """
+        for block in self._minify(iter(lambda: instream.read(BLOCK_SIZE), '')):
+            yield block
+        instream.close()
+
+    def _minify(self, chunks):
+        self._tokens = self._tokenize(iter(chunks))
+        self._pushed = []
+        items = self._rules(top=True)
+
+        out = []
+        size = 0
+        for text in _write(items):
+            out.append(text)
+            size += len(text)
+            if size >= BLOCK_SIZE:
+                yield ''.join(out)
+                out = []
+                size = 0
+        if out:
+            yield ''.join(out)
+
+    def _tokenize(self, chunks):
+        """yield the tokens of the input as (kind, text) pairs. A run of
+           whitespace and comments becomes a single space, or nothing if it
+           only holds comments; comments starting with /*! are kept.
+        """
+        buf = ''
+        pos = 0
+        eof = False
+        space = False
+        while True:
+            if pos == len(buf):
+                if eof:
+                    break
+                buf = next(chunks, '')
+                pos = 0
+                eof = not buf
+                continue
+
+            match = _TOKEN.match(buf, pos)
+            if not eof and (match.end() == len(buf) or match.lastgroup == 'open'):
+                # The token at the end of the buffer may go on in the next
+                # chunk, so it is only taken once the next chunk is there.
+                data = next(chunks, '')
+                buf = buf[pos:] + data
+                pos = 0
+                eof = not data
+                continue
+
+            kind = match.lastgroup
+            text = match.group()
+            pos = match.end()
+            if kind == 'open':
+                if text == '/*':
+                    raise UnterminatedComment()
+                raise UnterminatedString()
+            if kind == 'space':
+                space = True
+            elif kind == 'comment' and not text.startswith('/*!'):
+                continue
+            else:
+                if space:
+                    yield 'space', ' '
+                    space = False
+                yield kind, text
+        if space:
+            yield 'space', ' '
+
+    def _next(self):
+        """return the next token, or None at the end of the input."""
+        if self._pushed:
+            return self._pushed.pop()
+        return next(self._tokens, None)
+
+    def _push(self, token):
+        self._pushed.append(token)
+
+    def _rules(self, top=False, merge=True):
+        """read rules up to the '}' closing the current block, or up to the
+           end of the input at the top level, and return them as items for
+           _write(): ('rule', selector, declarations), ('block', prelude,
+           items), ('declarations', prelude, declarations), ('statement',
+           text) or ('comment', text).
+        """
+        items = []
+        while True:
+            token = self._next()
+            if token is None:
+                if not top:
+                    raise UnbalancedBraces('unclosed block at end of input')
+                break
+            kind, text = token
+            if kind == 'space' or text == ';':
+                continue
+            if text == '}':
+                if top:
+                    raise UnbalancedBraces("unexpected '}'")
+                break
+            if kind == 'comment':
+                items.append(('comment', text))
+                continue
+
+            self._push(token)
+            tokens, end = self._prelude()
+            if not tokens:
+                # A block without a selector applies to nothing.
+                if end == '{':
+                    self._declarations()
+                continue
+            if tokens[0][1].startswith('@'):
+                prelude = _join(tokens, _PRELUDE, colons=True)
+                if end != '{':
+                    items.append(('statement', prelude + ';'))
+                elif _RULE_BLOCKS.match(tokens[0][1]):
+                    block = self._rules(merge=not _KEYFRAMES.match(tokens[0][1]))
+                    if block:
+                        items.append(('block', prelude, block))
+                else:
+                    declarations = self._declarations()
+                    if declarations:
+                        items.append(('declarations', prelude, declarations))
+            elif end == '{':
+                declarations = self._declarations()
+                if declarations:
+                    items.append(('rule', _join(tokens, _SELECTOR), declarations))
+            else:
+                # Not valid CSS; browsers drop it, and so does the output.
+                continue
+
+        if merge:
+            items = _merge(items)
+        return items
+
+    def _prelude(self):
+        """read a selector or at-rule prelude up to the '{' or ';' ending
+           it, and return its tokens, without leading or trailing space, and
+           the token that ended it, or None at the end of the input. A '}'
+           ends it too, and is left to be read again.
+        """
+        tokens = []
+        depth = 0
+        while True:
+            token = self._next()
+            if token is None:
+                end = None
+                break
+            text = token[1]
+            if token[0] == 'punct':
+                if text in '([':
+                    depth += 1
+                elif text in ')]':
+                    depth -= 1
+                elif depth <= 0 and text in '{;':
+                    end = text
+                    break
+                elif depth <= 0 and text == '}':
+                    self._push(token)
+                    end = None
+                    break
+            if token[0] != 'comment':
+                tokens.append(token)
+        return _strip(tokens), end
+
+    def _declarations(self):
+        """read the declarations of a block up to the '}' closing it, and
+           return them minified. A nested block, as in @page, is returned
+           whole as a single declaration.
+        """
+        declarations = []
+        tokens = []
+        depth = 0
+        while True:
+            token = self._next()
+            if token is None:
+                raise UnbalancedBraces('unclosed block at end of input')
+            kind, text = token
+            if kind == 'punct':
+                if text in '([':
+                    depth += 1
+                elif text in ')]':
+                    depth -= 1
+                elif depth <= 0 and text in ';}':
+                    declaration = _declaration(_strip(tokens))
+                    if declaration:
+                        declarations.append(declaration)
+                    tokens = []
+                    if text == '}':
+                        break
+                    continue
+                elif depth <= 0 and text == '{':
+                    nested = self._declarations()
+                    if nested:
+                        declarations.append('%s{%s}' % (
+                            _join(_strip(tokens), _SELECTOR), ';'.join(nested)))
+                    tokens = []
+                    continue
+            if kind != 'comment':
+                tokens.append(token)
+        return _unique(declarations)
+
+def _strip(tokens):
+    """return tokens without leading and trailing space."""
+    start = 0
+    end = len(tokens)
+    while start < end and tokens[start][0] == 'space':
+        start += 1
+    while end > start and tokens[end - 1][0] == 'space':
+        end -= 1
+    return tokens[start:end]
+
+def _join(tokens, punctuation, colons=False):
+    """join tokens, keeping only the spaces that are needed. punctuation is
+       one of _SELECTOR, _PRELUDE and _VALUE. With colons set, spaces
+       around ':' within parentheses are dropped too, as in media queries.
+    """
+    before, after = punctuation
+    out = []
+    depth = 0
+    for i, (kind, text) in enumerate(tokens):
+        if kind == 'space':
+            prev = tokens[i - 1][1]
+            following = tokens[i + 1][1]
+            if prev in after or following in before:
+                continue
+            if colons and depth > 0 and ':' in (prev, following):
+                continue
+        elif kind == 'punct':
+            if text == '(':
+                depth += 1
+            elif text == ')':
+                depth -= 1
+        out.append(text)
+    return ''.join(out)
+
+def _declaration(tokens):
+    """return a minified declaration, or None if there is nothing to it."""
+    if not tokens:
+        return None
+    colon = next((i for i, (kind, text) in enumerate(tokens) if text == ':'), None)
+    if colon is None:
+        return _join(tokens, _VALUE)
+
+    prop = ''.join(text for kind, text in tokens[:colon] if kind != 'space')
+    value = _strip(tokens[colon + 1:])
+    if prop.startswith('--'):
+        return '%s:%s' % (prop, ''.join(text for kind, text in value))
+    prop = prop.lower()
+    return '%s:%s' % (prop, _value(prop, value))
+
+def _value(prop, tokens):
+    """return a minified declaration value."""
+    strings = []
+    parts = []
+    for kind, text in tokens:
+        if kind == 'url':
+            text = 'url(%s)' % text[4:-1].strip()
+        if kind in ('string', 'url'):
+            strings.append(text)
+            text = '\003'
+        parts.append((kind, text))
+    value = _join(parts, _VALUE)
+
+    bare = prop.lstrip('*_')
+    if bare not in _RAW and 'expression(' not in value.lower():
+        value = _NUMBER.sub(_number, value)
+        if not _KEEP_UNITS.match(bare) and not _MATH.search(value):
+            value = _ZERO_LENGTH.sub('0', value)
+        value = _RGB.sub(_rgb, value)
+        value = _HEX.sub(_hex, value)
+        if bare in _SIDES:
+            value = _sides(value)
+
+    if strings:
+        parts = value.split('\003')
+        value = parts[0] + ''.join([s + p for s, p in zip(strings, parts[1:])])
+    return value
+
+def _number(match):
+    """return a decimal number without leading or trailing zeros."""
+    sign, whole, fraction = match.groups()
+    whole = whole.lstrip('0')
+    fraction = fraction.rstrip('0')
+    number = whole + '.' + fraction if fraction else whole or '0'
+    return number if number == '0' else sign + number
+
+def _rgb(match):
+    """return an opaque rgb() or rgba() color as a hex color."""
+    values = [int(value) for value in match.groups()]
+    if max(values) > 255:
+        return match.group()
+    return '#%02x%02x%02x' % tuple(values)
+
+def _hex(match):
+    """return a hex color in lower case, with three digits if it can be."""
+    digits = match.group(1).lower()
+    if len(digits) == 6 and digits[0::2] == digits[1::2]:
+        digits = digits[0::2]
+    return '#' + digits
+
+def _sides(value):
+    """return the shortest equivalent of a margin or padding value."""
+    important = ''
+    match = _IMPORTANT.search(value)
+    if match:
+        value, important = value[:match.start()], match.group()
+    if '(' in value or '\003' in value:
+        return value + important
+    sides = value.split(' ')
+    if len(sides) == 4 and sides[3] == sides[1]:
+        sides.pop()
+    if len(sides) == 3 and sides[2] == sides[0]:
+        sides.pop()
+    if len(sides) == 2 and sides[1] == sides[0]:
+        sides.pop()
+    return ' '.join(sides) + important
+
+def _unique(declarations):
+    """return declarations without those repeated later on."""
+    if len(set(declarations)) == len(declarations):
+        return declarations
+    seen = set()
+    unique = []
+    for declaration in reversed(declarations):
+        if declaration not in seen:
+            seen.add(declaration)
+            unique.append(declaration)
+    unique.reverse()
+    return unique
+
+def _merge(items):
+    """merge the duplicate rules of a block. A rule identical to a later one
+       is dropped, which leaves the later one to apply as before, and then
+       neighbouring rules with the same selector are joined.
+    """
+    seen = set()
+    kept = []
+    for item in reversed(items):
+        if item[0] == 'rule':
+            key = (item[1], tuple(item[2]))
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(item)
+    kept.reverse()
+
+    merged = []
+    for item in kept:
+        last = merged[-1] if merged else None
+        if item[0] == 'rule' and last and last[0] == 'rule' and last[1] == item[1]:
+            merged[-1] = ('rule', item[1], _unique(last[2] + item[2]))
+        else:
+            merged.append(item)
+    return merged
+
+def _write(items):
+    """yield the text of the items returned by CSSMinify._rules()."""
+    for item in items:
+        if item[0] in ('statement', 'comment'):
+            yield item[1]
+        elif item[0] == 'block':
+            yield item[1] + '{'
+            for text in _write(item[2]):
+                yield text
+            yield '}'
+        else:
+            yield '%s{%s}' % (item[1], ';'.join(item[2]))
+
+def minifyChunks(chunks):
+    """minify CSS given as an iterable of strings, such as an open file or
+       concatFiles(), yielding the output in blocks. Tokens may span chunks.
+    """
+    return CSSMinify()._minify(chunks)
+
+def minifyFiles(paths):
+    """minify the concatenation of several UTF-8 encoded files and return
+       the result."""
+    return ''.join(minifyChunks(concatFiles(paths)))
+
+def stylesheetFiles(root, stylesheet):
+    """return the files of a stylesheet in a manifest, in order. Names may
+       be glob patterns, whose matches are taken in sorted order; a file
+       already taken, or matching one of the "exclude" patterns, is
+       skipped.
+    """
+    exclude = set()
+    for pattern in stylesheet.get('exclude', []):
+        exclude.update(os.path.normpath(path) for path in
+                       glob.glob(os.path.join(root, pattern)))
+    files = []
+    for name in stylesheet['files']:
+        pattern = os.path.join(root, name)
+        for path in sorted(glob.glob(pattern)) if glob.has_magic(name) else [pattern]:
+            path = os.path.normpath(path)
+            if path not in exclude and path not in files:
+                files.append(path)
+    return files
+
+def buildStylesheets(manifest, jobs=None):
+    """write every stylesheet described by a JSON manifest, each in its own
+       worker process. jobs defaults to the number of CPUs; with a single
+       job no pool is started. The stylesheets are listed next to the
+       JavaScript bundles of jsmin.buildBundles():
+
+         {
+             "root": "../..",
+             "assets": "resources/compressed/assets.json",
+             "stylesheets": [
+                 {
+                     "name": "web",
+                     "header": "resources/build/concat/Header.css",
+                     "concat": "resources/compressed/helioviewer.css",
+                     "output": "resources/compressed/helioviewer.min.css",
+                     "files": ["resources/css/helioviewer-base.css",
+                               "resources/css/*.css"],
+                     "exclude": ["resources/css/api.css"]
+                 }
+             ]
+         }
+
+       Paths are relative to root, which is relative to the manifest; see
+       stylesheetFiles() for how files are listed. The header is prepended
+       to the minified output as is, and concat, if given, receives the
+       unminified concatenation of the files. As for the bundles, when the
+       manifest has an "assets" path, each output is also written under a
+       content-hashed name recorded there.
+    """
+    with open(manifest, encoding='utf-8') as f:
+        spec = json.load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(manifest)),
+                        spec.get('root', '.'))
+
+    stylesheets = spec['stylesheets']
+    build = instrument.wrap(buildStylesheet, 'cssmin')
+    digests = []
+    if jobs == 1 or len(stylesheets) <= 1:
+        for stylesheet in stylesheets:
+            digests.append(instrument.unwrap(build, build(root, stylesheet), stylesheet['output']))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(build, root, stylesheet)
+                       for stylesheet in stylesheets]
+            for stylesheet, future in zip(stylesheets, futures):
+                digests.append(instrument.unwrap(build, future.result(), stylesheet['output']))
+
+    if 'assets' in spec:
+        assets = dict((stylesheet['output'],
+                       versionOutput(os.path.join(root, stylesheet['output']), digest, root))
+                      for stylesheet, digest in zip(stylesheets, digests))
+        recordAssets(os.path.join(root, spec['assets']), root, assets)
+
+def buildStylesheet(root, stylesheet):
+    """write one stylesheet of a manifest, see buildStylesheets(), and
+       return the SHA-256 of the output. The files are read once, in blocks,
+       which go to concat as they are read and through the minifier into the
+       output after the header.
+    """
+    files = stylesheetFiles(root, stylesheet)
+    chunks = concatFiles(files)
+    if 'concat' in stylesheet:
+        chunks = _tee(chunks, os.path.join(root, stylesheet['concat']))
+
+    header = ''
+    if 'header' in stylesheet:
+        with open(os.path.join(root, stylesheet['header']), encoding='utf-8') as f:
+            header = f.read()
+    output = os.path.join(root, stylesheet['output'])
+    digest = writeParts(output, itertools.chain([header], minifyChunks(chunks)))
+    if instrument.enabled():
+        instrument.annotate(bytesIn=sum(os.path.getsize(path) for path in files),
+                            bytesOut=os.path.getsize(output))
+    return digest
+
+def _tee(chunks, path):
+    """yield chunks, writing them to a file as well, through a temporary
+       file that replaces it once all of them have been read."""
+    tmp = tmpFile(path)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+    os.replace(tmp, path)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Minify CSS. Reads from stdin unless files or a manifest '
+                    'are given, in which case the output is that for their '
+                    'concatenation.')
+    parser.add_argument('files', nargs='*', help='CSS files to minify')
+    parser.add_argument('-m', '--manifest',
+                        help='JSON manifest describing stylesheets to build; '
+                             'see buildStylesheets()')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('-o', '--output',
+                        help='file to write to instead of stdout')
+    args = parser.parse_args()
+
+    if args.manifest:
+        buildStylesheets(args.manifest, args.jobs)
+        return
+
+    if args.output:
+        outstream = open(args.output, 'w', encoding='utf-8')
+    else:
+        outstream = sys.stdout
+
+    if args.files:
+        outstream.write(minifyFiles(args.files))
+    else:
+        CSSMinify().minify(sys.stdin, outstream)
+
+    outstream.close()
+
+if __name__ == '__main__':
+    main()
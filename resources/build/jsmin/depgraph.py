@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+"""
+Dependency graph and code splitting
+
+The client's files share nothing but globals: each declares classes, such as
+var Timeline = Class.extend({...}), and functions outside any function, and
+uses those of the files before it. Reading the minified output of each file
+with mangle.globalNames() gives the globals it declares and the ones it
+uses; a file depends on every other file declaring a global it uses.
+
+A bundle of jsmin.buildBundles() can be split along that graph into a core,
+loaded by the page, and chunks loaded on demand by loadChunk(), see
+resources/js/Utility/HelperFunctions.js:
+
+  "chunks": {
+      "timeline": {
+          "output": "resources/compressed/helioviewer-timeline.min.js",
+          "entries": ["Timeline", "TimelineEvents"]
+      }
+  }
+
+The files declaring the entries of a chunk go into it, and so does every
+other file only used by files of that chunk, and so on, so that the core
+keeps what it uses itself. A file that cannot be read, or that declares a
+name a file of another chunk or of the core declares too, is left in the
+core. Uses of the globals of a chunk by the core have to go through
+loadChunk(); they are listed on stderr, file by file, for review.
+
+Example usage:
+
+  ./depgraph.py --manifest ../bundles.json
+  ./depgraph.py --manifest ../bundles.json --bundle web --dot web.dot
+"""
+import os
+import sys
+import gzip
+import json
+import argparse
+from collections import OrderedDict
+
+from mangle import MangleError, globalNames, VERSION as MANGLE_VERSION
+from output import saved
+
+class SplitError(Exception):
+    pass
+
+def scanFiles(paths, results, cache=None):
+    """return the globals each file declares and uses, as two dicts of sets
+       by path, given the minified output of each file. The globals of a
+       file that cannot be read are None.
+
+       If a MinifyCache is given, the globals of each file are cached under
+       the key of its output with '-globals' and mangle.VERSION appended,
+       so only files whose output changed are parsed again.
+    """
+    declared = {}
+    used = {}
+    for path in paths:
+        key = None
+        if cache is not None:
+            key = cache.key(results[path].encode('utf-8')) + '-globals' + MANGLE_VERSION
+            names = cache.get(key)
+            if names is not None:
+                names = json.loads(names)
+                declared[path], used[path] = (None, None) if names is None else map(set, names)
+                continue
+        try:
+            declared[path], used[path] = globalNames(results[path])
+        except MangleError:
+            declared[path] = used[path] = None
+        if key is not None:
+            names = None
+            if declared[path] is not None:
+                names = [sorted(declared[path]), sorted(used[path])]
+            cache.put(key, json.dumps(names))
+    return declared, used
+
+def buildGraph(paths, declared, used):
+    """return the files each file depends on, and the globals it uses from
+       each, as a dict by path of dicts by path of sets of names. Globals no
+       file declares, such as $ or window, are left out.
+    """
+    owners = {}
+    for path in paths:
+        for name in declared[path] or ():
+            owners.setdefault(name, []).append(path)
+
+    graph = OrderedDict()
+    for path in paths:
+        graph[path] = OrderedDict()
+        for name in sorted(used[path] or ()):
+            for owner in owners.get(name, ()):
+                if owner != path:
+                    graph[path].setdefault(owner, set()).add(name)
+    return graph
+
+def splitBundle(paths, declared, graph, chunks):
+    """split the files of a bundle into its core and its chunks, given the
+       globals each file declares, its graph and the "chunks" of the bundle.
+       Returns the paths of the core and of each chunk, in bundle order, and
+       the uses of the globals of each chunk by the core, as a list of
+       (path, chunk, names). Raises SplitError if an entry is not declared
+       by exactly one file, or if the files of a chunk use globals of
+       another chunk.
+    """
+    owner = {}
+    for name, chunk in chunks.items():
+        for entry in chunk['entries']:
+            found = [path for path in paths if entry in (declared[path] or ())]
+            if len(found) != 1:
+                raise SplitError('%s: entry %s is declared by %d files' %
+                                 (name, entry, len(found)))
+            if owner.get(found[0], name) != name:
+                raise SplitError('%s: entry %s is in chunk %s' %
+                                 (name, entry, owner[found[0]]))
+            owner[found[0]] = name
+
+    users = dict((path, set()) for path in paths)
+    for path in paths:
+        for dependency in graph[path]:
+            users[dependency].add(path)
+
+    changed = True
+    while changed:
+        changed = False
+        for path in paths:
+            if path in owner or declared[path] is None or not users[path]:
+                continue
+            found = set(owner.get(user) for user in users[path])
+            if len(found) == 1 and None not in found:
+                owner[path] = found.pop()
+                changed = True
+
+    # Names declared in more than one part would depend on the order the
+    # parts are loaded in
+    parts = {}
+    for path in paths:
+        for name in declared[path] or ():
+            parts.setdefault(name, set()).add(owner.get(path))
+    shared = set(name for name, found in parts.items() if len(found) > 1)
+    for path in paths:
+        if path in owner and declared[path] & shared:
+            if any(entry in declared[path] for entry in chunks[owner[path]]['entries']):
+                raise SplitError('%s declares %s, also declared outside chunk %s' %
+                                 (path, ', '.join(sorted(declared[path] & shared)),
+                                  owner[path]))
+            del owner[path]
+
+    deferred = []
+    for path in paths:
+        for dependency, names in graph[path].items():
+            if dependency not in owner or owner.get(path) == owner[dependency]:
+                continue
+            if path in owner:
+                raise SplitError('%s in chunk %s uses %s from chunk %s' %
+                                 (path, owner[path], ', '.join(sorted(names)),
+                                  owner[dependency]))
+            deferred.append((path, owner[dependency], sorted(names)))
+
+    core = [path for path in paths if path not in owner]
+    split = OrderedDict((name, [path for path in paths if owner.get(path) == name])
+                        for name in chunks)
+    return core, split, deferred
+
+def reportSplit(core, split, deferred, sizes, root=None):
+    """print the size of the core and of each chunk, the uses of the globals
+       of the chunks by the core, and how much smaller the core is than the
+       whole bundle, to stderr. sizes gives the minified and gzipped size of
+       the whole bundle and of each part, by name, with None for the core.
+       Paths are shown relative to root, if given.
+    """
+    def name(path):
+        return os.path.relpath(path, root) if root else path
+
+    for part, paths in [(None, core)] + list(split.items()):
+        size, gzipped = sizes[part]
+        print('%8d bytes %8d gzipped  %s, %d files' % (
+                  size, gzipped, part or 'core', len(paths)),
+              file=sys.stderr)
+        if part is not None:
+            for path in paths:
+                print('    %s' % name(path), file=sys.stderr)
+    for path, part, names in deferred:
+        print('%s uses %s of chunk %s' % (name(path), ', '.join(names), part),
+              file=sys.stderr)
+
+    (before, gzippedBefore), (after, gzippedAfter) = sizes['bundle'], sizes[None]
+    print('initial bundle %d -> %d bytes %.1f%% smaller, gzipped %d -> %d '
+          'bytes %.1f%% smaller' % (before, after, saved(before, after),
+                                   gzippedBefore, gzippedAfter,
+                                   saved(gzippedBefore, gzippedAfter)),
+          file=sys.stderr)
+
+def measure(text):
+    """return the size of text, as UTF-8, plain and gzipped."""
+    data = text.encode('utf-8')
+    return len(data), len(gzip.compress(data, 9))
+
+def writeDot(path, graph, core, split, root=None):
+    """write the graph as Graphviz dot, with a cluster for each chunk."""
+    def name(path):
+        return os.path.relpath(path, root) if root else path
+
+    lines = ['digraph bundle {', '    rankdir=LR;', '    node [shape=box];']
+    for part, paths in split.items():
+        lines.append('    subgraph "cluster_%s" {' % part)
+        lines.append('        label="%s";' % part)
+        lines.extend('        "%s";' % name(path) for path in paths)
+        lines.append('    }')
+    lines.extend('    "%s";' % name(path) for path in core)
+    for source, dependencies in graph.items():
+        for dependency, names in dependencies.items():
+            lines.append('    "%s" -> "%s" [tooltip="%s"];' %
+                         (name(source), name(dependency), ' '.join(sorted(names))))
+    lines.append('}')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def main():
+    # Imported here as jsmin imports this module for buildBundles()
+    from jsmin import joinMinified, minifyFile
+
+    parser = argparse.ArgumentParser(
+        description='Show the dependency graph of the bundles of a manifest, '
+                    'and how those with chunks are split, without writing '
+                    'them.')
+    parser.add_argument('-m', '--manifest', required=True,
+                        help='JSON manifest describing bundles; see '
+                             'jsmin.buildBundles()')
+    parser.add_argument('-b', '--bundle', help='only look at the bundle of that name')
+    parser.add_argument('--dot', help='file to write the graph to, as Graphviz dot')
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding='utf-8') as f:
+        spec = json.load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(args.manifest)),
+                        spec.get('root', '.'))
+    bundles = [bundle for bundle in spec['bundles']
+               if args.bundle in (None, bundle['name'])]
+    if not bundles:
+        parser.error('no bundle named %s' % args.bundle)
+
+    for bundle in bundles:
+        files = [os.path.join(root, name) for name in bundle['files']]
+        paths = list(dict.fromkeys(files))
+        results = dict((path, minifyFile(path)) for path in paths)
+        declared, used = scanFiles(paths, results)
+        graph = buildGraph(paths, declared, used)
+
+        print('%s:' % bundle['name'], file=sys.stderr)
+        for path in paths:
+            if declared[path] is None:
+                print('  %s cannot be read' % os.path.relpath(path, root), file=sys.stderr)
+            for dependency, names in graph[path].items():
+                print('  %s -> %s (%s)' % (os.path.relpath(path, root),
+                                          os.path.relpath(dependency, root),
+                                          ', '.join(sorted(names))), file=sys.stderr)
+
+        core, split = paths, OrderedDict()
+        if 'chunks' in bundle:
+            try:
+                core, split, deferred = splitBundle(paths, declared, graph, bundle['chunks'])
+            except SplitError as e:
+                sys.exit('%s: %s' % (bundle['name'], e))
+
+            sizes = dict((name, measure(joinMinified(results[path] for path in files)))
+                         for name, files in split.items())
+            # A file listed twice is kept twice, as in the whole bundle
+            core = [path for path in files if path in core]
+            sizes[None] = measure(joinMinified(results[path] for path in core))
+            sizes['bundle'] = measure(joinMinified(results[path] for path in files))
+            reportSplit(core, split, deferred, sizes, root)
+
+        if args.dot:
+            dot = args.dot
+            if len(bundles) > 1:
+                base, ext = os.path.splitext(args.dot)
+                dot = '%s-%s%s' % (base, bundle['name'], ext)
+            writeDot(dot, graph, core, split, root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+"""
+Event data bundle
+
+Validates resources/JSON/defaultEventTypes.json and eventGlossary.json, and
+compiles them into one compact, pre-indexed JSON form:
+
+  {
+      "version": 2,
+      "strings": [null, "string", ...],
+      "fields": ["hv_label", "hv_desc", "hv_type", "hek_type", "hek_desc"],
+      "keys": ["active", "ar_area", ...],
+      "values": [0, 0, 5, 1, 0, ...],
+      "prefixes": {"ar": [1, 24], "frm": [80, 90], ...},
+      "eventTypes": {"AR": [12, 1, 24], ...},
+      "frm": [80, 90]
+  }
+
+Every string of the glossary values and the event type names is kept once,
+in "strings", most used first, so that the most common ones get the
+shortest indexes; index 0 is null. The glossary keywords are in "keys",
+sorted, and the values of the fields of keyword i are "values"[i * 5] to
+"values"[i * 5 + 4], as indexes into "strings". As the keys are sorted, all
+the keywords starting with the same prefix followed by "_", such as "frm_"
+or "ar_", are next to each other, and "prefixes" gives the [start, end)
+range of each prefix, so that the keywords of an event type need no scan.
+"eventTypes" maps the abbreviation of each default event type, in order, to
+its name and the range of the keywords starting with its lowercased
+abbreviation, and "frm" is the range of the keywords describing the feature
+recognition method, which every event type shares.
+
+This is a tool for evaluating that form, not a stage of the build: no
+client reads it, and gzipped it is larger than the two sources, as gzip
+already removes the repeated strings that interning does. It is written to
+stdout, or to the file given with -o.
+
+The sizes before and after, plain and gzipped, are reported on stderr.
+With --benchmark, so is the time a JavaScript engine takes to parse both
+forms and to find the keywords of every event type. The times are measured
+with node when it is on the PATH, and otherwise only the parse times are,
+with Python's json.
+
+Example usage:
+
+  ./eventdata.py ../../JSON/defaultEventTypes.json ../../JSON/eventGlossary.json > events.min.json
+  ./eventdata.py --benchmark -o events.min.json ../../JSON/defaultEventTypes.json ../../JSON/eventGlossary.json
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from collections import Counter
+
+from output import saved, writeFile
+
+# Version of the compact form, to be raised whenever its layout changes
+FORMAT_VERSION = 2
+
+FIELDS = ('hv_label', 'hv_desc', 'hv_type', 'hek_type', 'hek_desc')
+
+# "Active Region/AR" in defaultEventTypes.json
+_EVENT_TYPE = re.compile(r'^([^/]+)/([A-Z0-9]{2,3})$')
+
+class InvalidEventData(Exception):
+    pass
+
+def loadJSON(path):
+    """return the object in a JSON file, refusing duplicate keys, which
+       json.load() would silently drop."""
+    def pairs(items):
+        result = {}
+        for key, value in items:
+            if key in result:
+                raise InvalidEventData('%s: duplicate key %r' % (path, key))
+            result[key] = value
+        return result
+
+    with open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f, object_pairs_hook=pairs)
+        except ValueError as e:
+            raise InvalidEventData('%s: %s' % (path, e))
+    if not isinstance(data, dict):
+        raise InvalidEventData('%s: not a JSON object' % path)
+    return data
+
+def validate(eventTypes, glossary, eventTypesPath='event types', glossaryPath='glossary'):
+    """check the default event types and the glossary, and return the name
+       of each event type by abbreviation, in order."""
+    types = {}
+    for key, value in eventTypes.items():
+        match = _EVENT_TYPE.match(key)
+        if not match:
+            raise InvalidEventData('%s: %r is not "Name/XX"' % (eventTypesPath, key))
+        if value != {}:
+            raise InvalidEventData('%s: %r should map to {}' % (eventTypesPath, key))
+        name, abbreviation = match.groups()
+        if abbreviation in types:
+            raise InvalidEventData('%s: %s is used twice' % (eventTypesPath, abbreviation))
+        types[abbreviation] = name
+
+    for key, entry in glossary.items():
+        if not isinstance(entry, dict) or sorted(entry) != sorted(FIELDS):
+            raise InvalidEventData('%s: %r should have exactly the fields %s'
+                                   % (glossaryPath, key, ', '.join(FIELDS)))
+        for field, value in entry.items():
+            if value is not None and not isinstance(value, str):
+                raise InvalidEventData('%s: %r.%s should be a string or null'
+                                       % (glossaryPath, key, field))
+    return types
+
+def compact(types, glossary):
+    """return the compact form of the event types and the glossary; see the
+       module documentation."""
+    keys = sorted(glossary)
+    counts = Counter(value for key in keys for value in glossary[key].values()
+                     if value is not None)
+    counts.update(types.values())
+    strings = [None] + sorted(counts, key=lambda string: (-counts[string], string))
+    index = dict((string, i) for i, string in enumerate(strings))
+
+    values = [index[glossary[key][field]] for key in keys for field in FIELDS]
+
+    prefixes = {}
+    for i, key in enumerate(keys):
+        prefix, sep, rest = key.partition('_')
+        if sep and prefix:
+            start, end = prefixes.get(prefix, (i, i))
+            prefixes[prefix] = [start, i + 1]
+
+    return {
+        'version': FORMAT_VERSION,
+        'strings': strings,
+        'fields': list(FIELDS),
+        'keys': keys,
+        'values': values,
+        'prefixes': prefixes,
+        'eventTypes': dict((abbreviation, [index[name]] + prefixes.get(abbreviation.lower(), [0, 0]))
+                           for abbreviation, name in types.items()),
+        'frm': prefixes.get('frm', [0, 0]),
+    }
+
+def expand(data):
+    """return the glossary from its compact form, as the client would."""
+    strings, fields, values = data['strings'], data['fields'], data['values']
+    width = len(fields)
+    return dict((key, dict((field, strings[values[i * width + j]])
+                           for j, field in enumerate(fields)))
+                for i, key in enumerate(data['keys']))
+
+def buildEventData(eventTypesPath, glossaryPath):
+    """return the minified compact form of the event data files, and the
+       statistics of the sources and the output."""
+    eventTypes = loadJSON(eventTypesPath)
+    glossary = loadJSON(glossaryPath)
+    types = validate(eventTypes, glossary, eventTypesPath, glossaryPath)
+
+    data = compact(types, glossary)
+    if expand(data) != glossary:
+        raise InvalidEventData('the compact form of %s does not expand back to it' % glossaryPath)
+    text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+    sources = []
+    for path in (eventTypesPath, glossaryPath):
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+    return text, {
+        'sources': [source.decode('utf-8') for source in sources],
+        'output': text,
+        'strings': len(data['strings']) - 1,
+        'values': len(data['values']),
+    }
+
+# Parses each form a number of times and times it, then times finding the
+# keywords of every event type: by scanning the glossary, as the client
+# does, and through the prefix ranges
+_NODE_BENCHMARK = r'''
+const [sources, output, repeat] = JSON.parse(require("fs").readFileSync(0, "utf8"));
+function best(f) {
+    let min = Infinity;
+    for (let i = 0; i < repeat; i++) {
+        const start = process.hrtime.bigint();
+        f();
+        min = Math.min(min, Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    return min;
+}
+const types = Object.keys(JSON.parse(sources[0])).map((key) => key.split("/")[1]);
+const glossary = JSON.parse(sources[1]);
+const data = JSON.parse(output);
+const keys = Object.keys(glossary);
+let found = 0;
+console.log(JSON.stringify({
+    before: best(() => sources.forEach((source) => JSON.parse(source))),
+    after: best(() => JSON.parse(output)),
+    scan: best(() => types.forEach((type) => {
+        const prefix = type.toLowerCase() + "_";
+        found += keys.filter((key) => key.startsWith(prefix)).length;
+    })),
+    indexed: best(() => types.forEach((type) => {
+        const range = data.eventTypes[type];
+        found += data.keys.slice(range[1], range[2]).length;
+    })),
+}));
+'''
+
+def _timeParsing(sources, output, repeat=200):
+    """return the best times, in ms, to parse the sources and the output,
+       and to find the keywords of every event type in each, and what
+       measured them."""
+    node = shutil.which('node')
+    if node:
+        result = subprocess.run([node, '-e', _NODE_BENCHMARK], input=json.dumps([sources, output, repeat]),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        return json.loads(result.stdout), 'node'
+
+    def best(function):
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append((time.perf_counter() - start) * 1000)
+        return min(times)
+    return {'before': best(lambda: [json.loads(source) for source in sources]),
+            'after': best(lambda: json.loads(output))}, 'python'
+
+def _reportSavings(name, stats, benchmark=False):
+    """print the size of the sources and of the output to stderr, and their
+       parse time if benchmark is set."""
+    before = sum(len(source.encode('utf-8')) for source in stats['sources'])
+    after = len(stats['output'].encode('utf-8'))
+    gzBefore = sum(len(gzip.compress(source.encode('utf-8'), 9)) for source in stats['sources'])
+    gzAfter = len(gzip.compress(stats['output'].encode('utf-8'), 9))
+    print('%s: %d values, %d distinct strings' % (name, stats['values'], stats['strings']),
+          file=sys.stderr)
+    print('%8d -> %8d bytes %6.1f%%' % (before, after, saved(before, after)), file=sys.stderr)
+    print('%8d -> %8d bytes %6.1f%%  gzipped' % (gzBefore, gzAfter, saved(gzBefore, gzAfter)),
+          file=sys.stderr)
+    if not benchmark:
+        return
+
+    try:
+        times, engine = _timeParsing(stats['sources'], stats['output'])
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print('parse times not measured: %s' % e, file=sys.stderr)
+        return
+    print('%8.3f -> %8.3f ms  %6.1f%%  parse (%s)' % (
+              times['before'], times['after'], saved(times['before'], times['after']), engine),
+          file=sys.stderr)
+    if 'scan' in times:
+        print('%8.3f -> %8.3f ms  %6.1f%%  keywords of every event type (%s)' % (
+                  times['scan'], times['indexed'], saved(times['scan'], times['indexed']), engine),
+              file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Validate the event types and glossary and report the '
+                    'savings of their compact, pre-indexed form.')
+    parser.add_argument('files', nargs=2, metavar='FILE',
+                        help='defaultEventTypes.json and eventGlossary.json')
+    parser.add_argument('-o', '--output',
+                        help='file to write to instead of stdout')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='also time parsing both forms and looking up keywords')
+    args = parser.parse_args()
+
+    try:
+        text, stats = buildEventData(*args.files)
+    except InvalidEventData as e:
+        print('eventdata: %s' % e, file=sys.stderr)
+        return 1
+
+    if args.output:
+        writeFile(args.output, text)
+    else:
+        sys.stdout.write(text + '\n')
+    _reportSavings(os.path.basename(args.output or args.files[1]), stats, args.benchmark)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
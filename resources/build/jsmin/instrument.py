@@ -0,0 +1,241 @@
+"""
+Build instrumentation
+
+Opt-in timing of the asset build. Once enable() has been called, the build
+records:
+
+  - spans: the wall and CPU time of each phase, of each file minified and
+    of each output written, with the bytes in and out where they are known;
+  - counters, such as the number of files minified and of cache hits;
+  - samples of the call stack of the minifier, taken every interval of CPU
+    time while it runs, if enable() was given an interval.
+
+Until then span() and count() do nothing but check a global, so the build
+costs the same as without them.
+
+Work done in worker processes is measured there: a function given to wrap()
+runs under its own Recorder, which it returns along with the result, and
+unwrap() adds that to the build's. Times are taken with time.perf_counter(),
+whose clock is shared between processes on Linux, so spans from the workers
+line up with those of the build.
+
+The record can be written as JSON with writeJSON(), or in the Chrome trace
+event format with writeTrace(), for chrome://tracing or Perfetto, one track
+per process. Sampled stacks are in the collapsed form flamegraph.pl reads,
+"outer;inner;innermost": count.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import platform
+import subprocess
+from collections import Counter
+from contextlib import contextmanager
+
+# Interval of CPU time between samples, in seconds, when sampling is asked
+# for without one
+DEFAULT_INTERVAL = 0.001
+
+_recorder = None
+# Spans open in this process, innermost last
+_open = []
+
+class Recorder(object):
+    """the spans, counters and samples of a build, or of one task of it."""
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = Counter()
+        self.samples = Counter()
+
+    def merge(self, other):
+        self.spans.extend(other.spans)
+        self.counters.update(other.counters)
+        self.samples.update(other.samples)
+
+    def toJSON(self):
+        """return the record as a JSON-serializable dict, times in seconds
+           from the start of the recording."""
+        return {
+            'python': platform.python_version(),
+            'commit': _gitCommit(),
+            'spans': [dict(span, start=span['start'] - self.origin)
+                      for span in sorted(self.spans, key=lambda span: span['start'])],
+            'counters': dict(self.counters),
+            'samples': dict(self.samples.most_common()),
+        }
+
+    def toTrace(self):
+        """return the record in the Chrome trace event format, times in
+           microseconds: a complete event per span, and the counters as
+           metadata."""
+        events = []
+        for pid in sorted(set(span['pid'] for span in self.spans)):
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid,
+                           'args': {'name': 'build' if pid == os.getpid() else 'worker %d' % pid}})
+        for span in self.spans:
+            args = dict(span['args'], cpu=round(span['cpu'] * 1e3, 3))
+            events.append({'name': span['name'], 'cat': span['category'], 'ph': 'X',
+                           'ts': round((span['start'] - self.origin) * 1e6, 1),
+                           'dur': round(span['wall'] * 1e6, 1),
+                           'pid': span['pid'], 'tid': span['pid'], 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'counters': dict(self.counters)}}
+
+def enable(interval=None):
+    """start recording, sampling the stack of wrapped functions every
+       interval seconds of CPU time if interval is given, and return the
+       Recorder."""
+    global _recorder
+    _recorder = Recorder(interval)
+    return _recorder
+
+def disable():
+    """stop recording and return what was recorded."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+def enabled():
+    return _recorder is not None
+
+@contextmanager
+def span(name, category='phase', **args):
+    """record the wall and CPU time of the block as a span, with args."""
+    if _recorder is None:
+        yield
+        return
+    record = {'name': name, 'category': category, 'pid': os.getpid(), 'args': args,
+              'start': time.perf_counter(), 'cpu': time.process_time()}
+    _open.append(record)
+    try:
+        yield
+    finally:
+        _open.pop()
+        record['wall'] = time.perf_counter() - record['start']
+        record['cpu'] = time.process_time() - record['cpu']
+        _recorder.spans.append(record)
+
+def annotate(**args):
+    """add args, such as bytesIn and bytesOut, to the innermost open span."""
+    if _open:
+        _open[-1]['args'].update(args)
+
+def count(name, n=1):
+    if _recorder is not None:
+        _recorder.counters[name] += n
+
+def wrap(function, category):
+    """return function itself, or, while recording, a picklable callable
+       that runs it in a span of category, sampled if asked for, and
+       returns the result together with what it recorded, for unwrap()."""
+    if _recorder is None:
+        return function
+    return _Measured(function, category, _recorder.interval)
+
+def unwrap(function, value, name):
+    """return the result of a call to what wrap() returned for function,
+       adding what it recorded to the build's, its span named name."""
+    if not isinstance(function, _Measured):
+        return value
+    result, recorder = value
+    for record in recorder.spans:
+        if record['category'] == function.category:
+            record['name'] = name
+    if _recorder is not None:
+        _recorder.merge(recorder)
+    return result
+
+class _Measured(object):
+    def __init__(self, function, category, interval):
+        self.function = function
+        self.category = category
+        self.interval = interval
+
+    def __call__(self, *args):
+        global _recorder
+        outer, _recorder = _recorder, Recorder(self.interval)
+        try:
+            with span(self.function.__name__, self.category):
+                if self.interval:
+                    with _Sampler(self.interval, _recorder.samples):
+                        result = self.function(*args)
+                else:
+                    result = self.function(*args)
+            count('%s calls' % self.category)
+        finally:
+            recorder, _recorder = _recorder, outer
+        return result, recorder
+
+class _Sampler(object):
+    """counts the call stacks of the main thread of this process, every
+       interval seconds of CPU time, as collapsed stacks."""
+
+    def __init__(self, interval, samples):
+        self.interval = interval
+        self.samples = samples
+
+    def __enter__(self):
+        self.previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code is _Measured.__call__.__code__:
+                break
+            stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+def writeJSON(path, recorder):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recorder.toJSON(), f, indent=1)
+        f.write('\n')
+
+def writeTrace(path, recorder):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recorder.toTrace(), f)
+        f.write('\n')
+
+def report(recorder, top=10):
+    """print the slowest files and the functions most often on top of the
+       sampled stacks to stderr."""
+    files = sorted((span for span in recorder.spans if span['category'] != 'phase'),
+                   key=lambda span: span['wall'], reverse=True)
+    if files:
+        print('slowest:', file=sys.stderr)
+        for span in files[:top]:
+            print('%8.1f ms %8.1f ms cpu %9s -> %9s bytes  %s %s' % (
+                      span['wall'] * 1e3, span['cpu'] * 1e3,
+                      span['args'].get('bytesIn', '-'), span['args'].get('bytesOut', '-'),
+                      span['category'], span['name']),
+                  file=sys.stderr)
+
+    leaves = Counter()
+    for stack, n in recorder.samples.items():
+        leaves[stack.rsplit(';', 1)[-1]] += n
+    total = sum(leaves.values())
+    if total:
+        print('sampled (%d samples):' % total, file=sys.stderr)
+        for leaf, n in leaves.most_common(top):
+            print('%8d %5.1f%%  %s' % (n, n * 100.0 / total, leaf), file=sys.stderr)
+    for name, n in sorted(recorder.counters.items()):
+        print('%8d  %s' % (n, name), file=sys.stderr)
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
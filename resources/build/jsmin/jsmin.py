@@ -30,7 +30,88 @@
 # SOFTWARE.
 # */
 
+import os
+import re
+import sys
+import shutil
+import json
+import glob
+import argparse
 from io import StringIO
+from itertools import accumulate, compress, islice
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+from minifycache import MinifyCache
+from output import saved, writeFile, writeParts
+from mangle import MangleError, mangle, shift, VERSION as MANGLE_VERSION
+from sourcemap import SourceMap, encode, relativeSource
+from depgraph import SplitError, buildGraph, measure, reportSplit, scanFiles, splitBundle
+
+# Identifies the minifier in cache keys. Change it whenever a change to the
+# minifier changes its output.
+VERSION = '2.0'
+
+# Number of characters read from the input stream, and buffered before being
+# written to the output stream, at a time.
+BLOCK_SIZE = 64 * 1024
+
+# Control characters are translated once per block instead of once per call to
+# _get(): carriage returns are dropped and everything else below a space,
+# except linefeed, becomes a space. Tabs and carriage returns are common enough
+# to be replaced directly; the table is only needed for the rest.
+_CONTROL_CHARS = dict((i, ' ') for i in range(32) if i != 10)
+_CONTROL_CHARS[13] = None
+_CONTROL = re.compile('[\000-\010\013-\037]')
+
+# Characters after which a '/' starts a regular expression literal.
+_REGEX_PREFIX = frozenset('(,=:[?!&|;{}\n')
+
+# Punctuation that keeps a linefeed before or after it.
+_NEWLINE_BEFORE = frozenset('{[(+-')
+_NEWLINE_AFTER = frozenset('}])+-"\'')
+
+# Patterns for the fast paths. The input has already been translated, so ' '
+# and linefeed are the only whitespace left.
+_WHITESPACE = re.compile(r'[ \n]*')
+_CODE = r'[^ \n/\'"]+'
+_STRING = r"""'[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'|"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*\""""
+_BLOCK_COMMENT = r'/\*[^*]*\*+(?:[^*/][^*]*\*+)*/' # never backtracks past a */
+_GAP = r'(?:[ \n]|//[^\n]*\n|%s)' % _BLOCK_COMMENT
+_RUN = re.compile(r'(?:%s|%s)(?:%s*(?:%s|%s))*' % (_CODE, _STRING, _GAP, _CODE, _STRING))
+_GAP_OR_STRING = re.compile(r'[ \n/\'"]')
+_STRING_OR_COMMENT = re.compile(r'(%s)|//[^\n]*(\n)|%s' % (_STRING, _BLOCK_COMMENT))
+
+# Within a run, strings are replaced by \003 while whitespace is collapsed. A
+# stretch of whitespace is kept as a linefeed or a space depending on the
+# characters either side of it, following _jsmin().
+_ALNUM_CLASS = r'\w$\\\x7f-\U0010ffff'
+_KEEP_NEWLINE = re.compile(r'(?<=[%s}\])+\-\003]) *\n[ \n]*(?=[%s{\[(+\-])'
+                           % (_ALNUM_CLASS, _ALNUM_CLASS), re.ASCII)
+_KEEP_SPACE = re.compile(r'(?<=[%s]) +(?=[%s])' % (_ALNUM_CLASS, _ALNUM_CLASS), re.ASCII)
+
+# SourceMapMinify turns the linefeeds of a run into \004 markers where the
+# plain version deletes them, so each marks where the next character from its
+# line ends up in the output. A block comment leaves one marker for each line
+# it spans. Markers are treated as part of the whitespace they sit in, and a
+# linefeed that is kept is inserted at the start of its stretch of whitespace
+# rather than replacing it, so that no marker is lost.
+# Both start with what they match rather than with a lookbehind, which the
+# regular expression engine would otherwise try at every position of the run.
+_KEEP_NEWLINE_LINES = re.compile(r'([%s}\])+\-\003])(?=[ \004]*\n[ \n\004]*[%s{\[(+\-])'
+                                 % (_ALNUM_CLASS, _ALNUM_CLASS), re.ASCII)
+_KEEP_SPACE_LINES = re.compile(r' (?<=[%s] )(?=[ \004]*[%s])' % (_ALNUM_CLASS, _ALNUM_CLASS), re.ASCII)
+_INDENT = re.compile(r'\n( *)')
+
+_STRING_BODY = {
+    "'": re.compile(r"[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*"),
+    '"': re.compile(r'[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*'),
+}
+_REGEX_BODY = re.compile(r'[^/\\\n]*(?:\\[\s\S][^/\\\n]*)*')
+
+_ALPHANUM = frozenset('abcdefghijklmnopqrstuvwxyz'
+                      'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                      '0123456789_$\\')
 
 def jsmin(js):
     ins = StringIO(js)
@@ -41,12 +122,36 @@ def jsmin(js):
         str = str[1:]
     return str
 
+def _mask(match, strings):
+    """replacement for _STRING_OR_COMMENT: saves a string and stands in
+       \003 for it, and reduces a comment to the whitespace it counts as.
+    """
+    if match.group(1):
+        strings.append(match.group(1))
+        return '\003'
+    return match.group(2) or ' '
+
+def _maskLines(match, strings):
+    """_mask() for text with line markers: a block comment keeps the markers
+       of the lines it spans.
+    """
+    string = match.group(1)
+    if string:
+        # A line continued within a string starts after its indentation,
+        # which is where _INDENT takes its column from.
+        if '\n' in string:
+            string = _INDENT.sub('\\g<0>\004', string)
+        strings.append(string)
+        return '\003'
+    if match.group(2):
+        return '\n'
+    return ' ' + '\004' * match.group().count('\n')
+
 def isAlphanum(c):
     """return true if the character is a letter, digit, underscore,
            dollar sign, or non-ASCII character.
     """
-    return ((c >= 'a' and c <= 'z') or (c >= '0' and c <= '9') or
-            (c >= 'A' and c <= 'Z') or c == '_' or c == '$' or c == '\\' or (c is not None and ord(c) > 126));
+    return c in _ALPHANUM or (c is not None and c > '~')
 
 class UnterminatedComment(Exception):
     pass
@@ -59,57 +164,168 @@ class UnterminatedRegularExpression(Exception):
 
 class JavascriptMinify(object):
 
-    def _outA(self):
-        self.outstream.write(self.theA)
-    def _outB(self):
-        self.outstream.write(self.theB)
+    def _fill(self):
+        """read the next block from the input stream into the buffer, keeping
+           any unread characters. Control characters are translated here, so
+           the buffer only ever holds what _get() would return. Returns False
+           at EOF.
+        """
+        if self._eof:
+            return False
+        self._filled = True
+        data = self.instream.read(BLOCK_SIZE)
+        if not data:
+            self._eof = True
+            return False
+        data = data.replace('\r', '').replace('\t', ' ')
+        if _CONTROL.search(data):
+            data = data.translate(_CONTROL_CHARS)
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        self._end = len(self._buf)
+        return True
 
     def _get(self):
-        """return the next character from stdin. Watch out for lookahead. If
-           the character is a control character, translate it to a space or
-           linefeed.
+        """return the next character from the input buffer, refilling it
+           when it runs out.
         """
-        c = self.theLookahead
-        self.theLookahead = None
-        if c == None:
-            c = self.instream.read(1)
-        if c >= ' ' or c == '\n':
-            return c
-        if c == '': # EOF
-            return '\000'
-        if c == '\r':
-            return self._get() # Ignore carriage returns
-        return ' '
+        pos = self._pos
+        if pos < self._end:
+            self._pos = pos + 1
+            return self._buf[pos]
+        while self._fill():
+            if self._pos < self._end:
+                return self._get()
+        return '\000' # EOF
 
     def _peek(self):
-        self.theLookahead = self._get()
-        return self.theLookahead
+        """return the next character without consuming it."""
+        c = self._get()
+        if c != '\000':
+            self._pos -= 1
+        return c
 
     def _next(self):
-        """get the next character, excluding comments. peek() is used to see
-           if a '/' is followed by a '/' or '*'.
+        """get the next character, excluding comments. A run of whitespace
+           and comments is collapsed into a single linefeed if it contains
+           one, or else a single space; the state machine treats both the
+           same way it treats the whole run.
         """
-        c = self._get()
+        pos = self._pos
+        if pos < self._end:
+            c = self._buf[pos]
+            self._pos = pos + 1
+        else:
+            c = self._get()
         if c == '/':
-            p = self._peek()
-            if p == '/':
-                c = self._get()
-                while c > '\n':
-                    c = self._get()
+            c = self._comment()
+            if c == '/' or c == '\000':
                 return c
-            if p == '*':
-                c = self._get()
-                while 1:
-                    c = self._get()
-                    if c == '*':
-                        if self._peek() == '/':
-                            self._get()
-                            return ' '
-                    if c == '\000':
-                        raise UnterminatedComment()
-
+        if c == ' ' or c == '\n':
+            while 1:
+                buf = self._buf
+                pos = self._pos
+                end = _WHITESPACE.match(buf, pos).end()
+                if c == ' ' and buf.find('\n', pos, end) != -1:
+                    c = '\n'
+                self._pos = end
+                if end + 1 >= self._end and self._fill():
+                    continue # make sure a possible comment opener is buffered
+                if buf[end:end + 1] != '/':
+                    return c
+                self._pos += 1
+                t = self._comment()
+                if t == '/':
+                    self._pos -= 1 # a division or regular expression
+                    return c
+                if t == '\000':
+                    return c
+                if t == '\n':
+                    c = t
         return c
 
+    def _comment(self):
+        """called after reading a '/'. Skips the comment it starts, returning
+           what it stands for: a space for /* */, the linefeed or EOF that
+           ends a //. If it does not start a comment '/' is returned.
+        """
+        p = self._peek()
+        if p == '/':
+            while 1:
+                i = self._buf.find('\n', self._pos)
+                if i != -1:
+                    self._pos = i + 1
+                    return '\n'
+                self._pos = self._end
+                if not self._fill():
+                    return '\000'
+        if p == '*':
+            # The search starts after the opening '*', so '/*/' is not a
+            # complete comment.
+            self._pos += 1
+            while 1:
+                i = self._buf.find('*/', self._pos)
+                if i != -1:
+                    self._pos = i + 2
+                    return ' '
+                # Keep the last character: it may be a '*' whose '/' is in
+                # the next block.
+                self._pos = max(self._pos, self._end - 1)
+                if not self._fill():
+                    raise UnterminatedComment()
+        return '/'
+
+    def _copy(self, body, close, error):
+        """copy a string or regular expression literal body, which is matched
+           by the body pattern, to the output up to the closing character.
+           The closing character is consumed but not copied.
+        """
+        out = self._out
+        while 1:
+            buf = self._buf
+            pos = body.match(buf, self._pos).end()
+            out.append(buf[self._pos:pos])
+            self._pos = pos
+            if pos < self._end:
+                c = buf[pos]
+                if c == close:
+                    self._pos = pos + 1
+                    return
+                if c == '\n':
+                    raise error()
+                # A backslash at the end of the buffer: its escaped character
+                # is in the next block.
+            if not self._fill():
+                raise error()
+
+    def _copyRun(self):
+        """copy a run of code that follows theA directly, up to the next
+           slash that is not a comment or the last complete token in the
+           buffer. Within such a run every decision _jsmin() would make
+           depends only on the characters either side of each stretch of
+           whitespace and comments, so the run is minified with a few
+           regular expression passes and theA is left holding its last
+           character.
+        """
+        run = _RUN.match(self._buf, self._pos)
+        if not run:
+            return
+        self._pos = run.end()
+        text = run.group()
+        if _GAP_OR_STRING.search(text):
+            strings = []
+            text = _STRING_OR_COMMENT.sub(
+                lambda m: _mask(m, strings), text)
+            text = _KEEP_SPACE.sub('\002', _KEEP_NEWLINE.sub('\001', text))
+            text = text.replace(' ', '').replace('\n', '')
+            text = text.replace('\001', '\n').replace('\002', ' ')
+            if strings:
+                parts = text.split('\003')
+                text = parts[0] + ''.join([s + p for s, p in zip(strings, parts[1:])])
+        self._out.append(self.theA)
+        self._out.append(text[:-1])
+        self.theA = text[-1]
+
     def _action(self, action):
         """do something! What you do is determined by the argument:
            1   Output A. Copy B to A. Get the next B.
@@ -118,45 +334,27 @@ class JavascriptMinify(object):
            action treats a string as a single character. Wow!
            action recognizes a regular expression if it is preceded by ( or , or =.
         """
+        out = self._out
+
         if action <= 1:
-            self._outA()
+            out.append(self.theA)
 
         if action <= 2:
             self.theA = self.theB
             if self.theA == "'" or self.theA == '"':
-                while 1:
-                    self._outA()
-                    self.theA = self._get()
-                    if self.theA == self.theB:
-                        break
-                    if self.theA <= '\n':
-                        raise UnterminatedStringLiteral()
-                    if self.theA == '\\':
-                        self._outA()
-                        self.theA = self._get()
-
+                out.append(self.theA)
+                self._copy(_STRING_BODY[self.theA], self.theA,
+                           UnterminatedStringLiteral)
 
         if action <= 3:
+            if self.theA != ' ' and self.theA != '\n':
+                self._copyRun()
             self.theB = self._next()
-            if self.theB == '/' and (self.theA == '(' or self.theA == ',' or
-                                     self.theA == '=' or self.theA == ':' or
-                                     self.theA == '[' or self.theA == '?' or
-                                     self.theA == '!' or self.theA == '&' or
-                                     self.theA == '|' or self.theA == ';' or
-                                     self.theA == '{' or self.theA == '}' or
-                                     self.theA == '\n'):
-                self._outA()
-                self._outB()
-                while 1:
-                    self.theA = self._get()
-                    if self.theA == '/':
-                        break
-                    elif self.theA == '\\':
-                        self._outA()
-                        self.theA = self._get()
-                    elif self.theA <= '\n':
-                        raise UnterminatedRegularExpression()
-                    self._outA()
+            if self.theB == '/' and self.theA in _REGEX_PREFIX:
+                out.append(self.theA)
+                out.append(self.theB)
+                self._copy(_REGEX_BODY, '/', UnterminatedRegularExpression)
+                self.theA = '/'
                 self.theB = self._next()
 
 
@@ -165,54 +363,748 @@ class JavascriptMinify(object):
            insignificant to JavaScript. Comments will be removed. Tabs will be
            replaced with spaces. Carriage returns will be replaced with linefeeds.
            Most spaces and linefeeds will be removed.
+           Yields the output in blocks: whenever a new input block has been
+           read, what has been minified so far is passed on, so neither the
+           input nor the output is ever held in full.
         """
+        out = self._out
         self.theA = '\n'
         self._action(3)
 
         while self.theA != '\000':
-            if self.theA == ' ':
-                if isAlphanum(self.theB):
+            if self._filled:
+                self._filled = False
+                if out:
+                    yield ''.join(out)
+                    del out[:]
+            a = self.theA
+            b = self.theB
+            if a == ' ':
+                if isAlphanum(b):
                     self._action(1)
                 else:
                     self._action(2)
-            elif self.theA == '\n':
-                if self.theB in ['{', '[', '(', '+', '-']:
+            elif a == '\n':
+                if b in _NEWLINE_BEFORE:
                     self._action(1)
-                elif self.theB == ' ':
+                elif b == ' ':
                     self._action(3)
                 else:
-                    if isAlphanum(self.theB):
+                    if isAlphanum(b):
                         self._action(1)
                     else:
                         self._action(2)
             else:
-                if self.theB == ' ':
-                    if isAlphanum(self.theA):
+                if b == ' ':
+                    if isAlphanum(a):
                         self._action(1)
                     else:
                         self._action(3)
-                elif self.theB == '\n':
-                    if self.theA in ['}', ']', ')', '+', '-', '"', '\'']:
+                elif b == '\n':
+                    if a in _NEWLINE_AFTER:
                         self._action(1)
                     else:
-                        if isAlphanum(self.theA):
+                        if isAlphanum(a):
                             self._action(1)
                         else:
                             self._action(3)
                 else:
                     self._action(1)
 
+        if out:
+            yield ''.join(out)
+
     def minify(self, instream, outstream):
+        for block in self.iterMinify(instream):
+            outstream.write(block)
+
+    def iterMinify(self, instream):
+        """minify what is read from instream, yielding the output in blocks.
+           instream is closed once it has been read.
+        """
         self.instream = instream
-        self.outstream = outstream
         self.theA = '\n'
         self.theB = None
-        self.theLookahead = None
+        self._buf = ''
+        self._pos = 0
+        self._end = 0
+        self._eof = False
+        self._filled = False
+        self._out = []
 
-        self._jsmin()
+        for block in self._jsmin():
+            yield block
         self.instream.close()
 
+class SourceMapMinify(JavascriptMinify):
+    """a JavascriptMinify that also records where the input ends up in the
+       output, for a source map. Once the output has been read, offsets
+       holds the output offset of each mapping, and lines and columns the
+       input line and column it maps to, counted from 0. mappings() returns
+       the three together, the way sourcemap.encode() takes them.
+
+       A mapping is recorded for the first character output from each input
+       line, and for the start of each run and each string or regular
+       expression literal copied on its own. Everything in between belongs
+       to the mapping before it, so lines are exact but columns within a
+       line are approximate.
+
+       Mappings are marked with \004 in the output as it is built, in bulk
+       for the lines of a run, and the marks are taken out again once per
+       block, which is when their output offsets are worked out.
+    """
+
+    def iterMinify(self, instream):
+        self.offsets = []
+        self.lines = []
+        self.columns = []
+        self._markLines = []
+        self._markColumns = []
+        self._line = 0
+        self._counted = 0
+        self._lineStart = 0
+
+        offset = 0
+        carry = ''
+        for block in JavascriptMinify.iterMinify(self, instream):
+            parts = (carry + block).split('\004')
+            block = ''.join(parts)
+            # A mark at the end of a block is for whatever is output next.
+            carry = '\004' if not parts[-1] else ''
+            found = parts[1:]
+            count = len(found)
+            self.offsets.extend(compress(islice(accumulate(map(len, parts), initial=offset), 1, None), found))
+            self.lines.extend(compress(self._markLines[:count], found))
+            self.columns.extend(compress(self._markColumns[:count], found))
+            if carry:
+                count -= 1
+            del self._markLines[:count]
+            del self._markColumns[:count]
+            offset += len(block)
+            yield block
+
+    def mappings(self):
+        """return the mappings recorded for the last input minified."""
+        return self.offsets, self.lines, self.columns
+
+    def _mark(self, pos):
+        """record a mapping to a position in the buffer, for the next
+           character output.
+        """
+        line, col = self._locate(pos)
+        self._markLines.append(line)
+        self._markColumns.append(col)
+
+    def _locate(self, pos):
+        """return the line and column of a position in the buffer. Positions
+           are located in increasing order, so newlines are only counted
+           once.
+        """
+        if pos > self._counted:
+            buf = self._buf
+            n = buf.count('\n', self._counted, pos)
+            if n:
+                self._line += n
+                self._lineStart = buf.rfind('\n', self._counted, pos) + 1
+            self._counted = pos
+        return self._line, pos - self._lineStart
+
+    def _fill(self):
+        pos = self._pos
+        self._locate(pos)
+        if not JavascriptMinify._fill(self):
+            return False
+        self._counted -= pos
+        self._lineStart -= pos
+        return True
+
+    def _copy(self, body, close, error):
+        # The opening quote or slash has just been output.
+        self._mark(self._pos - 1)
+        self._out[-1] = '\004' + self._out[-1]
+        JavascriptMinify._copy(self, body, close, error)
+
+    def _copyRun(self):
+        """_copyRun() that also marks where the run, and each line within
+           it, starts in the output.
+        """
+        start = self._pos
+        run = _RUN.match(self._buf, start)
+        if not run:
+            return
+        self._pos = run.end()
+        text = run.group()
+        out = self._out
+
+        # theA comes straight before the run unless whitespace was deleted
+        # between them.
+        if start > 0 and self._buf[start - 1] == self.theA:
+            self._mark(start - 1)
+            out.append('\004' + self.theA)
+        else:
+            self._mark(start)
+            out.append(self.theA + '\004')
+
+        if '\n' in text:
+            line = self._line + 1
+            columns = list(map(len, _INDENT.findall(text)))
+            self._markColumns.extend(columns)
+            self._markLines.extend(range(line, line + len(columns)))
+            strings = []
+            text = _STRING_OR_COMMENT.sub(
+                lambda m: _maskLines(m, strings), text)
+            text = _KEEP_SPACE_LINES.sub('\002', _KEEP_NEWLINE_LINES.sub('\\1\001', text))
+            text = text.replace(' ', '').replace('\n', '\004')
+        elif _GAP_OR_STRING.search(text):
+            strings = []
+            text = _STRING_OR_COMMENT.sub(
+                lambda m: _mask(m, strings), text)
+            text = _KEEP_SPACE.sub('\002', _KEEP_NEWLINE.sub('\001', text))
+            text = text.replace(' ', '').replace('\n', '')
+        else:
+            out.append(text[:-1])
+            self.theA = text[-1]
+            return
+        text = text.replace('\001', '\n').replace('\002', ' ')
+        if strings:
+            parts = text.split('\003')
+            text = parts[0] + ''.join([s + p for s, p in zip(strings, parts[1:])])
+        out.append(text[:-1])
+        self.theA = text[-1]
+
+class _ChunkReader(object):
+    """a minimal file-like object reading from an iterable of strings. Each
+       read() returns the next non-empty chunk, whatever its size.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def read(self, size=-1):
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return ''
+
+    def close(self):
+        pass
+
+def minifyChunks(chunks):
+    """minify JavaScript given as an iterable of strings, such as an open
+       file or concatFiles(), yielding the output in blocks. Tokens may span
+       chunks. Memory use depends on the block and chunk sizes, not on the
+       size of the whole input. Like minify(), and unlike jsmin(), a
+       leading linefeed is kept.
+    """
+    return JavascriptMinify().iterMinify(_ChunkReader(chunks))
+
+def concatFiles(paths):
+    """yield the contents of several UTF-8 encoded files in blocks, each
+       file ending with a linefeed, the way Ant's
+       <concat fixlastline="true"> joins them.
+    """
+    for path in paths:
+        last = '\n'
+        with open(path, encoding='utf-8') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), ''):
+                yield block
+                last = block[-1]
+        if last != '\n':
+            yield '\n'
+
+def minifySource(source, aggressive=False):
+    """minify a string and return the result. Unlike jsmin() the result
+       keeps its leading linefeed, so it can be passed to joinMinified().
+       In aggressive mode the result is made smaller still by
+       mangle.mangle().
+    """
+    return _minify(source, False, aggressive)[0]
+
+def minifySourceWithMap(source, aggressive=False):
+    """minify a string like minifySource(), and return the result together
+       with its encoded source map mappings, as sourcemap.encode() returns
+       them.
+    """
+    text, encoded, size = _minify(source, True, aggressive)
+    return text, encoded
+
+def _minify(source, sourceMap, aggressive):
+    """minify a string and return the result, its encoded source map
+       mappings if sourceMap is set, and the size in bytes of the output of
+       jsmin alone. In aggressive mode the output of jsmin goes through
+       mangle.mangle(), unless it is something mangle() cannot read, and
+       the mappings are moved along with the text.
+    """
+    minifier = SourceMapMinify() if sourceMap else JavascriptMinify()
+    outs = StringIO()
+    minifier.minify(StringIO(source), outs)
+    text = outs.getvalue()
+    size = len(text.encode('utf-8'))
+    if sourceMap:
+        offsets, lines, columns = minifier.mappings()
+
+    if aggressive:
+        try:
+            text, edits = mangle(text)
+        except MangleError:
+            edits = None
+        if sourceMap and edits:
+            offsets = shift(offsets, edits)
+
+    if instrument.enabled():
+        instrument.annotate(bytesIn=len(source.encode('utf-8')),
+                            bytesOut=len(text.encode('utf-8')))
+    if not sourceMap:
+        return text, None, size
+    return text, encode((offsets, lines, columns), text), size
+
+def minifyFile(path):
+    """minify a single UTF-8 encoded file and return the result."""
+    with open(path, 'rb') as f:
+        return minifySource(_decode(f.read()))
+
+def _decode(data):
+    """decode the contents of a source file, translating line endings the
+       way reading it in text mode would.
+    """
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+def joinMinified(outputs):
+    """concatenate the minified output of several files so that the result is
+       the same as minifying the files as one stream, each ending with a
+       linefeed, the way Ant's <concat fixlastline="true"> joins them.
+
+       Every file is minified as if it started after a linefeed, so its
+       output starts with one whenever the file starts with a character
+       that keeps it. In the joined stream that linefeed is only kept if
+       the character before it, the last one output for the previous files,
+       keeps it too. This holds as long as no token spans two files and no
+       file starts with a regular expression literal.
+    """
+    return ''.join(_trimMinified(outputs))
+
+def _trimMinified(outputs):
+    """yield the minified output of each file the way joinMinified() joins
+       it.
+    """
+    last = '\n'
+    for text in outputs:
+        if (text[:1] == '\n' and last != '\n' and not isAlphanum(last) and
+                last not in _NEWLINE_AFTER):
+            text = text[1:]
+        yield text
+        if text:
+            last = text[-1]
+
+def minifyFiles(paths, jobs=None, cache=None, sourceMap=None, aggressive=False):
+    """minify several files in a pool of worker processes and return their
+       output joined in the original order. jobs defaults to the number of
+       CPUs; with a single job no pool is started. If a MinifyCache is given,
+       only files whose contents are not in it are minified.
+
+       If sourceMap is the path the output's source map will be written to,
+       a SourceMap for the output is returned along with it.
+
+       In aggressive mode each file is also shortened by mangle.mangle(),
+       and the bytes that saved are reported on stderr.
+    """
+    results, maps, sizes = _minifyAll(_readSources(paths), jobs, cache,
+                                      sourceMap is not None, aggressive)
+    if aggressive:
+        _reportSavings(paths, results, sizes)
+    text = joinMinified(results[path] for path in paths)
+    if sourceMap is None:
+        return text
+    return text, _sourceMap(None, sourceMap, '', paths, results, maps)
+
+def buildBundles(manifest, jobs=None, cache=None, aggressive=None, names=None):
+    """write every bundle described by a JSON manifest. Each source file is
+       minified once, however many bundles include it. The manifest looks
+       like:
+
+         {
+             "root": "../..",
+             "bundles": [
+                 {
+                     "name": "web",
+                     "header": "resources/build/concat/Header.js",
+                     "concat": "resources/compressed/helioviewer.js",
+                     "output": "resources/compressed/helioviewer.min.js",
+                     "sourceMap": "resources/compressed/helioviewer.min.js.map",
+                     "files": ["resources/js/UI/TileLayerData.js", ...]
+                 }
+             ]
+         }
+
+       Paths are relative to root, which is relative to the manifest. The
+       header is prepended to the minified output as is, and concat, if
+       given, receives the unminified concatenation of the files. If
+       sourceMap is given, a source map of the minified output is written
+       there and referred to at the end of the output.
+
+       If the manifest has an "assets" path next to "root", each output is
+       also written under a name holding the hash of its contents, such as
+       helioviewer.min.0123456789abcdef.js, which can be cached for good.
+       The assets file maps each output to that name, for index.php; see
+       recordAssets().
+
+       If the manifest has "aggressive": true next to "root", or aggressive
+       is set, every file is also shortened by mangle.mangle(), and the
+       bytes that saved are reported on stderr.
+
+       A bundle with "chunks" is split into the core, written to its output,
+       and chunks, each written to its own output and source map with the
+       same header, and the sizes are reported on stderr; see depgraph.py.
+       Raises depgraph.SplitError if the bundle cannot be split that way.
+
+       If names is given, only the bundles of those names, chunks included,
+       are read and written; the entries of the others in the assets file
+       are kept.
+    """
+    with open(manifest, encoding='utf-8') as f:
+        spec = json.load(f)
+    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(manifest)),
+                                         spec.get('root', '.')))
+
+    bundles = [bundle for bundle in spec['bundles']
+               if names is None or bundle['name'] in names]
+    if aggressive is None:
+        aggressive = spec.get('aggressive', False)
+    for bundle in bundles:
+        bundle['files'] = [os.path.join(root, name) for name in bundle['files']]
+
+    assets = {}
+
+    paths = [path for bundle in bundles for path in bundle['files']]
+    with instrument.span('read sources', 'io'):
+        sources = _readSources(paths)
+        instrument.annotate(bytesIn=sum(len(data) for data in sources.values()))
+    results, maps, sizes = _minifyAll(sources, jobs, cache,
+                                      any('sourceMap' in bundle for bundle in bundles),
+                                      aggressive)
+    if aggressive:
+        _reportSavings(list(dict.fromkeys(paths)), results, sizes, root)
+
+    outputs = []
+    for bundle in bundles:
+        if 'chunks' in bundle:
+            with instrument.span('split %s' % bundle['name'], 'split'):
+                outputs.extend(_splitBundle(bundle, results, root, cache))
+        else:
+            outputs.append(bundle)
+
+    for bundle in outputs:
+        with instrument.span(bundle['output'], 'write'):
+            files = bundle['files']
+            if 'concat' in bundle:
+                writeFile(os.path.join(root, bundle['concat']),
+                          ''.join(_fixLastLine(_decode(sources[path])) for path in files))
+
+            header = ''
+            if 'header' in bundle:
+                with open(os.path.join(root, bundle['header']), 'rb') as f:
+                    header = _decode(f.read())
+
+            output = os.path.join(root, bundle['output'])
+            parts = [header]
+            parts.extend(_trimMinified(results[path] for path in files))
+            if 'sourceMap' in bundle:
+                mapPath = os.path.join(root, bundle['sourceMap'])
+                writeFile(mapPath, _sourceMap(output, mapPath, header, files,
+                                              results, maps).toJSON())
+                last = next((part for part in reversed(parts) if part), '')
+                parts.append(_sourceMappingURL(last, output, mapPath))
+            digest = writeParts(output, parts)
+            if instrument.enabled():
+                instrument.annotate(bytesOut=os.path.getsize(output))
+
+            if 'assets' in spec:
+                assets[bundle['output']] = versionOutput(output, digest, root)
+
+    if 'assets' in spec:
+        recordAssets(os.path.join(root, spec['assets']), root, assets)
+
+def _splitBundle(bundle, results, root, cache=None):
+    """return the core of a bundle with "chunks", and its chunks, as bundles
+       to write, and report their sizes on stderr.
+    """
+    paths = list(dict.fromkeys(bundle['files']))
+    declared, used = scanFiles(paths, results, cache)
+    core, split, deferred = splitBundle(paths, declared, buildGraph(paths, declared, used),
+                                        bundle['chunks'])
+
+    # A file listed twice is kept twice, as in the whole bundle
+    core = set(core)
+    bundles = [dict((key, value) for key, value in bundle.items() if key != 'chunks')]
+    bundles[0]['files'] = [path for path in bundle['files'] if path in core]
+
+    sizes = dict((name, measure(joinMinified(results[path] for path in files)))
+                 for name, files in split.items())
+    sizes[None] = measure(joinMinified(results[path] for path in bundles[0]['files']))
+    sizes['bundle'] = measure(joinMinified(results[path] for path in bundle['files']))
+    print('%s:' % bundle['name'], file=sys.stderr)
+    reportSplit(bundles[0]['files'], split, deferred, sizes, root)
+
+    for name, chunk in bundle['chunks'].items():
+        part = dict((key, value) for key, value in chunk.items() if key != 'entries')
+        part['name'] = '%s-%s' % (bundle['name'], name)
+        if 'header' in bundle:
+            part['header'] = bundle['header']
+        part['files'] = split[name]
+        bundles.append(part)
+    return bundles
+
+def _sourceMap(output, mapPath, header, paths, results, maps):
+    """return the SourceMap of header followed by the joined output of the
+       files in paths. Sources are given relative to the map.
+    """
+    sourceMap = SourceMap(output and os.path.basename(output))
+    line = header.count('\n')
+    column = len(header) - header.rfind('\n') - 1
+    for path, text in zip(paths, _trimMinified(results[path] for path in paths)):
+        encoded = maps[path]
+        if len(text) < len(results[path]):
+            # The leading linefeed was dropped, and with it the first line of
+            # the mappings, which is always empty.
+            mappings, (lastLine, lastColumn, inLine, inColumn) = encoded
+            encoded = mappings[1:], (lastLine - 1, lastColumn, inLine, inColumn)
+        sourceMap.add(relativeSource(path, mapPath), encoded, line, column)
+        newlines = text.count('\n')
+        if newlines:
+            line += newlines
+            column = len(text) - text.rfind('\n') - 1
+        else:
+            column += len(text)
+    return sourceMap
+
+def _sourceMappingURL(text, output, mapPath):
+    """return the comment pointing to its source map to append to the
+       minified text. Only the end of the text is looked at.
+    """
+    comment = '//# sourceMappingURL=%s\n' % relativeSource(mapPath, output)
+    if text and not text.endswith('\n'):
+        comment = '\n' + comment
+    return comment
+
+# Number of hex digits of the SHA-256 of an output kept in its hashed name
+HASH_LENGTH = 16
+
+def _hashedName(path, digest):
+    """return the content-hashed name of an output."""
+    base, ext = os.path.splitext(path)
+    return '%s.%s%s' % (base, digest[:HASH_LENGTH], ext)
+
+def _linkFile(path, hashed):
+    """make hashed a copy of path, as a hard link where possible."""
+    tmp = hashed + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(path, tmp)
+    except OSError:
+        shutil.copyfile(path, tmp)
+    os.replace(tmp, hashed)
+
+def versionOutput(output, digest, root):
+    """write a copy of an output under its content-hashed name, and return
+       that name relative to root, for the assets file."""
+    hashed = _hashedName(output, digest)
+    _linkFile(output, hashed)
+    return os.path.relpath(hashed, root).replace(os.sep, '/')
+
+def recordAssets(path, root, assets):
+    """write the content-hashed names of outputs, as returned by
+       versionOutput(), to the assets file, and remove the hashed copies of
+       those outputs from before the previous build. The entries of outputs
+       written by other build stages are kept."""
+    previous = _readAssets(path)
+    merged = dict(previous)
+    merged.update(assets)
+    writeFile(path, json.dumps(merged, indent=4, sort_keys=True) + '\n')
+    for name, hashed in assets.items():
+        _removeStale(os.path.join(root, name), [hashed, previous.get(name)], root)
+
+def _readAssets(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def _removeStale(output, keep, root):
+    """remove the hashed copies of an output, and their compressed
+       siblings, other than those in keep.
+    """
+    base, ext = os.path.splitext(output)
+    pattern = re.compile(re.escape(os.path.basename(base)) +
+                         r'\.[0-9a-f]{%d}' % HASH_LENGTH + re.escape(ext) +
+                         r'(?:\.gz|\.br)?$')
+    keep = set(os.path.join(root, name) for name in keep if name)
+    for path in glob.glob(glob.escape(base) + '.*' + ext + '*'):
+        name = re.sub(r'\.(?:gz|br)$', '', path)
+        if pattern.match(os.path.basename(path)) and name not in keep:
+            os.remove(path)
+
+def _readSources(paths):
+    """return the contents of each distinct file, as bytes."""
+    sources = {}
+    for path in set(paths):
+        with open(path, 'rb') as f:
+            sources[path] = f.read()
+    return sources
+
+def _minifyAll(sources, jobs, cache, sourceMaps=False, aggressive=False):
+    """minify the sources read by _readSources(), largest first so the pool
+       stays busy, and return the output for each path. The encoded source
+       map mappings for each path are returned too, if sourceMaps is set;
+       they are cached under the output's key with '-map' appended.
+
+       In aggressive mode the size of the output of jsmin alone is returned
+       for each path as well, cached with '-size' appended, and the keys
+       have '-aggressive' and mangle.VERSION appended, so the two modes
+       never share entries.
+    """
+    results = {}
+    maps = {}
+    sizes = {}
+    keys = {}
+    if cache is not None:
+        for path, data in sources.items():
+            keys[path] = cache.key(data)
+            if aggressive:
+                keys[path] += '-aggressive' + MANGLE_VERSION
+            text = cache.get(keys[path])
+            if text is not None and sourceMaps:
+                encoded = cache.get(keys[path] + '-map')
+                if encoded is None:
+                    continue
+                maps[path] = tuple(json.loads(encoded))
+            if text is not None and aggressive:
+                size = cache.get(keys[path] + '-size')
+                if size is None:
+                    continue
+                sizes[path] = int(size)
+            if text is not None:
+                results[path] = text
+
+    todo = sorted([path for path in sources if path not in results],
+                  key=lambda path: len(sources[path]), reverse=True)
+    instrument.count('jsmin cache hits', len(results))
+    minify = instrument.wrap(_minify, 'minify')
+    if jobs == 1 or len(todo) <= 1:
+        done = dict((path, minify(_decode(sources[path]), sourceMaps, aggressive))
+                    for path in todo)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = dict((path, executor.submit(minify, _decode(sources[path]),
+                                                  sourceMaps, aggressive))
+                           for path in todo)
+            done = dict((path, future.result()) for path, future in futures.items())
+    done = dict((path, instrument.unwrap(minify, value, path)) for path, value in done.items())
+
+    for path, (text, encoded, size) in done.items():
+        results[path] = text
+        if sourceMaps:
+            maps[path] = encoded
+        if aggressive:
+            sizes[path] = size
+
+    if cache is not None and todo:
+        for path in todo:
+            cache.put(keys[path], results[path])
+            if sourceMaps:
+                cache.put(keys[path] + '-map', json.dumps(maps[path]))
+            if aggressive:
+                cache.put(keys[path] + '-size', str(sizes[path]))
+        cache.prune()
+
+    return results, maps, sizes
+
+def _reportSavings(paths, results, sizes, root=None):
+    """print the size of each file as minified by jsmin alone and in
+       aggressive mode, and the totals, to stderr. Paths are shown relative
+       to root, if given.
+    """
+    before = after = 0
+    for path in paths:
+        size = len(results[path].encode('utf-8'))
+        print('%8d -> %8d bytes %6.1f%%  %s' % (
+                  sizes[path], size, saved(sizes[path], size),
+                  os.path.relpath(path, root) if root else path),
+              file=sys.stderr)
+        before += sizes[path]
+        after += size
+    print('%8d -> %8d bytes %6.1f%%  total, %d bytes saved' % (
+              before, after, saved(before, after), before - after),
+          file=sys.stderr)
+
+def _fixLastLine(text):
+    if text and not text.endswith('\n'):
+        return text + '\n'
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Minify JavaScript. Reads from stdin unless files or a '
+                    'manifest are given, in which case they are minified in '
+                    'parallel and the output is the same as for their '
+                    'concatenation.')
+    parser.add_argument('files', nargs='*', help='JavaScript files to minify')
+    parser.add_argument('-m', '--manifest',
+                        help='JSON manifest describing bundles to build; see '
+                             'buildBundles()')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('-o', '--output',
+                        help='file to write to instead of stdout')
+    parser.add_argument('--cache-dir',
+                        help='directory in which to cache the output for each '
+                             'file, so unchanged files are not minified again')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='maximum size of the cache in MB (default: 64)')
+    parser.add_argument('--source-map',
+                        help='file to write a source map of the output to; '
+                             'requires files and --output')
+    parser.add_argument('--aggressive', action='store_true', default=None,
+                        help='also rename local variables and drop redundant '
+                             'semicolons and linefeeds, reporting the bytes '
+                             'saved for each file; see mangle.py')
+    args = parser.parse_args()
+
+    if args.source_map and not (args.files and args.output):
+        parser.error('--source-map requires files and --output')
+
+    cache = None
+    if args.cache_dir:
+        cache = MinifyCache(args.cache_dir, VERSION, args.cache_size * 1024 * 1024)
+
+    if args.manifest:
+        try:
+            buildBundles(args.manifest, args.jobs, cache, args.aggressive)
+        except SplitError as e:
+            sys.exit(str(e))
+        return
+
+    if args.output:
+        outstream = open(args.output, 'w', encoding='utf-8')
+    else:
+        outstream = sys.stdout
+
+    if args.source_map:
+        text, sourceMap = minifyFiles(args.files, args.jobs, cache, args.source_map,
+                                      bool(args.aggressive))
+        sourceMap.file = os.path.basename(args.output)
+        writeFile(args.source_map, sourceMap.toJSON())
+        outstream.write(text + _sourceMappingURL(text, args.output, args.source_map))
+    elif args.files:
+        outstream.write(minifyFiles(args.files, args.jobs, cache,
+                                    aggressive=bool(args.aggressive)))
+    elif args.aggressive:
+        outstream.write(minifySource(sys.stdin.read(), True))
+    else:
+        JavascriptMinify().minify(sys.stdin, outstream)
+
+    outstream.close()
+
 if __name__ == '__main__':
-    import sys
-    jsm = JavascriptMinify()
-    jsm.minify(sys.stdin, sys.stdout)
+    main()
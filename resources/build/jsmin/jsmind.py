@@ -0,0 +1,334 @@
+#!/usr/bin/python3
+"""
+Minifier daemon
+
+Keeps the minifier resident for editors and watch-mode rebuilds, so that
+neither pays for starting Python, importing the minifier and reading the
+cache again. The minified output of each file, its source map and its
+globals stay in a MemoryCache, keyed by the SHA-256 of its contents as in
+minifycache.py, so a rebuild only minifies the files that changed and only
+rewrites the bundles that include them.
+
+The daemon listens on a Unix socket, by default next to the cache in
+resources/compressed/.cache, for requests of one line of JSON each, and
+answers each with one line of JSON:
+
+  {"op": "minify", "source": "...", "aggressive": false}  {"output": "..."}
+  {"op": "minify", "path": "/path/to/File.js"}            {"output": "..."}
+  {"op": "build", "bundles": ["web"]}                     {"bundles": [...], "seconds": ...}
+  {"op": "stats"}                                         {"hits": ..., "misses": ..., ...}
+  {"op": "stop"}                                          {}
+
+"bundles" may be left out to build them all. A request that fails is
+answered with {"error": "..."}.
+
+With --watch, the files, headers and manifest of the bundles are also
+polled every --interval milliseconds, and the bundles including a file that
+changed are rebuilt, all of them if the manifest did. The time each rebuild
+took is reported on stderr.
+
+Example usage:
+
+  ./jsmind.py serve --manifest ../bundles.json --watch &
+  ./jsmind.py minify ../../js/Utility/Config.js
+  ./jsmind.py minify --aggressive < ../../js/Utility/Config.js
+  ./jsmind.py build --bundle web
+  ./jsmind.py stats
+  ./jsmind.py stop
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+
+from depgraph import SplitError
+from jsmin import (VERSION, UnterminatedComment, UnterminatedRegularExpression,
+                   UnterminatedStringLiteral, _decode, buildBundles, joinMinified,
+                   minifySource)
+from mangle import VERSION as MANGLE_VERSION
+from minifycache import DEFAULT_MAX_SIZE, MemoryCache, MinifyCache
+
+SOCKET = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      '..', '..', 'compressed', '.cache', 'jsmind.sock'))
+
+# Time between polls of the watched files, in seconds
+DEFAULT_INTERVAL = 0.05
+
+class Daemon(object):
+    """the minifier and the cache of a manifest, shared by the requests and
+       the watcher. Requests are served one at a time."""
+
+    def __init__(self, manifest, cache, jobs=None, aggressive=None):
+        self.manifest = os.path.abspath(manifest)
+        self.cache = cache
+        self.jobs = jobs
+        self.aggressive = aggressive
+        self.builds = 0
+        self.lastBuild = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def minify(self, source, aggressive=False):
+        """return the minified output of source, given as bytes or text, from the
+           cache if it is there."""
+        if not isinstance(source, bytes):
+            source = source.encode('utf-8')
+        key = self.cache.key(source)
+        if aggressive:
+            key += '-aggressive' + MANGLE_VERSION
+        with self.lock:
+            text = self.cache.get(key)
+            if text is None:
+                text = minifySource(_decode(source), aggressive)
+                self.cache.put(key, text)
+            return text
+
+    def build(self, names=None):
+        """build the bundles of those names, or all of them, and return the
+           seconds it took. Only a full build starts a pool of workers, as a
+           rebuild minifies no more than the files that changed."""
+        with self.lock:
+            start = time.perf_counter()
+            buildBundles(self.manifest, self.jobs if names is None else 1,
+                         self.cache, self.aggressive, names)
+            self.lastBuild = time.perf_counter() - start
+            self.builds += 1
+            return self.lastBuild
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.cache.hits, 'misses': self.cache.misses,
+                    'entries': len(self.cache), 'size': self.cache.size,
+                    'builds': self.builds, 'lastBuild': self.lastBuild}
+
+    def handle(self, request):
+        """answer a request, as a dict."""
+        op = request.get('op')
+        if op == 'minify':
+            if 'path' in request:
+                with open(request['path'], 'rb') as f:
+                    source = f.read()
+            else:
+                source = request['source']
+            return {'output': self.minify(source, bool(request.get('aggressive')))}
+        elif op == 'build':
+            names = request.get('bundles')
+            return {'bundles': names or self.bundles(), 'seconds': self.build(names)}
+        elif op == 'stats':
+            return self.stats()
+        elif op == 'stop':
+            self.stopped.set()
+            return {}
+        raise ValueError('unknown op %r' % op)
+
+    def bundles(self):
+        with open(self.manifest, encoding='utf-8') as f:
+            return [bundle['name'] for bundle in json.load(f)['bundles']]
+
+    def watched(self):
+        """return the names of the bundles including each file, by path,
+           the manifest included, with no names."""
+        with open(self.manifest, encoding='utf-8') as f:
+            spec = json.load(f)
+        root = os.path.join(os.path.dirname(self.manifest), spec.get('root', '.'))
+
+        files = {self.manifest: set()}
+        for bundle in spec['bundles']:
+            for name in bundle['files'] + ([bundle['header']] if 'header' in bundle else []):
+                path = os.path.normpath(os.path.join(root, name))
+                files.setdefault(path, set()).add(bundle['name'])
+        return files
+
+    def watch(self, interval=DEFAULT_INTERVAL):
+        """poll the watched files every interval seconds until stopped, and
+           rebuild the bundles including those that changed."""
+        files = self.watched()
+        before = _snapshot(files)
+        while not self.stopped.wait(interval):
+            after = _snapshot(files)
+            changed = [path for path in files if before[path] != after[path]]
+            before = after
+            if not changed:
+                continue
+
+            names = set()
+            for path in changed:
+                names.update(files[path])
+            try:
+                if self.manifest in changed:
+                    files = self.watched()
+                    before = _snapshot(files)
+                    names = None
+                seconds = self.build(names and sorted(names))
+            except (IOError, OSError, ValueError, KeyError, SplitError, UnterminatedComment,
+                    UnterminatedRegularExpression, UnterminatedStringLiteral) as e:
+                print('jsmind: %s: %s' % (type(e).__name__, e), file=sys.stderr)
+                continue
+            print('rebuilt %s in %.1f ms: %s' % (
+                      ', '.join(sorted(names)) if names else 'everything', seconds * 1e3,
+                      ', '.join(os.path.basename(path) for path in changed)),
+                  file=sys.stderr)
+
+def _snapshot(files):
+    """return the modification time and size of each file, or None for a
+       file that is missing."""
+    snapshot = {}
+    for path in files:
+        try:
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            snapshot[path] = None
+    return snapshot
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        for line in self.rfile:
+            try:
+                response = daemon.handle(json.loads(line.decode('utf-8')))
+            except Exception as e:
+                response = {'error': '%s: %s' % (type(e).__name__, e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            if daemon.stopped.is_set():
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(daemon, path=SOCKET, watch=False, interval=DEFAULT_INTERVAL):
+    """build every bundle, then answer requests on the Unix socket at path,
+       and watch the files of the bundles if asked to, until a stop
+       request."""
+    if os.path.exists(path):
+        try:
+            request({'op': 'stats'}, path)
+        except OSError:
+            os.remove(path)
+        else:
+            raise OSError('a daemon is already listening on %s' % path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    print('built everything in %.1f ms' % (daemon.build() * 1e3), file=sys.stderr)
+    server = _Server(path, _Handler)
+    server.daemon = daemon
+    try:
+        if watch:
+            watcher = threading.Thread(target=daemon.watch, args=(interval,))
+            watcher.daemon = True
+            watcher.start()
+        print('listening on %s' % path, file=sys.stderr)
+        server.serve_forever()
+    finally:
+        daemon.stopped.set()
+        server.server_close()
+        os.remove(path)
+
+def request(message, path=SOCKET):
+    """send a request to the daemon listening at path and return its
+       answer. Raises OSError if no daemon is listening."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise OSError('no answer from %s' % path)
+    return json.loads(line.decode('utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Keep the minifier resident, answering minify and build '
+                    'requests on a Unix socket and rebuilding the bundles of '
+                    'a manifest as their files change.')
+    parser.add_argument('--socket', default=SOCKET,
+                        help='Unix socket of the daemon (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serveCommand = commands.add_parser('serve', help='build every bundle, then run the daemon')
+    serveCommand.add_argument('-m', '--manifest', required=True,
+                        help='JSON manifest describing bundles to build; see '
+                             'jsmin.buildBundles()')
+    serveCommand.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes for a full build '
+                             '(default: CPU count)')
+    serveCommand.add_argument('--cache-dir',
+                        help='directory of an on-disk cache to read entries '
+                             'missing from memory from and write them to')
+    serveCommand.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help='maximum size of the cache in MB (default: %(default)s)')
+    serveCommand.add_argument('--aggressive', action='store_true', default=None,
+                        help='build the bundles in aggressive mode; see mangle.py')
+    serveCommand.add_argument('-w', '--watch', action='store_true',
+                        help='rebuild the bundles including a file when it changes')
+    serveCommand.add_argument('--interval', type=float, default=DEFAULT_INTERVAL * 1e3,
+                        metavar='MS',
+                        help='time between polls of the files when watching '
+                             '(default: %(default)g)')
+
+    minifyCommand = commands.add_parser('minify', help='minify files, or stdin, with the daemon')
+    minifyCommand.add_argument('files', nargs='*', help='JavaScript files to minify')
+    minifyCommand.add_argument('--aggressive', action='store_true',
+                        help='also rename local variables; see mangle.py')
+    buildCommand = commands.add_parser('build', help='have the daemon build bundles')
+    buildCommand.add_argument('-b', '--bundle', action='append', dest='bundles',
+                       help='bundle to build; may be given more than once '
+                            '(default: all)')
+    commands.add_parser('stats', help='show the cache statistics of the daemon')
+    commands.add_parser('stop', help='stop the daemon')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        size = args.cache_size * 1024 * 1024
+        backing = None
+        if args.cache_dir:
+            backing = MinifyCache(args.cache_dir, VERSION, size)
+        daemon = Daemon(args.manifest, MemoryCache(VERSION, size, backing),
+                        args.jobs, args.aggressive)
+        try:
+            serve(daemon, args.socket, args.watch, args.interval / 1e3)
+        except (OSError, SplitError) as e:
+            sys.exit(str(e))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.command == 'minify':
+        if args.files:
+            messages = [{'op': 'minify', 'path': os.path.abspath(path),
+                         'aggressive': args.aggressive} for path in args.files]
+        else:
+            messages = [{'op': 'minify', 'source': sys.stdin.read(),
+                         'aggressive': args.aggressive}]
+    elif args.command == 'build':
+        messages = [{'op': 'build', 'bundles': args.bundles}]
+    else:
+        messages = [{'op': args.command}]
+
+    try:
+        responses = [request(message, args.socket) for message in messages]
+    except OSError as e:
+        sys.exit('no daemon listening on %s: %s' % (args.socket, e))
+    for response in responses:
+        if 'error' in response:
+            sys.exit(response['error'])
+
+    if args.command == 'minify':
+        sys.stdout.write(joinMinified(response['output'] for response in responses))
+    elif args.command == 'build':
+        print('built %s in %.1f ms' % (', '.join(responses[0]['bundles']),
+                                      responses[0]['seconds'] * 1e3),
+              file=sys.stderr)
+    elif args.command == 'stats':
+        print(json.dumps(responses[0], indent=4))
+
+if __name__ == '__main__':
+    main()
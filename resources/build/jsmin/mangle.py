@@ -0,0 +1,953 @@
+"""
+Aggressive minification
+
+mangle() takes the output of jsmin and makes it smaller still:
+
+  - names local to a function are renamed to the shortest names that are
+    free where they are used;
+  - semicolons and linefeeds that jsmin keeps but the grammar does not need
+    are taken out.
+
+It works on tokens, following just enough of the JavaScript grammar to know
+where each function starts and ends, which names it declares and which
+names are property names rather than variables. Wherever that is not enough
+to be sure, names are left alone:
+
+  - nothing is renamed in a file that uses eval or with;
+  - names written as object shorthand, such as {a, b} or the patterns of
+    destructuring, are never renamed, as they double as property names;
+  - function and class names are kept, as their name property may be read;
+  - a let, const, class or catch binding is only renamed if it is never
+    used outside the blocks declaring it;
+  - new names never clash with a name that is not renamed, or with a new
+    name given in an enclosing function.
+
+Arrow functions are not scopes of their own here, so their parameters are
+only renamed along with a binding of the same name in the enclosing
+function. Top-level names are global and shared between files, so they are
+never renamed.
+"""
+import re
+from bisect import bisect_right
+from itertools import product
+
+# Identifies the renaming and collapsing rules, for caches of mangled output
+VERSION = '2'
+
+class MangleError(Exception):
+    pass
+
+_SPACE = re.compile(r'[ \t\f\v\r\u00a0\ufeff]*')
+_NAME = re.compile(r'[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*')
+_NUMBER = re.compile(r'0[xXoObB][\da-fA-F_]+n?|'
+                     r'(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?n?')
+_STRING = re.compile(r"""'(?:[^'\\\n]|\\[\s\S])*'|"(?:[^"\\\n]|\\[\s\S])*\"""")
+_REGEX = re.compile(r'/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[\w$]*')
+_TEMPLATE = re.compile(r'(?:[^`\\$]|\\[\s\S]|\$(?!\{))*(?:`|\$\{)')
+_PUNCTUATOR = re.compile(r'>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|&&=|\|\|=|\?\?=|'
+                         r'=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.(?!\d)|\+\+|--|'
+                         r'[-+*/%&|^]=|\*\*|<<|>>|[{}()\[\];,<>+\-*/%&|^!~?:=.@]')
+
+# Token kinds
+NAME, PRIVATE, NUMBER, STRING, REGEX, TEMPLATE, PUNCTUATOR, NEWLINE = range(8)
+
+_KEYWORDS = frozenset('''
+    break case catch class const continue debugger default delete do else
+    enum export extends false finally for function if import in instanceof
+    new null return super switch this throw true try typeof var void while
+    with yield let static implements package protected interface private
+    public await async get set of
+'''.split())
+
+# Keywords after which a slash starts a regular expression
+_REGEX_KEYWORDS = frozenset('''
+    return typeof instanceof in of new delete void throw case do else yield
+    await
+'''.split())
+
+# Keywords that end an expression like a name does
+_VALUE_KEYWORDS = frozenset(('this', 'super', 'null', 'true', 'false'))
+
+# Keywords a linefeed may not follow inside a statement
+_RESTRICTED = frozenset('''
+    return throw break continue yield async let get set static await
+'''.split())
+
+# Keywords that are followed by a block
+_BLOCK_KEYWORDS = frozenset(('else', 'do', 'try', 'finally'))
+
+# Keywords followed by a parenthesised head and a statement
+_CONTROL_KEYWORDS = frozenset(('if', 'while', 'for', 'with', 'switch', 'catch'))
+
+# Modifiers in front of a property or method name
+_MODIFIERS = frozenset(('get', 'set', 'async', 'static'))
+
+# Operators written as names
+_OPERATOR_KEYWORDS = frozenset(('in', 'instanceof', 'of'))
+
+# Kinds of brace that enclose statements, and after which a statement ends
+_STATEMENT_BRACES = frozenset(('block', 'switch', 'body', 'arrow'))
+
+_DIGITS = frozenset('0123456789')
+
+_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_ALPHANUM = _ALPHABET + '0123456789_$'
+
+def _names():
+    """generate the names new names are picked from, shortest first."""
+    for c in _ALPHABET + '_$':
+        yield c
+    size = 2
+    while True:
+        for first in _ALPHABET:
+            for rest in product(_ALPHANUM, repeat=size - 1):
+                yield first + ''.join(rest)
+        size += 1
+
+def mangle(text, rename=True, collapse=True):
+    """return text, the output of jsmin, with function-local names renamed
+       and redundant semicolons and linefeeds removed, together with the
+       edits made: a list of (start, end, replacement) in text, in order.
+       Raises MangleError for text it cannot tokenize.
+    """
+    parser = _Parser(text)
+    parser.parse()
+
+    edits = []
+    if rename and not parser.unsafe:
+        edits.extend(parser.renames())
+    if collapse:
+        edits.extend((start, end, '') for start, end in parser.deletions)
+    edits.sort()
+
+    parts = []
+    pos = 0
+    for start, end, replacement in edits:
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts), edits
+
+def globalNames(text):
+    """return the names text, the output of jsmin, declares outside any
+       function, and the other names it uses outside any binding of its own:
+       the globals it defines for other files, and those it takes from
+       them. Raises MangleError for text it cannot tokenize.
+    """
+    parser = _Parser(text)
+    parser.parse()
+    declared = set(parser.root.bindings)
+    used = set(parser.values[index] for index, binding in parser.resolve()
+               if binding is None)
+    return declared, used - declared
+
+def shift(offsets, edits):
+    """return offsets into the text given to mangle() moved to where they
+       are in its output. An offset into text that was removed moves to
+       where that text was.
+    """
+    starts = [start for start, end, replacement in edits]
+    deltas = [0]
+    for start, end, replacement in edits:
+        deltas.append(deltas[-1] + len(replacement) - (end - start))
+
+    shifted = []
+    for offset in offsets:
+        i = bisect_right(starts, offset)
+        if i and offset < edits[i - 1][1]:
+            # Inside an edit: keep to its start
+            shifted.append(edits[i - 1][0] + deltas[i - 1])
+        else:
+            shifted.append(offset + deltas[i])
+    return shifted
+
+class _Scope(object):
+    """a function, and the names it declares."""
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.children = []
+        self.bindings = {}
+        # Index of the brace opening the body, once it has been read
+        self.body = None
+        if parent is not None:
+            parent.children.append(self)
+
+class _Binding(object):
+    """a name declared in a scope, and where it is used."""
+
+    def __init__(self, name):
+        self.name = name
+        self.functionScoped = False
+        self.ranges = []
+        self.keep = False
+        # Declared in the parameter list, or as the name of a function
+        # expression, rather than in the body
+        self.param = False
+        self.uses = []
+        self.newName = None
+
+class _Frame(object):
+    """an open bracket, brace or template substitution."""
+
+    def __init__(self, kind, open):
+        self.kind = kind
+        self.open = open
+        self.range = [open, None]
+        self.scope = None
+        self.declaring = None
+        self.expect = False
+        self.key = False
+        self.ternary = 0
+        self.statement = False
+        self.keyword = None
+        self.declared = []
+        # The range of a for or catch head, which ends with this block
+        self.head = None
+
+class _Parser(object):
+    """the tokenizer and the little of a parser mangle() needs."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.values = []
+        self.kinds = []
+        self.starts = []
+        self.ends = []
+        self.stack = []
+        self.root = _Scope(None)
+        self.scope = self.root
+        self.uses = []
+        # Names never renamed anywhere in the file
+        self.pinned = set()
+        self.unsafe = False
+        self.deletions = []
+
+        # Index of the last token other than a linefeed, and of the first
+        # linefeed after it, if any
+        self.prev = -1
+        self.newline = -1
+        # The frame the last ) or } closed
+        self.closed = None
+        # Kind of the last colon: 'ternary', 'key', 'label' or 'case'
+        self.colon = None
+        self.pendingFunction = None
+        self.pendingClass = None
+        self.pendingBody = None
+        self.pendingMethod = False
+        self.caseLabel = False
+        self.semicolon = None
+        self.asyncStatement = False
+        # The declaration being read outside any bracket, as frames have
+        self.rootDeclaring = None
+        self.rootExpect = False
+
+    # Tokens
+
+    def _lex(self, pos, regex):
+        """return the kind, start and end of the token at pos, or None at the
+           end of the text.
+        """
+        text = self.text
+        pos = _SPACE.match(text, pos).end()
+        if pos >= len(text):
+            return None
+        c = text[pos]
+        if c == '\n':
+            return NEWLINE, pos, pos + 1
+        if c == '"' or c == "'":
+            match = _STRING.match(text, pos)
+            if not match:
+                raise MangleError('unterminated string at %d' % pos)
+            return STRING, pos, match.end()
+        if c == '`':
+            match = _TEMPLATE.match(text, pos + 1)
+            if not match:
+                raise MangleError('unterminated template at %d' % pos)
+            return TEMPLATE, pos, match.end()
+        if c == '#':
+            match = _NAME.match(text, pos + 1)
+            if not match:
+                raise MangleError('stray # at %d' % pos)
+            return PRIVATE, pos, match.end()
+        match = _NAME.match(text, pos)
+        if match:
+            return NAME, pos, match.end()
+        if c in '0123456789' or c == '.' and text[pos + 1:pos + 2] in _DIGITS:
+            return NUMBER, pos, _NUMBER.match(text, pos).end()
+        if c == '/' and regex:
+            match = _REGEX.match(text, pos)
+            if not match:
+                raise MangleError('unterminated regular expression at %d' % pos)
+            return REGEX, pos, match.end()
+        match = _PUNCTUATOR.match(text, pos)
+        if not match:
+            raise MangleError('unexpected %r at %d' % (c, pos))
+        return PUNCTUATOR, pos, match.end()
+
+    def _peek(self):
+        """return the kind and value of the next token other than a
+           linefeed, read as if a slash were division.
+        """
+        pos = self.pos
+        while True:
+            token = self._lex(pos, False)
+            if token is None:
+                return None, None
+            kind, start, end = token
+            if kind != NEWLINE:
+                return kind, self.text[start:end]
+            pos = end
+
+    def _regexAllowed(self):
+        """return whether a slash here starts a regular expression."""
+        if self.prev < 0:
+            return True
+        kind = self.kinds[self.prev]
+        value = self.values[self.prev]
+        if kind == NAME:
+            return value in _REGEX_KEYWORDS
+        if kind == PUNCTUATOR:
+            if value == ')':
+                return self.closed.kind == 'control'
+            if value == '}':
+                return self.closed.statement
+            return value not in (']', '++', '--')
+        if kind == TEMPLATE:
+            return value.endswith('${')
+        return False
+
+    def _endsExpression(self, index):
+        """return whether a linefeed after a token may end a statement."""
+        kind = self.kinds[index]
+        value = self.values[index]
+        if kind == NAME:
+            return value not in _KEYWORDS or value in _VALUE_KEYWORDS or value in _RESTRICTED
+        if kind == PUNCTUATOR:
+            return value in (')', ']', '}', '++', '--')
+        if kind == TEMPLATE:
+            return value.endswith('`')
+        return True
+
+    def _asi(self, kind, value):
+        """return whether a semicolon is implied before the current token."""
+        if self.newline < 0 or self.prev < 0 or not self._endsExpression(self.prev):
+            return False
+        if kind == PUNCTUATOR:
+            return value in ('++', '--', '{')
+        if kind == NAME:
+            return value not in _OPERATOR_KEYWORDS
+        return kind not in (REGEX, TEMPLATE)
+
+    def _statementStart(self, kind=None, value=None):
+        """return whether a statement can start at the current token."""
+        if self.prev < 0:
+            return True
+        top = self.stack[-1] if self.stack else None
+        if top is not None and top.kind not in _STATEMENT_BRACES:
+            return False
+        prevKind = self.kinds[self.prev]
+        prev = self.values[self.prev]
+        if prevKind == PUNCTUATOR:
+            if prev in (';', '{') or \
+                    prev == '}' and self.closed.statement or \
+                    prev == ')' and self.closed.kind == 'control' or \
+                    prev == ':' and self.colon in ('label', 'case'):
+                return True
+        elif prevKind == NAME and prev in ('else', 'do'):
+            return True
+        if kind is None:
+            return self.newline >= 0 and self._endsExpression(self.prev)
+        return self._asi(kind, value)
+
+    # Scopes
+
+    def _declare(self, index, functionScoped, keep=False, frame=None, scope=None):
+        """declare the name at a token. Block-scoped names are declared for
+           the range of the innermost statement brace, or of frame.
+        """
+        name = self.values[index]
+        if name in _KEYWORDS:
+            return
+        scope = scope or self.scope
+        binding = scope.bindings.get(name)
+        if binding is None:
+            binding = scope.bindings[name] = _Binding(name)
+            binding.param = scope.body is None
+        binding.keep = binding.keep or keep
+        if functionScoped:
+            binding.functionScoped = True
+        else:
+            if frame is None:
+                frame = self._block()
+            if frame is None:
+                binding.keep = True
+            else:
+                binding.ranges.append(frame.range)
+                frame.declared.append(binding)
+        self.uses.append((index, scope))
+
+    def _use(self, index):
+        name = self.values[index]
+        if name in _KEYWORDS:
+            return
+        if name == 'eval':
+            self.unsafe = True
+        self.uses.append((index, self.scope))
+
+    def _property(self, index):
+        """return whether the name at a token follows a dot."""
+        return index > 0 and self.kinds[index - 1] == PUNCTUATOR and \
+            self.values[index - 1] in ('.', '?.')
+
+    def _block(self):
+        """return the innermost frame enclosing statements."""
+        for frame in reversed(self.stack):
+            if frame.kind in _STATEMENT_BRACES:
+                return frame
+        return None
+
+    def resolve(self):
+        """return each use of a name, as its token index and the binding of
+           the function it belongs to, or None for a global.
+        """
+        resolved = []
+        for index, scope in self.uses:
+            name = self.values[index]
+            binding = None
+            while scope is not self.root:
+                binding = scope.bindings.get(name)
+                # Default values in the parameter list are evaluated before
+                # the body, so they do not see what the body declares
+                if binding is not None and not binding.param and \
+                        scope.body is not None and index < scope.body:
+                    binding = None
+                # A block-scoped name is only declared in its blocks
+                if binding is not None and (binding.functionScoped or any(
+                        end is not None and start <= index <= end
+                        for start, end in binding.ranges)):
+                    break
+                binding = None
+                scope = scope.parent
+            resolved.append((index, binding))
+        return resolved
+
+    def renames(self):
+        """return the edits renaming local names."""
+        resolved = self.resolve()
+        for index, binding in resolved:
+            if binding is not None:
+                binding.uses.append(index)
+
+        for binding in self._bindings(self.root):
+            if binding.name in self.pinned:
+                binding.keep = True
+
+        taken = set(self.values[index] for index, binding in resolved
+                    if binding is None or binding.keep)
+        taken.update(_KEYWORDS)
+        taken.update(('arguments', 'eval', 'undefined', 'NaN', 'Infinity'))
+        for scope in self.root.children:
+            self._assign(scope, taken, frozenset())
+
+        edits = []
+        for index, binding in resolved:
+            if binding is not None and binding.newName is not None:
+                edits.append((self.starts[index], self.ends[index], binding.newName))
+        return edits
+
+    def _bindings(self, scope):
+        for child in scope.children:
+            for binding in child.bindings.values():
+                yield binding
+            for binding in self._bindings(child):
+                yield binding
+
+    def _assign(self, scope, taken, outer):
+        """give the names of a scope new names, most used first, avoiding
+           the taken names and the new names of enclosing scopes.
+        """
+        bindings = sorted((binding for binding in scope.bindings.values() if not binding.keep),
+                          key=lambda binding: (-len(binding.uses), binding.name))
+        used = set(outer)
+        names = (name for name in _names() if name not in taken and name not in used)
+        for binding in bindings:
+            binding.newName = next(names)
+            used.add(binding.newName)
+        outer = frozenset(used)
+        for child in scope.children:
+            self._assign(child, taken, outer)
+
+    # Parsing
+
+    def parse(self):
+        text = self.text
+        while True:
+            start = _SPACE.match(text, self.pos).end()
+            if self.stack and self.stack[-1].kind == 'template' and text[start:start + 1] == '}':
+                # The rest of a template literal, after a substitution
+                match = _TEMPLATE.match(text, start + 1)
+                if not match:
+                    raise MangleError('unterminated template at %d' % start)
+                token = TEMPLATE, start, match.end()
+            else:
+                token = self._lex(self.pos, self._regexAllowed())
+            if token is None:
+                break
+            kind, start, end = token
+            self.pos = end
+            index = len(self.values)
+            value = text[start:end]
+            self.values.append(value)
+            self.kinds.append(kind)
+            self.starts.append(start)
+            self.ends.append(end)
+
+            if kind == NEWLINE:
+                if self.newline < 0:
+                    self.newline = index
+                continue
+
+            if self.newline >= 0:
+                self._collapseNewline(index, kind, value)
+            self._token(index, kind, value)
+            self.prev = index
+            self.newline = -1
+
+        if self.stack:
+            raise MangleError('unclosed %s' % self.stack[-1].kind)
+
+    def _collapseNewline(self, index, kind, value):
+        """remove the linefeed before a token if the grammar does not need
+           it.
+        """
+        if self.prev < 0 or self.newline != index - 1:
+            return
+        prevKind = self.kinds[self.prev]
+        prev = self.values[self.prev]
+        if prevKind == NAME and prev in _RESTRICTED:
+            return
+        if prevKind == PUNCTUATOR and prev in ('+', '-', '++', '--'):
+            return
+        if kind == PUNCTUATOR and value in ('(', '[', '+', '-'):
+            remove = True
+        elif kind == TEMPLATE and value.startswith('`'):
+            remove = True
+        elif kind == PUNCTUATOR and value == '{':
+            remove = (prevKind == PUNCTUATOR and (
+                          prev == '=>' or
+                          prev == ')' and self.closed.kind in ('control', 'params')) or
+                      prevKind == NAME and prev in _BLOCK_KEYWORDS)
+        elif kind in (NAME, NUMBER, STRING, PRIVATE):
+            remove = prevKind == PUNCTUATOR and prev == '}' and self.closed.statement
+        else:
+            remove = False
+        if remove:
+            self.deletions.append((self.starts[self.newline], self.ends[self.newline]))
+
+    def _endDeclaration(self, frame):
+        frame.declaring = None
+        frame.expect = False
+
+    def _token(self, index, kind, value):
+        stack = self.stack
+        top = stack[-1] if stack else None
+
+        # A var statement, or a class field, ends where a semicolon is
+        # implied
+        if top is not None and top.declaring and self._asi(kind, value) and not top.expect:
+            self._endDeclaration(top)
+        elif top is None and self.rootDeclaring and self._asi(kind, value) and not self.rootExpect:
+            self.rootDeclaring = None
+        elif top is not None and top.kind == 'class' and self._asi(kind, value):
+            top.key = True
+
+        if kind == PUNCTUATOR:
+            self._punctuator(index, value, top)
+        elif kind == NAME:
+            self._name(index, value, top)
+        elif kind == TEMPLATE:
+            if value.startswith('}'):
+                if top is None or top.kind != 'template':
+                    raise MangleError('unbalanced template at %d' % self.starts[index])
+                stack.pop()
+                top = stack[-1] if stack else None
+            if value.endswith('${'):
+                stack.append(_Frame('template', index))
+            self._value(top)
+        else:
+            if kind == STRING or kind == NUMBER or kind == PRIVATE:
+                if top is not None and top.key and top.kind in ('object', 'class'):
+                    self._key(index, top)
+                    return
+            self._value(top)
+
+    def _declaring(self, top):
+        """return the frame, or None for the top level, a declaration is
+           being read in, and whether a binding is expected.
+        """
+        if top is None:
+            return self.rootDeclaring, self.rootExpect
+        return top.declaring, top.expect
+
+    def _setExpect(self, top, expect):
+        if top is None:
+            self.rootExpect = expect
+        else:
+            top.expect = expect
+
+    def _value(self, top):
+        """note that a value was read, so no binding or key follows."""
+        if top is not None:
+            top.key = False
+            top.expect = False
+        else:
+            self.rootExpect = False
+
+    def _key(self, index, top):
+        """read a property name in an object literal or class body."""
+        top.key = False
+        if self._peek()[1] == '(':
+            self.pendingMethod = True
+
+    def _name(self, index, value, top):
+        declaring, expect = self._declaring(top)
+        prevValue = self.values[self.prev] if self.prev >= 0 else None
+        prevKind = self.kinds[self.prev] if self.prev >= 0 else None
+
+        # Property names
+        if prevKind == PUNCTUATOR and prevValue in ('.', '?.'):
+            self._value(top)
+            return
+
+        if top is not None and top.key and top.kind in ('object', 'class'):
+            nextKind, nextValue = self._peek()
+            if value in _MODIFIERS and nextKind in (NAME, STRING, NUMBER, PRIVATE) or \
+                    value in _MODIFIERS and nextValue in ('[', '*', '{'):
+                # get, set, async or static in front of a name
+                if value == 'static' and nextValue == '{':
+                    top.key = False
+                return
+            if nextValue in (',', '}', '=') and top.kind == 'object' or \
+                    top.kind == 'object' and nextValue is None:
+                # Shorthand: both a property name and a variable
+                self.pinned.add(value)
+                top.key = False
+                if top.declaring and value not in _KEYWORDS:
+                    self._declare(index, top.declaring == 'var', frame=self._declFrame(top))
+                else:
+                    self._use(index)
+                return
+            self._key(index, top)
+            return
+
+        # Labels
+        if prevKind == NAME and prevValue in ('break', 'continue') and self.newline < 0:
+            return
+        if value not in _KEYWORDS and self._statementStart(NAME, value) and \
+                (top is None or top.ternary == 0):
+            nextKind, nextValue = self._peek()
+            if nextValue == ':':
+                self.colon = 'label-pending'
+                return
+
+        if value in _KEYWORDS:
+            self._keyword(index, value, top)
+            return
+
+        if declaring and expect:
+            self._declare(index, declaring == 'var', frame=self._declFrame(top))
+            self._setExpect(top, False)
+            if top is not None:
+                top.key = False
+            return
+
+        if self.pendingFunction is not None and self.pendingFunction['name'] is None:
+            self.pendingFunction['name'] = index
+            return
+        if self.pendingClass is not None and self.pendingClass['name'] is None and \
+                prevKind == NAME and prevValue == 'class':
+            self.pendingClass['name'] = index
+            return
+
+        self._use(index)
+        self._value(top)
+
+    def _declFrame(self, top):
+        """return the frame whose range block-scoped names declared in the
+           current declaration are declared for.
+        """
+        for frame in reversed(self.stack):
+            if frame.kind in ('control', 'params'):
+                return frame
+            if frame.kind not in ('object', 'bracket'):
+                break
+        return self._block()
+
+    def _keyword(self, index, value, top):
+        if value == 'function':
+            statement = self.asyncStatement or self._statementStart(NAME, value)
+            self.asyncStatement = False
+            self.pendingFunction = {'statement': statement, 'name': None}
+            return
+        if value == 'class':
+            statement = self._statementStart(NAME, value)
+            self.pendingClass = {'statement': statement, 'name': None, 'depth': len(self.stack)}
+            return
+        if value == 'async':
+            nextKind, nextValue = self._peek()
+            if self._peek()[1] == 'function':
+                self.asyncStatement = self._statementStart(NAME, value)
+            return
+        if value in ('var', 'let', 'const'):
+            nextKind, nextValue = self._peek()
+            if value != 'let' or nextKind == NAME or nextValue in ('[', '{'):
+                declaring = 'var' if value == 'var' else 'let'
+                if top is None:
+                    self.rootDeclaring = declaring
+                    self.rootExpect = True
+                else:
+                    top.declaring = declaring
+                    top.expect = True
+            return
+        if value in ('case', 'default'):
+            self.caseLabel = True
+        if value in ('in', 'of') and top is not None and top.kind == 'control' and top.declaring:
+            self._endDeclaration(top)
+        if value in ('with',):
+            self.unsafe = True
+        if value in _VALUE_KEYWORDS:
+            self._value(top)
+
+    def _punctuator(self, index, value, top):
+        if value == '{':
+            self._openBrace(index, top)
+        elif value == '}':
+            self._closeBrace(index, top)
+        elif value == '(':
+            self._openParen(index, top)
+        elif value == ')':
+            if top is None or top.kind not in ('params', 'control', 'paren'):
+                raise MangleError('unbalanced ) at %d' % self.starts[index])
+            self.stack.pop()
+            self.closed = top
+            if top.kind == 'params':
+                self.pendingBody = top
+            elif top.kind == 'control' and top.keyword == 'for':
+                if self._peek()[1] != '{':
+                    # Where the loop ends is not known
+                    for binding in top.declared:
+                        self.pinned.add(binding.name)
+        elif value == '[':
+            frame = _Frame('bracket', index)
+            declaring, expect = self._declaring(top)
+            if declaring and expect:
+                frame.declaring = declaring
+                frame.expect = True
+            # A computed property name
+            frame.key = top is not None and top.key and top.kind in ('object', 'class')
+            self.stack.append(frame)
+        elif value == ']':
+            if top is None or top.kind != 'bracket':
+                raise MangleError('unbalanced ] at %d' % self.starts[index])
+            self.stack.pop()
+            self.closed = top
+            self._value(self.stack[-1] if self.stack else None)
+            if top.key and self._peek()[1] == '(':
+                self.pendingMethod = True
+        elif value == ';':
+            self._semicolon(index, top)
+        elif value == ',':
+            if top is not None:
+                if top.kind == 'object':
+                    top.key = True
+                if top.declaring:
+                    top.expect = True
+            elif self.rootDeclaring:
+                self.rootExpect = True
+        elif value == '=':
+            if top is not None:
+                top.expect = False
+                top.key = False
+            else:
+                self.rootExpect = False
+        elif value == '?':
+            if top is not None:
+                top.ternary += 1
+        elif value == ':':
+            if self.colon == 'label-pending':
+                self.colon = 'label'
+            elif top is not None and top.ternary:
+                top.ternary -= 1
+                self.colon = 'ternary'
+            elif top is not None and top.kind == 'object':
+                self.colon = 'key'
+                if top.declaring:
+                    top.expect = True
+            elif self.caseLabel:
+                self.colon = 'case'
+                self.caseLabel = False
+            else:
+                self.colon = 'ternary'
+        elif value == '*' and top is not None and top.key:
+            # A generator method
+            pass
+        elif value in ('=>', '...'):
+            pass
+        else:
+            self._value(top)
+            if top is not None:
+                top.expect = False
+
+    def _semicolon(self, index, top):
+        if top is not None and top.declaring:
+            self._endDeclaration(top)
+        if top is not None and top.kind == 'control':
+            return
+        if top is not None:
+            if top.kind == 'class':
+                top.key = True
+        elif self.rootDeclaring:
+            self.rootDeclaring = None
+
+        prevKind = self.kinds[self.prev] if self.prev >= 0 else None
+        prev = self.values[self.prev] if self.prev >= 0 else None
+        if prevKind == PUNCTUATOR and prev == ';' and self.newline < 0 and \
+                self.semicolon is not None:
+            # An empty statement after another one
+            self.deletions.append((self.starts[index], self.ends[index]))
+            return
+        empty = (prevKind == PUNCTUATOR and (
+                     prev == ')' and self.closed.kind == 'control' or
+                     prev == ':' or prev == '{') or
+                 prevKind == NAME and prev in ('else', 'do') or prevKind is None)
+        self.semicolon = None if empty else index
+
+    def _openParen(self, index, top):
+        prevKind = self.kinds[self.prev] if self.prev >= 0 else None
+        prev = self.values[self.prev] if self.prev >= 0 else None
+        if self.pendingFunction is not None:
+            function = self.pendingFunction
+            self.pendingFunction = None
+            frame = _Frame('params', index)
+            scope = _Scope(self.scope)
+            if function['name'] is not None:
+                name = function['name']
+                if function['statement']:
+                    # Declared in the enclosing scope, and kept. In a block
+                    # it is declared for the block in strict code, and for
+                    # the function too in sloppy code.
+                    block = self._block()
+                    if block is not None and block.scope is not self.scope:
+                        self.pinned.add(self.values[name])
+                    self._declare(name, True, keep=True)
+                else:
+                    self._declare(name, True, keep=True, scope=scope)
+            frame.scope = scope
+            frame.statement = function['statement']
+            frame.declaring = 'var'
+            frame.expect = True
+            self.scope = scope
+        elif self.pendingMethod:
+            self.pendingMethod = False
+            frame = _Frame('params', index)
+            frame.scope = self.scope = _Scope(self.scope)
+            frame.declaring = 'var'
+            frame.expect = True
+        elif prevKind == NAME and prev in _CONTROL_KEYWORDS and not self._property(self.prev):
+            frame = _Frame('control', index)
+            frame.keyword = prev
+            if prev == 'catch':
+                frame.declaring = 'let'
+                frame.expect = True
+        else:
+            frame = _Frame('paren', index)
+        self._value(top)
+        self.stack.append(frame)
+
+    def _openBrace(self, index, top):
+        prevKind = self.kinds[self.prev] if self.prev >= 0 else None
+        prev = self.values[self.prev] if self.prev >= 0 else None
+        declaring, expect = self._declaring(top)
+
+        if self.pendingBody is not None and prev == ')':
+            params = self.pendingBody
+            self.pendingBody = None
+            frame = _Frame('body', index)
+            frame.scope = params.scope
+            params.scope.body = index
+            frame.range = params.range
+            frame.statement = params.statement
+            self.stack.append(frame)
+            return
+        self.pendingBody = None
+
+        if self.pendingClass is not None and self.pendingClass['depth'] == len(self.stack):
+            pending = self.pendingClass
+            self.pendingClass = None
+            if pending['name'] is not None:
+                if pending['statement']:
+                    self._declare(pending['name'], False, keep=True)
+                else:
+                    self.uses.append((pending['name'], self.scope))
+            frame = _Frame('class', index)
+            frame.key = True
+            frame.statement = pending['statement']
+            self.stack.append(frame)
+            return
+
+        if declaring and expect:
+            frame = _Frame('object', index)
+            frame.declaring = declaring
+            frame.key = True
+            self.stack.append(frame)
+            return
+
+        if prevKind == PUNCTUATOR and prev == '=>':
+            kind = 'arrow'
+        elif prevKind == PUNCTUATOR and prev == ')' and self.closed.kind == 'control':
+            kind = 'switch' if self.closed.keyword == 'switch' else 'block'
+        elif prevKind == NAME and (prev in _BLOCK_KEYWORDS or prev == 'static' and
+                                   top is not None and top.kind == 'class'):
+            kind = 'block'
+        elif self._statementStart(PUNCTUATOR, '{'):
+            kind = 'block'
+        else:
+            kind = 'object'
+
+        frame = _Frame(kind, index)
+        if kind == 'object':
+            frame.key = True
+        else:
+            frame.statement = kind != 'arrow'
+            if kind == 'block' and prev == ')' and self.closed.keyword in ('for', 'catch'):
+                # Names declared in the head are declared for the block too
+                frame.head = self.closed.range
+        self._value(top)
+        self.stack.append(frame)
+
+    def _closeBrace(self, index, top):
+        if top is None or top.kind in ('params', 'control', 'paren', 'bracket', 'template'):
+            raise MangleError('unbalanced } at %d' % self.starts[index])
+        self.stack.pop()
+        self.closed = top
+        top.range[1] = index
+        if top.head is not None:
+            top.head[1] = index
+
+        if self.semicolon is not None and self.prev == self.semicolon and \
+                self.newline < 0 and top.kind != 'object':
+            self.deletions.append((self.starts[self.semicolon], self.ends[self.semicolon]))
+        self.semicolon = None
+
+        if top.kind == 'body':
+            self.scope = self.scope.parent
+        parent = self.stack[-1] if self.stack else None
+        if parent is not None and parent.kind == 'class':
+            # After a method body or static block, or an object or function
+            # ending a field
+            parent.key = True
+        elif top.kind in ('body', 'arrow', 'object') or top.kind == 'class' and not top.statement:
+            self._value(parent)
@@ -0,0 +1,162 @@
+"""
+On-disk and in-memory caches of minified output
+
+Entries are keyed by the SHA-256 of a source file's contents together with
+the minifier version, so editing a file or upgrading the minifier simply
+misses the old entry. Each entry is a file named after its key. A hit
+touches the file, so its modification time doubles as the LRU order used to
+keep the cache under its size cap. Temporary files left behind by a build
+that was interrupted while writing an entry are removed when it is pruned.
+
+MemoryCache keeps its entries in memory instead, for a process that builds
+more than once, such as jsmind.py, optionally in front of a MinifyCache that
+it reads on a miss and writes through to.
+"""
+import os
+import time
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# Default size cap, in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+class MinifyCache(object):
+    """a persistent cache of minified output."""
+
+    def __init__(self, directory, version, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.version = version
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Temporary files from before this, with a second to spare as file
+        # times lag the clock, are not being written by this run
+        self._started = time.time() - 1
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, source):
+        """return the cache key for the raw bytes of a source file."""
+        return _key(self.version, source)
+
+    def get(self, key):
+        """return the cached output for a key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8', newline='') as f:
+                text = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+
+        os.utime(path, None)
+        self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """store the output for a key. The entry is written to a temporary
+           file first, so concurrent builds never see a partial entry."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp, self._path(key))
+
+    def prune(self):
+        """remove the temporary files of earlier runs, then the least
+           recently used entries until the cache fits within its size cap."""
+        entries = []
+        total = 0
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.js'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            elif entry.name.endswith('.tmp'):
+                # Another build may have just renamed it
+                try:
+                    if entry.stat().st_mtime < self._started:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+        entries.sort()
+
+        while total > self.max_size and entries:
+            mtime, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.js')
+
+class MemoryCache(object):
+    """an in-memory cache of minified output, with the interface of
+       MinifyCache."""
+
+    def __init__(self, version, max_size=DEFAULT_MAX_SIZE, backing=None):
+        self.version = version
+        self.max_size = max_size
+        self.backing = backing
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, source):
+        """return the cache key for the raw bytes of a source file."""
+        return _key(self.version, source)
+
+    def get(self, key):
+        """return the cached output for a key, or None. Entries missing
+           from memory are looked up in the backing cache, if any."""
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+        elif self.backing is not None:
+            text = self.backing.get(key)
+            if text is not None:
+                self._store(key, text)
+
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """store the output for a key, in the backing cache too if any."""
+        self._store(key, text)
+        if self.backing is not None:
+            self.backing.put(key, text)
+
+    def prune(self):
+        """drop the least recently used entries until the cache fits within
+           its size cap, and prune the backing cache."""
+        while self.size > self.max_size and self._entries:
+            key, text = self._entries.popitem(last=False)
+            self.size -= len(text)
+        if self.backing is not None:
+            self.backing.prune()
+
+    def _store(self, key, text):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = text
+        self.size += len(text)
+
+def _key(version, source):
+    digest = hashlib.sha256(version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(source)
+    return digest.hexdigest()
@@ -0,0 +1,42 @@
+"""
+Build outputs
+
+Writing the files the build produces, and the figures reported about them,
+shared by jsmin.py, cssmin.py, depgraph.py and eventdata.py.
+"""
+import os
+import hashlib
+
+def writeParts(path, parts):
+    """write the concatenation of parts to a file, as UTF-8, and return the
+       SHA-256 of what was written. The hash is updated as each part is
+       written, so the output is never joined or read back. The file is
+       written through a temporary file that then replaces it, so a server
+       never sees a partial one, and a hard link to the old one, such as its
+       content-hashed copy, is left as it was.
+    """
+    tmp = tmpFile(path)
+    digest = hashlib.sha256()
+    with open(tmp, 'wb') as f:
+        for part in parts:
+            data = part.encode('utf-8')
+            digest.update(data)
+            f.write(data)
+    os.replace(tmp, path)
+    return digest.hexdigest()
+
+def writeFile(path, text):
+    """writeParts() for a single string."""
+    return writeParts(path, [text])
+
+def tmpFile(path):
+    """return the temporary file to write path through, making its
+       directory if needed."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    return path + '.tmp'
+
+def saved(before, after):
+    """return the percentage of before that after saves."""
+    return (before - after) * 100.0 / before if before else 0.0
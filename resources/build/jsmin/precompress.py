@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Precompress built assets
+
+Writes a gzip (.gz) and a brotli (.br) sibling of each minified bundle, both
+at maximum compression, so the web server can serve them as they are
+instead of compressing every response. Files are compressed in a pool of
+worker processes.
+
+The SHA-256 of each file compressed is kept in a .precompress.json file next
+to it, and a file whose contents hash the same as last time, and whose
+siblings are both still there, is skipped. Entries for files that are gone
+are dropped from it. Files with the same contents, such as a bundle and its
+content-hashed copy, are compressed once, and the others get copies of the
+siblings, hard links when the files themselves are.
+
+Brotli output needs the brotli module (pip install brotli). Without it only
+.gz files are written.
+
+Example usage:
+
+  ./precompress.py
+  ./precompress.py ../../compressed/helioviewer.min.js
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPRESSED_DIR = os.path.join(os.path.dirname(os.path.dirname(BUILD_DIR)),
+                              'resources', 'compressed')
+
+# What is precompressed when no files are given
+PATTERNS = ('*.min.js', '*.min.css', '*.min.*.js', '*.min.*.css')
+
+STATE_FILE = '.precompress.json'
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write gzip and brotli compressed copies of minified '
+                    'bundles, skipping those that have not changed.')
+    parser.add_argument('files', nargs='*',
+                        help='files to compress (default: %s in %s)' %
+                             (', '.join(PATTERNS), COMPRESSED_DIR))
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='compress files even if they have not changed')
+    args = parser.parse_args()
+
+    files = args.files or defaultFiles()
+    if brotli is None:
+        print('brotli module not found, writing .gz files only', file=sys.stderr)
+
+    done = precompress(files, args.jobs, args.force)
+    print('precompressed %d of %d files' % (len(done), len(files)))
+
+def defaultFiles():
+    """return the minified bundles in resources/compressed."""
+    return sorted(path for pattern in PATTERNS
+                  for path in glob.glob(os.path.join(COMPRESSED_DIR, pattern)))
+
+def precompress(paths, jobs=None, force=False):
+    """write .gz and .br siblings of each file in paths whose contents have
+       changed since they were last written, in a pool of worker processes,
+       and return the paths that were compressed. jobs defaults to the number
+       of CPUs; with a single job no pool is started.
+    """
+    states = {}
+    todo = []
+    seen = set()
+    digests = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        if path in seen:
+            continue
+        seen.add(path)
+        directory, name = os.path.split(path)
+        if directory not in states:
+            states[directory] = _readState(directory)
+        # Hard links, such as content-hashed copies, are only read once.
+        stat = os.stat(path)
+        inode = (stat.st_dev, stat.st_ino)
+        if inode not in digests:
+            with open(path, 'rb') as f:
+                digests[inode] = hashlib.sha256(f.read()).hexdigest()
+        digest = digests[inode]
+        if force or states[directory].get(name) != digest or not all(
+                os.path.exists(sibling) for sibling in _siblings(path)):
+            todo.append((path, digest))
+
+    # One file of each set with the same contents is compressed, and the
+    # siblings of the others are copied from its.
+    first = {}
+    for path, digest in todo:
+        first.setdefault(digest, path)
+    unique = list(first.values())
+
+    compress = instrument.wrap(compressFile, 'precompress')
+    if jobs == 1 or len(unique) <= 1:
+        for path in unique:
+            instrument.unwrap(compress, compress(path), path)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(compress, path) for path in unique]
+            for path, future in zip(unique, futures):
+                instrument.unwrap(compress, future.result(), path)
+    for path, digest in todo:
+        if first[digest] != path:
+            _copySiblings(first[digest], path)
+
+    changed = set()
+    for path, digest in todo:
+        directory, name = os.path.split(path)
+        states[directory][name] = digest
+        changed.add(directory)
+    for directory, state in states.items():
+        for name in [name for name in state if not os.path.exists(os.path.join(directory, name))]:
+            del state[name]
+            changed.add(directory)
+    for directory in changed:
+        _writeState(directory, states[directory])
+
+    return [path for path, digest in todo]
+
+def compressFile(path):
+    """write the .gz and, if brotli is available, .br siblings of a file.
+       They get the file's modification time, so servers that compare it see
+       them as the same version.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    # mtime=0 leaves the time out of the gzip header, so the same input
+    # always gives the same output.
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11, mode=brotli.MODE_TEXT))
+
+    stat = os.stat(path)
+    for sibling in _siblings(path):
+        os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    if instrument.enabled():
+        instrument.annotate(bytesIn=len(data),
+                            bytesOut=sum(os.path.getsize(sibling) for sibling in _siblings(path)))
+
+def _copySiblings(source, path):
+    """give path the compressed siblings of source, a file with the same
+       contents: hard links to them if the two files are themselves linked,
+       and otherwise copies with the modification time of path."""
+    linked = os.path.samefile(source, path)
+    stat = os.stat(path)
+    for original, sibling in zip(_siblings(source), _siblings(path)):
+        tmp = sibling + '.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if linked:
+            try:
+                os.link(original, tmp)
+            except OSError:
+                linked = False
+        if not linked:
+            shutil.copyfile(original, tmp)
+            os.chmod(tmp, 0o644)
+            os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp, sibling)
+
+def _siblings(path):
+    """return the compressed siblings written for a file."""
+    if brotli is None:
+        return [path + '.gz']
+    return [path + '.gz', path + '.br']
+
+def _write(path, data):
+    """write a file through a temporary file, so a server never sees a
+       partial one."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+def _readState(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def _writeState(directory, state):
+    with open(os.path.join(directory, STATE_FILE), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
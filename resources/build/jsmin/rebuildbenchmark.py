@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+"""
+Cold against warm rebuild benchmark
+
+Copies the sources and headers of the JavaScript bundles of
+resources/build/bundles.json into a temporary directory, with a manifest of
+its own, so the tree is left alone, then times a rebuild after one file is
+edited, three ways:
+
+  cold        jsmin.py --manifest in a new process, with no cache, as build.xml
+              runs it
+  disk cache  the same with --cache-dir, the cache filled beforehand, so only
+              the edited file is minified
+  daemon      jsmind.Daemon after its first build, as a watching jsmind.py
+              rebuilds: only the bundles including the edited file, from the
+              outputs kept in memory
+
+Each run appends a comment to the edited file, so every rebuild has one file
+to minify again. For each it reports the best and median wall time. The
+benchmark fails if the median daemon rebuild takes --max-latency or more.
+
+Example usage:
+
+  ./rebuildbenchmark.py
+  ./rebuildbenchmark.py --edit resources/js/UI/Timeline.js --repeat 20 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from io import StringIO
+from contextlib import redirect_stderr
+
+from jsmin import VERSION
+from jsmind import Daemon
+from minifycache import MemoryCache
+
+BUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST = os.path.join(BUILD_DIR, 'bundles.json')
+JSMIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jsmin.py')
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description='Benchmark cold rebuilds against rebuilds by the jsmin daemon.')
+    parser.add_argument('--edit', default='resources/js/HelioviewerWebClient.js',
+                        help='file to edit before each rebuild, relative to the root of the repository')
+    parser.add_argument('--repeat', type=int, default=10, help='number of timed rebuilds of each kind')
+    parser.add_argument('--max-latency', type=float, default=100,
+                        help='fail if the median daemon rebuild takes this many milliseconds or more')
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='rebuildbenchmark-')
+    try:
+        manifest, edited = copyBundles(directory, args.edit)
+        cacheDir = os.path.join(directory, 'cache')
+        runJsmin(manifest, cacheDir)
+
+        print('rebuild after editing %s:' % args.edit)
+        results = {'edit': args.edit, 'repeat': args.repeat}
+        results['cold'] = report('cold', timeit(lambda: runJsmin(manifest), edited, args.repeat))
+        results['disk cache'] = report('disk cache', timeit(lambda: runJsmin(manifest, cacheDir),
+                                                            edited, args.repeat))
+
+        daemon = Daemon(manifest, MemoryCache(VERSION))
+        with redirect_stderr(StringIO()):
+            daemon.build()
+        names = sorted(daemon.watched()[edited])
+        results['daemon'] = report('daemon', timeit(lambda: quietly(daemon.build, names),
+                                                    edited, args.repeat))
+    finally:
+        shutil.rmtree(directory)
+
+    print('  %-12s %8.1fx' % ('speedup', results['cold']['median'] / results['daemon']['median']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if results['daemon']['median'] * 1e3 >= args.max_latency:
+        print('FAIL: median daemon rebuild %.1f ms, not under %g ms' % (
+            results['daemon']['median'] * 1e3, args.max_latency))
+        return 1
+    return 0
+
+def copyBundles(directory, edit):
+    """Copies the files and headers of the bundles of the manifest into a
+    directory, with a manifest building them there, and returns the path of
+    that manifest and of the copy of the file to edit"""
+    with open(MANIFEST) as f:
+        spec = json.load(f)
+
+    root = os.path.join(BUILD_DIR, spec['root'])
+    names = set()
+    for bundle in spec['bundles']:
+        names.update(bundle['files'])
+        if 'header' in bundle:
+            names.add(bundle['header'])
+    if edit not in names:
+        sys.exit('%s is in no bundle' % edit)
+
+    for name in names:
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(os.path.join(root, name), path)
+
+    copy = dict((key, value) for key, value in spec.items() if key in ('assets', 'aggressive', 'bundles'))
+    copy['root'] = '.'
+    manifest = os.path.join(directory, 'bundles.json')
+    with open(manifest, 'w') as f:
+        json.dump(copy, f, indent=4)
+    return manifest, os.path.join(directory, edit)
+
+def runJsmin(manifest, cacheDir=None):
+    """Builds the bundles of a manifest with jsmin.py in a new process"""
+    command = [sys.executable, JSMIN, '--manifest', manifest]
+    if cacheDir:
+        command += ['--cache-dir', cacheDir]
+    subprocess.run(command, stderr=subprocess.DEVNULL, check=True)
+
+def quietly(function, *args):
+    """Calls a function with what it prints to stderr discarded"""
+    with redirect_stderr(StringIO()):
+        return function(*args)
+
+def timeit(rebuild, edited, repeat):
+    """Returns the wall time of each of several rebuilds, the edited file
+    changed before each"""
+    times = []
+
+    for i in range(repeat):
+        with open(edited, 'a') as f:
+            f.write('\n// edit %d %f\n' % (i, time.time()))
+
+        start = time.perf_counter()
+        rebuild()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def report(name, times):
+    """Prints and returns the best and median of the wall times of a kind of
+    rebuild"""
+    stats = {'best': min(times), 'median': statistics.median(times)}
+    print('  %-12s %8.1f ms best %8.1f ms median' % (name, stats['best'] * 1e3, stats['median'] * 1e3))
+    return stats
+
+if __name__ == '__main__':
+    sys.exit(main())
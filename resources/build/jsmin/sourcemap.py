@@ -0,0 +1,195 @@
+"""
+Version 3 source maps
+
+jsmin.SourceMapMinify records three parallel arrays for each source: the
+output offset of each mapping, and the input line and column it maps to,
+counted from 0. encode() turns them into the "mappings" field of a source map
+for that source alone. A SourceMap then joins the encoded mappings of the
+sources of a bundle, shifted to where each one's output starts. Only the
+first mapping of each source has to be encoded again for that, so encoded
+mappings can be computed in parallel and cached along with the minified
+output.
+
+The format is described at https://sourcemaps.info/spec.html.
+"""
+import os
+import json
+from bisect import bisect_right
+from itertools import chain
+from operator import sub
+
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+_DIGITS = dict((c, i) for i, c in enumerate(_BASE64))
+
+# Most deltas between neighbouring mappings are small, so their encodings are
+# looked up rather than computed.
+_CACHED = 4096
+
+def _vlq(value):
+    """Returns the base64 VLQ encoding of an integer"""
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    digits = []
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value:
+            digits.append(_BASE64[digit | 32])
+        else:
+            digits.append(_BASE64[digit])
+            return ''.join(digits)
+
+_VLQ = dict((value, _vlq(value)) for value in range(-_CACHED, _CACHED))
+# The source index field of every segment is 0, 'A', so it is looked up
+# together with the source line field that follows it.
+_SOURCE_LINE = dict((value, 'A' + encoded) for value, encoded in _VLQ.items())
+
+def vlq(value):
+    """Returns the base64 VLQ encoding of an integer"""
+    encoded = _VLQ.get(value)
+    if encoded is None:
+        return _vlq(value)
+    return encoded
+
+def _vlqs(values, table=_VLQ, prefix=''):
+    """Returns the VLQ encodings of a list of integers, looked up in table,
+    or computed and prefixed with prefix if one of them is not in it"""
+    try:
+        return list(map(table.__getitem__, values))
+    except KeyError:
+        return [prefix + vlq(value) for value in values]
+
+def _deltas(values):
+    """Returns the differences between neighbouring values, the first one
+    being relative to 0"""
+    return list(map(sub, values, chain((0,), values)))
+
+def _decodeSegment(mappings, i):
+    """Returns the four values of the segment starting at an index of an
+    encoded mappings field, and the index after it"""
+    values = []
+    value = shift = 0
+    while len(values) < 4:
+        digit = _DIGITS[mappings[i]]
+        i += 1
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+        else:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return values, i
+
+def encode(mappings, text):
+    """Returns the encoded mappings of a single source, given the offsets,
+    lines and columns recorded by jsmin.SourceMapMinify and the minified
+    text. They are returned together with where the last mapping is: its
+    output line and column and input line and column."""
+    offsets, lines, columns = mappings
+    count = len(offsets)
+    if not count:
+        return '', (0, 0, 0, 0)
+
+    # Output columns are relative to the mapping before on the same line, or
+    # to the start of the line for the first mapping on it.
+    outColumns = _deltas(offsets)
+    separators = [','] * count
+    separators[0] = ''
+    line = 0
+    mapped = 0
+    newline = text.find('\n')
+    while newline != -1:
+        line += 1
+        lineStart = newline + 1
+        first = bisect_right(offsets, newline)
+        if first == count:
+            break
+        newline = text.find('\n', lineStart)
+        if newline == -1 or offsets[first] <= newline:
+            separators[first] = ';' * (line - mapped)
+            outColumns[first] = offsets[first] - lineStart
+            mapped = line
+
+    # The fields of all segments are interleaved into one list to be joined.
+    fields = [None] * (count * 4)
+    fields[0::4] = separators
+    fields[1::4] = _vlqs(outColumns)
+    fields[2::4] = _vlqs(_deltas(lines), _SOURCE_LINE, 'A')
+    fields[3::4] = _vlqs(_deltas(columns))
+    encoded = ''.join(fields)
+    lastColumn = offsets[-1] - text.rfind('\n', 0, offsets[-1]) - 1
+    return encoded, (mapped, lastColumn, lines[-1], columns[-1])
+
+class SourceMap(object):
+    """Source map for a file built from one or more minified sources"""
+
+    def __init__(self, file=None):
+        self.file = file
+        self.sources = []
+        self._index = {}
+        self._parts = []
+        self._line = 0
+        self._mapped = False
+        self._last = (0, 0, 0, 0)
+
+    def add(self, source, encoded, line=0, column=0):
+        """Adds the mappings of one source, as returned by encode(), whose
+        output starts at the given line and column of the file. Sources must
+        be added in the order their output appears in the file."""
+        mappings, last = encoded
+        if not mappings:
+            return
+
+        index = self._index.get(source)
+        if index is None:
+            index = self._index[source] = len(self.sources)
+            self.sources.append(source)
+
+        parts = self._parts
+        prevColumn, prevIndex, prevLine, prevInColumn = self._last
+        if line > self._line:
+            parts.append(';' * (line - self._line))
+            self._line = line
+            self._mapped = False
+            prevColumn = 0
+
+        # The first mapping was encoded on its own; make it relative to the
+        # last mapping before it.
+        start = len(mappings) - len(mappings.lstrip(';'))
+        (outColumn, _, inLine, inColumn), end = _decodeSegment(mappings, start)
+        if start:
+            parts.append(mappings[:start])
+            prevColumn = 0
+        else:
+            outColumn += column
+            if self._mapped:
+                parts.append(',')
+        parts.append(vlq(outColumn - prevColumn) + vlq(index - prevIndex) +
+                     vlq(inLine - prevLine) + vlq(inColumn - prevInColumn))
+        parts.append(mappings[end:])
+
+        lastLine, lastColumn, lastInLine, lastInColumn = last
+        if not lastLine:
+            lastColumn += column
+        self._line = line + lastLine
+        self._mapped = True
+        self._last = (lastColumn, index, lastInLine, lastInColumn)
+
+    def mappings(self):
+        """Returns the encoded "mappings" field"""
+        return ''.join(self._parts)
+
+    def toJSON(self):
+        """Returns the source map as a JSON string"""
+        sourceMap = {
+            'version': 3,
+            'sources': self.sources,
+            'names': [],
+            'mappings': self.mappings(),
+        }
+        if self.file:
+            sourceMap['file'] = self.file
+        return json.dumps(sourceMap)
+
+def relativeSource(path, mapPath):
+    """Returns the URL of a source file relative to its source map"""
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(mapPath))).replace(os.sep, '/')
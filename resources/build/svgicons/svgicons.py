@@ -5,89 +5,325 @@
 # SVG Icon-Set Builder
 # By Keith Hughitt, Oct 2008
 #
-# Requires: svgfig (2.x), ImageMagick
+# Requires: svgfig (2.x), CairoSVG or else ImageMagick
+#
+# Every icon is drawn and rasterized in a pool of worker processes, with
+# CairoSVG when it is installed, or else with ImageMagick's convert. The
+# parameters each icon was made from are kept in the output directory, and
+# icons whose parameters have not changed since are skipped.
+#
+# So that the client can load the whole set in one or two requests, the
+# icons are also packed into a PNG sprite sheet per size, sprites-small.png
+# and sprites-large.png, and into one SVG symbol sheet, icons.svg, with a
+# <symbol> per icon, to be used as <use xlink:href="icons.svg#NAME"/>.
+# atlas.json gives the sheet and offset of each icon, and atlas.css a class
+# per icon, .event-icon-NAME, showing it from its sprite sheet.
+#
+# With --trace, the time each icon and sheet took to make, and in which
+# worker process, is written in the Chrome trace event format, for
+# chrome://tracing or Perfetto.
+#
+# Example usage:
+#
+#   ./svgicons.py
+#   ./svgicons.py --output icons --jobs 8 --force
+#   ./svgicons.py --force --trace svgicons-trace.json
 #
 ##############################################################################
 import os
+import re
+import sys
+import math
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import multiprocessing
 from svgfig.interactive import *
 
+try:
+	import cairosvg
+except ImportError:
+	cairosvg = None
+
+# Changed whenever the way icons are drawn changes, so that all of them are
+# made again
+VERSION = 1
+
+COLORS = [('red', '#ff4848'), ('blue', '#0078ff'), ('orange', 'orange'), ('yellow', 'yellow'), ('green','#b2ff66'), ('lightblue','#759fd9')]
+LABELS = [('Active_Region', 'AR'), ('CME', 'C'), ('Solar_Flare', 'F'), ('Type_II_Radio_Burst', 'R2')]
+SHAPES = ['square', 'circle', 'diamond']
+SIZES = [('small', 16), ('large', 40)]
+
+# Position and font size of the label, for each size and shape
+TEXT = {
+	('small', 'square'):  (8, 12, 10),
+	('small', 'circle'):  (8, 12, 10),
+	('small', 'diamond'): (8, 11, 8),
+	('large', 'square'):  (19, 28, 25),
+	('large', 'circle'):  (19, 28, 25),
+	('large', 'diamond'): (19, 27, 21),
+}
+
+# Space between the icons of a sprite sheet, so that they do not bleed
+# into each other when scaled
+SPRITE_PADDING = 2
+
+MANIFEST = ".svgicons.json"
+SYMBOLS = "icons.svg"
+
 def main():
-	output_dir = "icons"
-	colors = [('red', '#ff4848'), ('blue', '#0078ff'), ('orange', 'orange'), ('yellow', 'yellow'), ('green','#b2ff66'), ('lightblue','#759fd9')]
-	labels = [('Active_Region', 'AR'), ('CME', 'C'), ('Solar_Flare', 'F'), ('Type_II_Radio_Burst', 'R2')]
+	parser = argparse.ArgumentParser(description="Build the event marker icon set.")
+	parser.add_argument("--output", default="icons", help="directory to write the icons to")
+	parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+	parser.add_argument("--force", action="store_true", help="make every icon, even if it has not changed")
+	parser.add_argument("--trace", help="file to write the time each icon took to, in the Chrome trace event format")
+	args = parser.parse_args()
+
+	if not os.path.isdir(os.path.join(args.output, "png")):
+		os.makedirs(os.path.join(args.output, "png"))
+
+	icons = listIcons(COLORS, LABELS)
+	manifest = {} if args.force else loadManifest(args.output)
+	todo = [icon for icon in icons if manifest.get(icon[0]) != iconKey(icon)
+	        or not os.path.exists(pngPath(args.output, icon[0]))]
+
+	sheets = [("sprites-%s" % size, [icon for icon in icons if icon[1] == size]) for size, width in SIZES]
+	outputs = [SYMBOLS, "atlas.json", "atlas.css"] + ["%s.png" % sheet for sheet, members in sheets]
+	remake = todo or not all(os.path.exists(os.path.join(args.output, output)) for output in outputs)
+
+	errors = 0
+	spans = []
+	if remake:
+		pool = multiprocessing.Pool(args.jobs)
+		try:
+			for name, key, error, span in pool.imap_unordered(createIcon, [(args.output, icon) for icon in todo]):
+				spans.append(("icon", name) + span)
+				if error:
+					sys.stderr.write("%s: %s\n" % (name, error))
+					manifest.pop(name, None)
+					errors += 1
+				else:
+					manifest[name] = key
+			saveManifest(args.output, manifest)
+
+			if not errors:
+				atlas = {"symbols": SYMBOLS, "sheets": {}}
+				for sheet, members in sheets:
+					atlas["sheets"][sheet] = writeSpriteSheet(args.output, sheet, members)
+				writeSymbolSheet(args.output, icons)
+				writeAtlas(args.output, atlas)
+				for sheet, error, span in pool.imap_unordered(createSheet, [(args.output, sheet) for sheet, members in sheets]):
+					spans.append(("sheet", sheet) + span)
+					if error:
+						sys.stderr.write("%s: %s\n" % (sheet, error))
+						errors += 1
+		finally:
+			pool.close()
+			pool.join()
+
+	sys.stderr.write("%d icons: %d made with %s, %d unchanged, %d failed\n" % (len(icons),
+		len(todo) - errors, "CairoSVG" if cairosvg else "ImageMagick", len(icons) - len(todo), errors))
+	if args.trace:
+		writeTrace(args.trace, spans)
+	return 1 if errors else 0
+
+def listIcons(colors, labels):
+	"""returns the name, size, shape, color and label of every icon: each
+	   labelled icon in each size, and small empty copies of each shape and
+	   color combination for user customization"""
+	icons = []
+
+	for cName, cValue in colors:
+		for lName, lValue in labels:
+			for size, width in SIZES:
+				for shape in SHAPES:
+					icons.append(("%s-%s-%s-%s" % (size, cName, shape, lName), size, shape, cValue, lValue))
+
+		for shape in SHAPES:
+			icons.append(("small-%s-%s" % (cName, shape), "small", shape, cValue, None))
+
+	return icons
 
-	if not os.path.isdir("./" + output_dir):
-		os.mkdir("./" + output_dir);
+def iconKey(icon):
+	"""returns a hash of everything an icon is made from"""
+	return hashlib.sha1(json.dumps([VERSION, "cairosvg" if cairosvg else "convert", icon])).hexdigest()
 
-	os.chdir(output_dir)
+def drawIcon(size, shape, color, label):
+	"""returns the svgfig canvas of an icon"""
+	width = dict(SIZES)[size]
+	half = width / 2
 
-	createSVGs(colors, labels)
-	convertToPNGs()
+	if shape == "square":
+		background = SVG("rect", x=0, y=0, width=width, height=width, fill=color, fill_opacity="75%")
+	elif shape == "circle":
+		background = SVG("circle", half, half, half, fill=color, fill_opacity="75%")
+	else:
+		background = SVG("path", "M %d 0 L %d %d L %d %d L 0 %d z" % (half, width, half, half, width, half),
+		                 fill=color, fill_opacity="75%")
 
+	if label is None:
+		return Canvas(width, width, background)
 
-def createSVGs(colors, labels):
+	x, y, fontSize = TEXT[(size, shape)]
+	text = SVG("text", x, y, font_size=fontSize)(label)
+	return Canvas(width, width, SVG("g", background, text))
 
+def createIcon(job):
+	"""writes the SVG and PNG of an icon; run in the worker processes.
+	   returns the name and key of the icon, and the error if any"""
+	output, icon = job
+	name, size, shape, color, label = icon
+	start = timeSpan()
+	try:
+		svg = os.path.join(output, name + ".svg")
+		drawIcon(size, shape, color, label).save(svg)
+		rasterize(svg, pngPath(output, name))
+	except Exception, e:
+		return name, None, str(e) or e.__class__.__name__, timeSpan(start)
+	return name, iconKey(icon), None, timeSpan(start)
 
-	for c in colors:
-		cName =  c[0]
-		cValue = c[1]
+def createSheet(job):
+	"""writes the PNG of a sprite sheet; run in the worker processes.
+	   returns the name of the sheet, and the error if any"""
+	output, sheet = job
+	start = timeSpan()
+	try:
+		rasterize(os.path.join(output, sheet + ".svg"), os.path.join(output, sheet + ".png"))
+	except Exception, e:
+		return sheet, str(e) or e.__class__.__name__, timeSpan(start)
+	return sheet, None, timeSpan(start)
 
-		for l in labels:
-			lName = l[0]
-			lValue = l[1]
+def timeSpan(start=None):
+	"""returns the wall and CPU time now, or, given those of the start of
+	   a span, the process it ran in, when it started and its wall and CPU
+	   time"""
+	times = os.times()
+	now = (time.time(), times[0] + times[1] + times[2] + times[3])
+	if start is None:
+		return now
+	return os.getpid(), start[0], now[0] - start[0], now[1] - start[1]
 
-			small_text    =	SVG("text", 8, 12, font_size=10)(lValue)
-			smaller_text  =	SVG("text", 8, 11, font_size=8)(lValue)
-			medium_text   = SVG("text", 19, 27, font_size=21)(lValue)
-			large_text =	SVG("text", 19, 28, font_size=25)(lValue)
+def writeTrace(path, spans):
+	"""writes the spans of the icons and sheets made in the Chrome trace
+	   event format, in microseconds from the first"""
+	origin = min([span[3] for span in spans] or [0])
+	events = [{"name": name, "cat": category, "ph": "X", "pid": pid, "tid": pid,
+	           "ts": round((start - origin) * 1e6, 1), "dur": round(wall * 1e6, 1),
+	           "args": {"cpu": round(cpu * 1e3, 3)}}
+	          for category, name, pid, start, wall, cpu in spans]
+	f = open(path, "w")
+	try:
+		json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, separators=(",", ":"))
+	finally:
+		f.close()
 
-			#Create square icons
-			small_rect = SVG("rect", x=0, y=0, width=16, height=16, fill=cValue, fill_opacity="75%")
-			small_rect_svg = Canvas(16,16, SVG("g", small_rect, small_text))
-			small_rect_svg.save("small-" + cName + "-square-" + lName + ".svg")
+def readIcon(output, name):
+	"""returns the attributes and contents of the root element of the SVG
+	   of an icon"""
+	f = open(os.path.join(output, name + ".svg"))
+	try:
+		match = re.search(r"<svg\b([^>]*)>(.*)</svg>", f.read(), re.S)
+	finally:
+		f.close()
+	return dict(re.findall(r'([\w:-]+)="([^"]*)"', match.group(1))), match.group(2)
 
+def element(tag, attributes, contents):
+	return '<%s %s>%s</%s>' % (tag, " ".join('%s="%s"' % (key, value) for key, value in attributes), contents, tag)
 
-			large_rect = SVG("rect", x=0, y=0, width=40, height=40, fill=cValue, fill_opacity="75%")
-			large_rect_svg = Canvas(40,40, SVG("g", large_rect, large_text))
-			large_rect_svg.save("large-" + cName + "-square-" + lName + ".svg")
+def writeSpriteSheet(output, sheet, icons):
+	"""writes the SVG of a sprite sheet of icons of one size, laid out in a
+	   grid, and returns its size and the offset of each icon in it"""
+	width = dict(SIZES)[icons[0][1]]
+	columns = int(math.ceil(math.sqrt(len(icons))))
+	rows = (len(icons) + columns - 1) // columns
+	step = width + SPRITE_PADDING
 
-			#Create circle icons
-			small_circle = SVG("circle", 8, 8, 8, fill=cValue, fill_opacity="75%")
-			small_circle_svg = Canvas(16,16, SVG("g", small_circle, small_text))
-			small_circle_svg.save("small-" + cName + "-circle-" + lName + ".svg")
+	entry = {"image": sheet + ".png", "width": columns * step - SPRITE_PADDING,
+	         "height": rows * step - SPRITE_PADDING, "icons": {}}
+	parts = []
+	for i, icon in enumerate(sorted(icons)):
+		x, y = (i % columns) * step, (i // columns) * step
+		attributes, contents = readIcon(output, icon[0])
+		parts.append(element("svg", [("x", x), ("y", y), ("width", width), ("height", width),
+			("viewBox", attributes["viewBox"]), ("font-family", attributes["font-family"]),
+			("style", attributes["style"])], contents))
+		entry["icons"][icon[0]] = {"x": x, "y": y, "width": width, "height": width}
 
-			large_circle = SVG("circle", 20, 20, 20, fill=cValue, fill_opacity="75%")
-			large_circle_svg = Canvas(40,40, SVG("g", large_circle, large_text))
-			large_circle_svg.save("large-" + cName + "-circle-" + lName + ".svg")
+	writeSVG(os.path.join(output, sheet + ".svg"), entry["width"], entry["height"], parts)
+	return entry
 
-			#Create rhombus icons
-			small_diamond = SVG("path", "M 8 0 L 16 8 L 8 16 L 0 8 z", fill=cValue, fill_opacity="75%")
-			small_diamond_svg = Canvas(16,16, SVG("g", small_diamond, smaller_text))
-			small_diamond_svg.save("small-" + cName + "-diamond-" + lName + ".svg")
+def writeSymbolSheet(output, icons):
+	"""writes an SVG with a symbol for every icon"""
+	parts = []
+	for icon in sorted(icons):
+		attributes, contents = readIcon(output, icon[0])
+		parts.append(element("symbol", [("id", icon[0]), ("viewBox", attributes["viewBox"]),
+			("font-family", attributes["font-family"]), ("style", attributes["style"])], contents))
+	writeSVG(os.path.join(output, SYMBOLS), 0, 0, parts)
 
-			large_diamond = SVG("path", "M 20 0 L 40 20 L 20 40 L 0 20 z", fill=cValue, fill_opacity="75%")
-			large_diamond_svg = Canvas(40,40, SVG("g", large_diamond, medium_text))
-			large_diamond_svg.save("large-" + cName + "-diamond-" + lName + ".svg")
+def writeSVG(path, width, height, parts):
+	f = open(path, "w")
+	try:
+		f.write('<?xml version="1.0" standalone="no"?>\n')
+		f.write('<svg width="%d" height="%d" version="1.1" xmlns="http://www.w3.org/2000/svg" '
+		        'xmlns:xlink="http://www.w3.org/1999/xlink">\n' % (width, height))
+		f.write("\n".join(parts))
+		f.write("\n</svg>\n")
+	finally:
+		f.close()
 
-			#Create small empty copies of each shape and color combination for user customization
-			empty_rect = Canvas(16,16, SVG("rect", x=0, y=0, width=16, height=16, fill=cValue, fill_opacity="75%"))
-			empty_rect.save("small-" + cName + "-square.svg")
-			empty_circle = Canvas(16,16, SVG("circle", 8, 8, 8, fill=cValue, fill_opacity="75%"))
-			empty_circle.save("small-" + cName + "-circle.svg")
-			empty_diamond = Canvas(16,16, SVG("path", "M 8 0 L 16 8 L 8 16 L 0 8 z", fill=cValue, fill_opacity="75%"))
-			empty_diamond.save("small-" + cName + "-diamond.svg")
+def writeAtlas(output, atlas):
+	"""writes the offsets of the icons in the sprite sheets as JSON, and as
+	   a CSS class per icon"""
+	f = open(os.path.join(output, "atlas.json"), "w")
+	try:
+		json.dump(atlas, f, indent=1, separators=(",", ": "), sort_keys=True)
+	finally:
+		f.close()
 
+	f = open(os.path.join(output, "atlas.css"), "w")
+	try:
+		for sheet, entry in sorted(atlas["sheets"].items()):
+			names = sorted(entry["icons"])
+			width = entry["icons"][names[0]]["width"]
+			f.write(",\n".join(".event-icon-%s" % name for name in names))
+			f.write(" {\n\tbackground: url(%s) no-repeat;\n\tdisplay: inline-block;\n"
+			        "\twidth: %dpx;\n\theight: %dpx;\n}\n" % (entry["image"], width, width))
+			for name in names:
+				icon = entry["icons"][name]
+				f.write(".event-icon-%s { background-position: -%dpx -%dpx; }\n" % (name, icon["x"], icon["y"]))
+	finally:
+		f.close()
 
-def convertToPNGs():
-	import glob, commands
+def rasterize(svg, png):
+	"""writes the PNG of an SVG, with a transparent background"""
+	if cairosvg is not None:
+		cairosvg.svg2png(url=svg, write_to=png)
+	else:
+		subprocess.check_call(["convert", "-background", "none", svg, png])
 
-	if not os.path.isdir("./png"):
-		os.mkdir("./png");
+def pngPath(output, name):
+	return os.path.join(output, "png", name + ".png")
 
-	for i in glob.glob("./*.svg"):
-		cmd = "convert -background none " + i + " ./png/" + i[2:-3] + "png"
-		commands.getstatusoutput(cmd)
+def loadManifest(output):
+	"""returns the key of each icon made before"""
+	try:
+		f = open(os.path.join(output, MANIFEST))
+		try:
+			return json.load(f)
+		finally:
+			f.close()
+	except (IOError, ValueError):
+		return {}
 
+def saveManifest(output, manifest):
+	f = open(os.path.join(output, MANIFEST), "w")
+	try:
+		json.dump(manifest, f, indent=1, separators=(",", ": "), sort_keys=True)
+	finally:
+		f.close()
 
 if __name__ == "__main__":
-	main()
+	sys.exit(main())
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 #-*- coding:utf-8 -*-
 """
 Helioviewer.org System Information
@@ -7,147 +7,433 @@ Author: Keith Hughitt <keith.hughitt@nasa.gov>
 
 Displays relevant system information that may be useful during installation
 and trouble-shooting.
+
+The checks run concurrently. The results of those which run external
+programs (Apache, MySQL, PHP, Kakadu and FFmpeg) are cached, and only
+computed again once one of the programs has been replaced, upgraded or
+removed, going by the inode, mtime and size of the executables. With --json
+the results are printed as a JSON object instead, keyed by section and
+label, for collecting the inventory of many hosts.
+
+The Hardware section reports, from /proc and /sys, the processors and NUMA
+nodes, the memory and huge page settings, the open file limits, and the
+kind of disk and the free space of the JP2 and cache directories set in the
+API's Config.ini. From those it recommends how many PHP-FPM children,
+tiling cache workers and movie queue workers the host can run.
+
+With --benchmark, once the checks are done, the script also measures how
+fast the host decodes JPEG2000 and encodes movies, for sizing its worker
+pools. A synthetic 4096x4096 full disk image is compressed with
+kdu_compress, then decoded with kdu_expand at reduction levels 0 to 3, both
+whole (frames/s) and one 512x512 tile at a time (tiles/s). A synthetic
+30 frame 1024x1024 movie is encoded with libx264 using each of the presets
+in resources/FFmpeg (frames/s). Each figure is the best of --repeat runs.
+
+Example usage:
+
+  ./system_info.py
+  ./system_info.py --json
+  ./system_info.py --refresh
+  ./system_info.py --benchmark --json
 """
 import sys
 import os
 import re
+import glob
+import json
+import math
+import time
+import random
+import argparse
 import platform
 import datetime
+import functools
+import tempfile
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+PRESETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FFmpeg")
+
+# Sizes of the synthetic inputs of --benchmark: a full disk image like those
+# of AIA, decoded at each reduction level, and a short movie
+JP2_SIZE = 4096
+JP2_REDUCE = (0, 1, 2, 3)
+TILE_SIZE = 512
+MOVIE_SIZE = 1024
+MOVIE_FRAMES = 30
+
+# The API's settings, where the JP2 and cache directories are set
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(PRESETS_DIR))),
+                           "api.helioviewer.org", "settings", "Config.ini")
+
+# What worker recommendations assume: the memory one PHP-FPM child needs
+# and how many can share a thread, how many threads and how much memory one
+# movie encoding takes, and how many tiling workers an HDD keeps up with
+PHP_CHILD_MEMORY = 128 * 1024 ** 2
+PHP_CHILDREN_PER_THREAD = 4
+MOVIE_WORKER_THREADS = 4
+MOVIE_WORKER_MEMORY = 1024 ** 3
+HDD_WORKERS = 4
+
+CACHE_VERSION = 1
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                          "helioviewer", "system_info.json")
 
 def main():
     """Helioviewer.org System Diagnostics"""
-    print_greeting()
-    check_platform()
-    check_apache()
-    check_mysql()
-    check_php()
-    check_python()
-    check_kakadu()
-    check_ffmpeg()
-    
+    parser = argparse.ArgumentParser(description="Display Helioviewer.org system information.")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--cache", default=CACHE_FILE, help="file to cache results in (default: %(default)s)")
+    parser.add_argument("--refresh", action="store_true", help="run every check again, updating the cache")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor write the cache")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="also time JPEG2000 decoding and movie encoding")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of timed runs per benchmark (default: %(default)s)")
+    parser.add_argument("--config", default=CONFIG_FILE,
+                        help="the API's Config.ini, for the JP2 and cache directories (default: %(default)s)")
+    parser.add_argument("--jp2-dir", help="JP2 directory, instead of the one in Config.ini")
+    parser.add_argument("--cache-dir", help="Helioviewer cache directory, instead of the one in Config.ini")
+    args = parser.parse_args()
+
+    directories = find_directories(args.config, args.jp2_dir, args.cache_dir)
+    checks = [(name, functools.partial(check, directories) if name == "Hardware" else check, programs)
+              for name, check, programs in CHECKS]
+
+    cache = {} if args.no_cache or args.refresh else load_cache(args.cache)
+    results, cached = run_checks(checks, cache)
+    if not args.no_cache and len(cached) < len(checks):
+        save_cache(args.cache, cache)
+
+    # Run alone, once the checks are done, so nothing else skews the times
+    if args.benchmark:
+        results.append(("Benchmark", run_benchmarks(args.repeat)))
+
+    if args.json:
+        print(json.dumps({
+            "host": platform.node(),
+            "date": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "cached": cached,
+            "checks": dict((name, dict(rows)) for name, rows in results),
+        }, indent=2, sort_keys=True))
+    else:
+        print_greeting()
+        for name, rows in results:
+            print_section(name, rows)
+
+    return 0
+
+def run_checks(checks, cache):
+    """Runs checks concurrently, except those whose results are in the
+    cache and whose programs have not changed since. Returns the name and
+    rows of each check, in order, and the names of those taken from the
+    cache. The cache is updated with the results of the checks run."""
+    fingerprints = dict((name, fingerprint(programs)) for name, check, programs in checks if programs)
+
+    def guarded(check):
+        try:
+            return check()
+        except Exception as e:
+            return [("Error", "%s: %s" % (type(e).__name__, e))]
+
+    cached = [name for name in fingerprints
+              if name in cache and cache[name]["fingerprint"] == fingerprints[name]]
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = dict((name, executor.submit(guarded, check))
+                       for name, check, programs in checks if name not in cached)
+        results = []
+        for name, check, programs in checks:
+            if name in cached:
+                rows = [tuple(row) for row in cache[name]["rows"]]
+            else:
+                rows = futures[name].result()
+                if name in fingerprints and not any(label == "Error" for label, value in rows):
+                    cache[name] = {"fingerprint": fingerprints[name], "rows": rows}
+            results.append((name, rows))
+
+    return results, [name for name, check, programs in checks if name in cached]
+
+def fingerprint(programs):
+    """Returns the path, inode, mtime and size of each program found on the
+    PATH, which change whenever one is replaced or upgraded"""
+    result = []
+    for program in programs:
+        path = which(program)
+        if path is None:
+            result.append([program, None])
+        else:
+            stat = os.stat(path)
+            result.append([program, path, stat.st_ino, stat.st_mtime_ns, stat.st_size])
+    return result
+
+def load_cache(path):
+    """Returns the cached results of each check, or nothing if there is no
+    usable cache"""
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("checks", {})
+
+def save_cache(path, checks):
+    """Writes the cache through a temporary file, so that runs at the same
+    time never read a partial one"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({"version": CACHE_VERSION, "checks": checks}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        sys.stderr.write("Unable to write the cache %s: %s\n" % (path, e))
+
 def check_platform():
     """Checks platform"""
-    print("###########")
-    print(" Platform")
-    print("###########")
-    
     system = platform.system()
     proc = platform.processor()
-    
+
     # OS and architecture information
     if system == "Linux":
-        distro = " ".join(platform.linux_distribution())
-        print("OS: %s (Linux %s %s)" %  (distro, platform.release(), proc))
+        return [("OS", "%s (Linux %s %s)" % (linux_distribution(), platform.release(), proc))]
     elif system == "Darwin":
-        print("OS: Mac OS X %s (%s)" %  (platform.mac_ver()[0], proc))
+        return [("OS", "Mac OS X %s (%s)" % (platform.mac_ver()[0], proc))]
     elif system == "Windows":
-        print("OS: Windows %s %s (%s)" %  (platform.release(), 
-                                        platform.version(), proc))
+        return [("OS", "Windows %s %s (%s)" % (platform.release(), platform.version(), proc))]
     else:
-        print ("Unknown OS (%s)" % proc)
+        return [("OS", "Unknown OS (%s)" % proc)]
+
+def linux_distribution():
+    """Returns the name and version of the Linux distribution"""
+    try:
+        with open("/etc/os-release") as f:
+            release = dict(line.rstrip("\n").split("=", 1) for line in f if "=" in line)
+    except IOError:
+        return "Unknown distribution"
+    return release.get("PRETTY_NAME", release.get("NAME", "Linux")).strip("\"'")
+
+def check_hardware(directories):
+    """Checks the processors, memory, limits and disks, read from /proc and
+    /sys, and recommends how many workers to run; directories are the name
+    and path of the directories whose disks matter"""
+    if not os.path.isdir("/sys/devices/system/cpu"):
+        return [("Hardware", "UNKNOWN (no /proc and /sys)")]
+
+    rows = []
+
+    # Processors
+    cpus = glob.glob("/sys/devices/system/cpu/cpu[0-9]*")
+    online = read_file("/sys/devices/system/cpu/online")
+    threads = count_cpulist(online) if online else os.cpu_count()
+    cores = set((read_file(os.path.join(cpu, "topology/physical_package_id")),
+                 read_file(os.path.join(cpu, "topology/core_id"))) for cpu in cpus)
+    sockets = set(package for package, core in cores)
+    cores = len(cores) or threads
+    model = re.search(r"^model name\s*:\s*(.*)$", read_file("/proc/cpuinfo", ""), re.M)
+    rows.append(("CPU", model.group(1) if model else platform.processor() or "UNKNOWN"))
+    rows.append(("Sockets", len(sockets) or 1))
+    rows.append(("Cores", cores))
+    rows.append(("Threads", threads))
+
+    # NUMA layout
+    nodes = sorted(glob.glob("/sys/devices/system/node/node[0-9]*"), key=lambda node: int(os.path.basename(node)[4:]))
+    for node in nodes:
+        memory = re.search(r"MemTotal:\s*(\d+) kB", read_file(os.path.join(node, "meminfo"), ""))
+        rows.append(("NUMA %s" % os.path.basename(node), "CPUs %s, %s" % (
+            read_file(os.path.join(node, "cpulist"), "?"),
+            format_bytes(int(memory.group(1)) * 1024) if memory else "? memory")))
+
+    # Memory and huge pages
+    meminfo = dict((key, int(value.split()[0])) for key, value in
+                   (line.split(":", 1) for line in read_file("/proc/meminfo", "").splitlines()))
+    memory = meminfo.get("MemTotal", 0) * 1024
+    rows.append(("Memory", "%s (%s available)" % (format_bytes(memory),
+                                                  format_bytes(meminfo.get("MemAvailable", 0) * 1024))))
+    thp = re.search(r"\[(\w+)\]", read_file("/sys/kernel/mm/transparent_hugepage/enabled", ""))
+    rows.append(("Transparent huge pages", thp.group(1) if thp else "UNKNOWN"))
+    rows.append(("Huge pages", "%d x %d kB" % (meminfo.get("HugePages_Total", 0),
+                                              meminfo.get("Hugepagesize", 0))))
+
+    # Open files
+    limits = re.search(r"^Max open files\s+(\S+)\s+(\S+)", read_file("/proc/self/limits", ""), re.M)
+    if limits:
+        rows.append(("Open files (soft/hard)", "%s/%s" % limits.groups()))
+    rows.append(("Open files (system)", read_file("/proc/sys/fs/file-max", "UNKNOWN")))
+
+    # Disks
+    rotational = False
+    for name, path in directories:
+        if path is None:
+            rows.append(("%s directory" % name, "NOT CONFIGURED"))
+            continue
+        if not os.path.isdir(path):
+            rows.append(("%s directory" % name, "NOT FOUND (%s)" % path))
+            continue
+        disk, kind = disk_type(path)
+        rotational = rotational or kind == "HDD"
+        stat = os.statvfs(path)
+        rows.append(("%s directory" % name, path))
+        rows.append(("%s disk" % name, "%s (%s)" % (kind, disk) if disk else kind))
+        rows.append(("%s free space" % name, "%s of %s" % (format_bytes(stat.f_bavail * stat.f_frsize),
+                                                          format_bytes(stat.f_blocks * stat.f_frsize))))
+
+    # Recommendations. Tiles and PHP requests are mostly kdu_expand decoding,
+    # which is bound by the processors, and movies are encoded by x264,
+    # which uses several threads itself. Half the memory is left to MySQL
+    # and the page cache.
+    rows.append(("Recommended PHP-FPM pm.max_children",
+                 max(1, min(PHP_CHILDREN_PER_THREAD * threads, memory // 2 // PHP_CHILD_MEMORY))))
+    rows.append(("Recommended tiling cache workers",
+                 max(1, min(cores, HDD_WORKERS) if rotational else cores)))
+    rows.append(("Recommended movie queue workers",
+                 max(1, min(threads // MOVIE_WORKER_THREADS, memory // 4 // MOVIE_WORKER_MEMORY))))
+    return rows
+
+def disk_type(path):
+    """Returns the name of the disk a directory is on, and whether it is an
+    NVMe SSD, an SSD or an HDD"""
+    dev = os.stat(path).st_dev
+    block = "/sys/dev/block/%d:%d" % (os.major(dev), os.minor(dev))
+    if not os.path.exists(block):
+        return None, "UNKNOWN (not a block device)"
+    return block_device_type(os.path.realpath(block))
+
+def block_device_type(block):
+    """Returns the name and kind of a block device in /sys. Partitions are
+    under their disk, and device mapper and RAID devices list the disks
+    they are made of, of which the first is taken."""
+    if not os.path.exists(os.path.join(block, "queue")):
+        block = os.path.dirname(block)
+    slaves = sorted(glob.glob(os.path.join(block, "slaves", "*")))
+    if slaves:
+        return block_device_type(os.path.realpath(slaves[0]))
+
+    name = os.path.basename(block)
+    if name.startswith("nvme"):
+        return name, "NVMe SSD"
+    rotational = read_file(os.path.join(block, "queue", "rotational"))
+    if rotational is None:
+        return name, "UNKNOWN"
+    return name, "HDD" if rotational == "1" else "SSD"
+
+def find_directories(config, jp2_dir=None, cache_dir=None):
+    """Returns the name and path of the JP2 and cache directories, as given
+    or else as set in the API's Config.ini"""
+    settings = {}
+    if config and os.path.exists(config):
+        with open(config) as f:
+            for line in f:
+                match = re.match(r"\s*(jp2_dir|cache_dir)\s*=\s*(.*?)\s*$", line)
+                if match:
+                    settings[match.group(1)] = match.group(2).strip("\"'")
+
+    return [("JP2", jp2_dir or settings.get("jp2_dir")),
+            ("Cache", cache_dir or settings.get("cache_dir"))]
+
+def count_cpulist(cpulist):
+    """Returns the number of processors in a list such as 0-3,8-11"""
+    count = 0
+    for part in cpulist.split(","):
+        first, sep, last = part.partition("-")
+        count += int(last) - int(first) + 1 if sep else 1
+    return count
+
+def format_bytes(size):
+    """Formats a size in bytes in GiB, or in MiB when smaller"""
+    if size >= 1024 ** 3:
+        return "%.1f GiB" % (size / 1024.0 ** 3)
+    return "%.1f MiB" % (size / 1024.0 ** 2)
+
+def read_file(path, default=None):
+    """Returns the contents of a small file such as those in /proc and
+    /sys, without trailing whitespace, or default if it cannot be read"""
+    try:
+        with open(path) as f:
+            return f.read().rstrip()
+    except (IOError, OSError):
+        return default
 
-    print ""
-        
 def check_apache():
     """Checks Apache version"""
-    print("###########")
-    print(" Apache")
-    print("###########")
-    
     if which("apache2") is not None:
         apache_name = "apache2"
     elif which("httpd") is not None:
         apache_name = "httpd"
     else:
-        print "Apache: NOT FOUND\n"
-        return
-    
-    p = subprocess.Popen([apache_name, "-v"], stdout=subprocess.PIPE)
-    out, err = p.communicate()
-    print out.split("\n")[0] + "\n"
-    
+        return [("Apache", "NOT FOUND")]
+
+    out = run([apache_name, "-v"])
+    return [("Apache", out.split("\n")[0].replace("Server version: ", ""))]
+
 def check_mysql():
     """Checks MySQL version"""
-    print("###########")
-    print(" MySQL")
-    print("###########")
-    p = subprocess.Popen(["mysql", "--version"], stdout=subprocess.PIPE)
-    out, err = p.communicate()
-    print out
-        
+    if which("mysql") is None:
+        return [("MySQL", "NOT FOUND")]
+
+    return [("MySQL", run(["mysql", "--version"]).strip())]
+
 def check_php():
-    """Prints PHP support information"""
-    print("###########")
-    print(" PHP")
-    print("###########")
-    
-    p = subprocess.Popen(["php", "-version"], stdout=subprocess.PIPE)
-    out, err = p.communicate()
-    print out.split("\n")[0]
-    
-    p = subprocess.Popen(["php", "-i"], stdout=subprocess.PIPE)
-    phpinfo, err = p.communicate()
-    
-    pattern = re.compile("imagick module version => ([\d\.]*)")
-    print ("Imagick: %s" % pattern.search(phpinfo).group(1))
-    
-    pattern = re.compile("GD Version => ([\d\.]*)")
-    print ("GD: %s" % pattern.search(phpinfo).group(1))
-    
+    """Checks PHP support"""
+    if which("php") is None:
+        return [("PHP", "NOT FOUND")]
+
+    rows = [("PHP", run(["php", "-version"]).split("\n")[0])]
+
+    phpinfo = run(["php", "-i"])
+
+    match = re.search(r"imagick module version => ([\d\.]*)", phpinfo)
+    rows.append(("Imagick", match.group(1) if match else "NOT FOUND"))
+
+    match = re.search(r"GD Version => ([\d\.]*)", phpinfo)
+    rows.append(("GD", match.group(1) if match else "NOT FOUND"))
+
     if phpinfo.find('mysqli') != -1:
-        print("MySQLi: SUPPORTED\n")
+        rows.append(("MySQLi", "SUPPORTED"))
     else:
-        print("MySQLi: NOT FOUND\n")
-    
+        rows.append(("MySQLi", "NOT FOUND"))
+
     # Zend Gdata?
-    
+    return rows
+
 def check_ffmpeg():
-    """Prints FFmpeg support information"""
-    print("###########")
-    print(" FFmpeg")
-    print("###########")
-    
-    p = subprocess.Popen(["ffmpeg", "-version"], stdout=subprocess.PIPE, 
-                                                 stderr=open('/dev/null'))
-    out, err = p.communicate()
-    
-    version = out[:out.find(":")]
-    print(version)
-    
-    p = subprocess.Popen(["ffmpeg", "-codecs"], stdout=subprocess.PIPE, 
-                                                stderr=open('/dev/null'))
-    out, err = p.communicate()
-    
+    """Checks FFmpeg support"""
+    if which("ffmpeg") is None:
+        return [("FFmpeg", "NOT FOUND")]
+
+    out = run(["ffmpeg", "-version"])
+    rows = [("FFmpeg", out.split("\n")[0].split(" Copyright")[0])]
+
+    out = run(["ffmpeg", "-codecs"])
+
     # H.264
     libx264 = [i for i in out.split('\n') if "libx264" in i]
     if len(libx264) > 0 and "E" in libx264[0][:8]:
-        print("libx264: SUPPORTED")
+        rows.append(("libx264", "SUPPORTED"))
     else:
-        print("libx264: NOT SUPPORTED")
-    
+        rows.append(("libx264", "NOT SUPPORTED"))
+
     # VP8
     libvp8 = [i for i in out.split('\n') if "libvpx" in i]
     if len(libvp8) > 0 and "E" in libvp8[0][:8]:
-        print("libvpx: SUPPORTED")
+        rows.append(("libvpx", "SUPPORTED"))
     else:
-        print("libvpx: NOT SUPPORTED")
-    
+        rows.append(("libvpx", "NOT SUPPORTED"))
+
+    return rows
+
 def check_python():
     """Checks Python support"""
-    print("###########")
-    print(" Python")
-    print("###########")
-        
     # Python version
     arch = platform.architecture()[0]
-    print("Python %s (%s)" % (platform.python_version(), arch))
-    
+    rows = [("Python", "%s (%s)" % (platform.python_version(), arch))]
+
     try:
         from MySQLdb import __version__ as mysqldb_version
     except ImportError:
         mysqldb_version = "NOT INSTALLED"
-        
+
     try:
         from numpy import __version__ as numpy_version
     except ImportError:
@@ -157,65 +443,173 @@ def check_python():
         from scipy import __version__ as scipy_version
     except ImportError:
         scipy_version = "NOT INSTALLED"
-        
+
     try:
         from matplotlib import __version__ as matplotlib_version
     except ImportError:
         matplotlib_version = "NOT INSTALLED"
-        
+
     try:
         from PyQt4.QtCore import PYQT_VERSION_STR as pyqt_version
     except ImportError:
         pyqt_version = "NOT INSTALLED"
-        
-    print("MySQLdb: %s" % mysqldb_version)
-    print("NumPy: %s" % numpy_version)
-    print("SciPy: %s" % scipy_version)
-    print("Matplotlib: %s" % matplotlib_version)
-    print("PyQt: %s\n" % pyqt_version)
+
+    rows.append(("MySQLdb", mysqldb_version))
+    rows.append(("NumPy", numpy_version))
+    rows.append(("SciPy", scipy_version))
+    rows.append(("Matplotlib", matplotlib_version))
+    rows.append(("PyQt", pyqt_version))
+    return rows
 
 def check_kakadu():
     """Checks Kakadu support"""
-    print("###########")
-    print(" Kakadu")
-    print("###########")
-    
-    if os.name is "nt":
-        kdu_expand = "kdu_expand.exe"
-        kdu_merge = "kdu_merge.exe"
-    else:
-        kdu_expand = "kdu_expand"
-        kdu_merge = "kdu_merge"
-        
-    pattern = re.compile("v[\d\.]+")
+    pattern = re.compile(r"v[\d\.]+")
+    rows = []
 
-    if which(kdu_expand) is None:
-        kdu_expand_version = "NOT FOUND"
-    else:
-        p = subprocess.Popen([kdu_expand, "-version"], stdout=subprocess.PIPE)
-        out, err = p.communicate()
-        kdu_expand_version = pattern.search(out).group(0)
-    
-    if which(kdu_merge) is None:
-        kdu_merge_version = "NOT FOUND"
-    else:
-        p = subprocess.Popen([kdu_merge, "-version"], stdout=subprocess.PIPE)
-        out, err = p.communicate()
-        kdu_merge_version = pattern.search(out).group(0)
+    for program in (KDU_EXPAND, KDU_MERGE):
+        if which(program) is None:
+            version = "NOT FOUND"
+        else:
+            match = pattern.search(run([program, "-version"]))
+            version = match.group(0) if match else "UNKNOWN"
+        rows.append((program.replace(".exe", ""), version))
+
+    return rows
+
+def run_benchmarks(repeat):
+    """Times JPEG2000 decoding and movie encoding on synthetic inputs, and
+    returns the tiles and frames per second of each, the best of several
+    runs"""
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="system_info") as tmp:
+        rows.extend(benchmark_kakadu(tmp, repeat))
+        rows.extend(benchmark_ffmpeg(tmp, repeat))
+    return rows
+
+def benchmark_kakadu(tmp, repeat):
+    """Decodes a synthetic full disk image with kdu_expand at each reduction
+    level, both a whole frame and a single tile as the tiler requests it"""
+    if which(KDU_EXPAND) is None or which(KDU_COMPRESS) is None:
+        return [("Kakadu", "%s and %s are needed" % (KDU_EXPAND, KDU_COMPRESS))]
+
+    image = os.path.join(tmp, "image.pgm")
+    jp2 = os.path.join(tmp, "image.jp2")
+    write_pgm(image, JP2_SIZE, JP2_SIZE, synthetic_image(JP2_SIZE, JP2_SIZE))
+    try:
+        timed([KDU_COMPRESS, "-i", image, "-o", jp2, "Clevels=8", "Corder=RPCL",
+               "ORGgen_plt=yes", "Cprecincts={128,128}", "-rate", "0.5"], 1)
+    except subprocess.CalledProcessError as e:
+        return [("Kakadu", failure(e))]
+
+    rows = []
+    for reduce in JP2_REDUCE:
+        # A tile covers TILE_SIZE pixels of the reduced image
+        side = min(1.0, TILE_SIZE * 2 ** reduce / float(JP2_SIZE))
+        region = "{%f,%f},{%f,%f}" % ((1 - side) / 2, (1 - side) / 2, side, side)
+        expand = [KDU_EXPAND, "-i", jp2, "-o", os.path.join(tmp, "out.pgm"), "-reduce", str(reduce)]
+        try:
+            rows.append(("Decoded frames/s (reduce %d)" % reduce, rate(1, timed(expand, repeat))))
+            rows.append(("Decoded tiles/s (reduce %d)" % reduce,
+                         rate(1, timed(expand + ["-region", region], repeat))))
+        except subprocess.CalledProcessError as e:
+            rows.append(("Reduce %d" % reduce, failure(e)))
+
+    return rows
+
+def benchmark_ffmpeg(tmp, repeat):
+    """Encodes a short synthetic movie with libx264 using each of the
+    presets movies are made with"""
+    if which("ffmpeg") is None:
+        return [("FFmpeg", "NOT FOUND")]
+
+    frames = os.path.join(tmp, "frames.raw")
+    with open(frames, "wb") as f:
+        for i in range(MOVIE_FRAMES):
+            f.write(synthetic_image(MOVIE_SIZE, MOVIE_SIZE, shift=i * 8))
+
+    rows = []
+    for preset in sorted(glob.glob(os.path.join(PRESETS_DIR, "libx264-*.ffpreset"))):
+        name = os.path.splitext(os.path.basename(preset))[0]
+        encode = ["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "gray",
+                  "-s", "%dx%d" % (MOVIE_SIZE, MOVIE_SIZE), "-r", "15", "-i", frames,
+                  "-vcodec", "libx264", "-fpre", preset, "-pix_fmt", "yuv420p",
+                  "-f", "null", "-"]
+        try:
+            rows.append(("Encoded frames/s (%s)" % name, rate(MOVIE_FRAMES, timed(encode, repeat))))
+        except subprocess.CalledProcessError as e:
+            rows.append(("Encoded frames/s (%s)" % name, failure(e)))
+
+    return rows
+
+def synthetic_image(width, height, shift=0):
+    """Returns an 8-bit greyscale image of a noisy bright disk on a dark
+    noisy background, roughly as hard to compress as a solar image; shift
+    moves the noise, to make the frames of a movie differ"""
+    rng = random.Random(42)
+    dark = bytes(rng.randrange(32) for i in range(2 * width))
+    bright = bytes(128 + rng.randrange(96) for i in range(2 * width))
+    radius = 0.4 * min(width, height)
+
+    rows = []
+    for y in range(height):
+        offset = (y * 7919 + shift) % width
+        dy = y - height / 2.0
+        half = math.sqrt(radius ** 2 - dy ** 2) if abs(dy) < radius else 0
+        left, right = int(width / 2.0 - half), int(width / 2.0 + half)
+        rows.append(dark[offset:offset + left] + bright[offset + left:offset + right] +
+                    dark[offset + right:offset + width])
+    return b"".join(rows)
+
+def write_pgm(path, width, height, data):
+    """Writes an 8-bit greyscale image as a binary PGM"""
+    with open(path, "wb") as f:
+        f.write(b"P5\n%d %d\n255\n" % (width, height))
+        f.write(data)
+
+def timed(args, repeat):
+    """Returns the best wall time of several runs of a program"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def rate(count, seconds):
+    """Returns how many things are done per second"""
+    return round(count / seconds, 2)
+
+def failure(error):
+    """Describes a program that failed, with the last line it printed"""
+    lines = error.stderr.decode("utf-8", "replace").strip().split("\n")
+    return "FAILED (%s)" % lines[-1] if lines[-1] else "FAILED"
 
-    print("kdu_expand: %s" % kdu_expand_version)
-    print("kdu_merge: %s\n" % kdu_merge_version)
-    
 def print_greeting():
     """Prints greeting banner"""
     print("==========================================================")
     print(" Helioviewer.org System Information\n")
     print(" " + datetime.datetime.utcnow().strftime("%A, %d. %B %Y %I:%M%p UT"))
     print("==========================================================\n")
-    
+
+def print_section(name, rows):
+    """Prints the results of a check under a banner"""
+    print("###########")
+    print(" " + name)
+    print("###########")
+    for label, value in rows:
+        print("%s: %s" % (label, value))
+    print("")
+
+def run(args):
+    """Runs a program and returns what it printed"""
+    return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          universal_newlines=True, errors="replace").stdout
+
 def which(program):
     """Checks for existence of executable
-    
+
     Source: http://stackoverflow.com/questions/377017/test-if-executable-exists-in-python/377028#377028
     """
     def is_exe(fpath):
@@ -233,7 +627,28 @@ def which(program):
                 return exe_file
 
     return None
-    
-    
+
+if os.name == "nt":
+    KDU_EXPAND = "kdu_expand.exe"
+    KDU_MERGE = "kdu_merge.exe"
+    KDU_COMPRESS = "kdu_compress.exe"
+else:
+    KDU_EXPAND = "kdu_expand"
+    KDU_MERGE = "kdu_merge"
+    KDU_COMPRESS = "kdu_compress"
+
+# Name of each check, in the order they are shown, and the programs whose
+# results are cached until they change
+CHECKS = (
+    ("Platform", check_platform, ()),
+    ("Hardware", check_hardware, ()),
+    ("Apache", check_apache, ("apache2", "httpd")),
+    ("MySQL", check_mysql, ("mysql",)),
+    ("PHP", check_php, ("php",)),
+    ("Python", check_python, ()),
+    ("Kakadu", check_kakadu, (KDU_EXPAND, KDU_MERGE)),
+    ("FFmpeg", check_ffmpeg, ("ffmpeg",)),
+)
+
 if __name__ == "__main__":
-    sys.exit(main());
\ No newline at end of file
+    sys.exit(main())
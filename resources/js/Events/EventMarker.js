@@ -382,6 +382,7 @@ var EventMarker = Class.extend(
 
         if (
           Helioviewer.userSettings.get("state.drawers.#hv-drawer-timeline-events.open") == true &&
+          typeof timelineRes != "undefined" &&
           timelineRes == "m"
         ) {
           var eventID = $(event.currentTarget).attr("rel");
@@ -397,6 +398,7 @@ var EventMarker = Class.extend(
 
         if (
           Helioviewer.userSettings.get("state.drawers.#hv-drawer-timeline-events.open") == true &&
+          typeof timelineRes != "undefined" &&
           timelineRes == "m"
         ) {
           $(".highcharts-series > rect").show();
@@ -9,7 +9,7 @@
   TooltipHelper, HelioviewerViewport, ScreenshotBuilder, ScreenshotHistory,
   MovieHistory, UserVideoGallery, MessageConsole, Helioviewer,
   KeyboardManager, SettingsLoader, TimeControls, ScreenshotManagerUI, MovieManagerUI, assignTouchHandlers,
-  TileLayerAccordion, VisualGlossary, _gaq */
+  TileLayerAccordion, VisualGlossary, loadChunk, _gaq */
 
 "use strict";
 
@@ -2112,6 +2112,16 @@ var HelioviewerWebClient = HelioviewerClient.extend(
         return;
     },
 
+    /**
+     * Shows in a drawer that its part of the client could not be loaded. The
+     * next time the drawer is opened, loading it is tried again.
+     *
+     * @param {String} selector Container of the drawer's contents
+     */
+    _chunkFailed: function(selector) {
+        $(selector).text("This panel could not be loaded. Close and reopen it to try again.");
+    },
+
     drawerTimelineClick: function(openNow) {
         var self = this;
         if ( this.drawerTimelineOpened || openNow === false ) {
@@ -2159,7 +2169,7 @@ var HelioviewerWebClient = HelioviewerClient.extend(
             this.drawerTimelineEventsOpened = false;
 
             if(typeof this.timeline == 'undefined'){
-                setTimeout(function(){self.timeline   = new Timeline();}, 200);
+                setTimeout(function(){loadChunk("timeline", function(){self.timeline   = new Timeline();}, function(){self._chunkFailed('#data-coverage-timeline');});}, 200);
                 //this.timeline   = new Timeline();
             }else{
                 this.timeline.drawPlotLine();
@@ -2221,7 +2231,7 @@ var HelioviewerWebClient = HelioviewerClient.extend(
             this.drawerTimelineOpened = false;
 
             if(typeof this.timelineEvents == 'undefined'){
-                setTimeout(function(){self.timelineEvents   = new TimelineEvents();}, 200);
+                setTimeout(function(){loadChunk("timeline", function(){self.timelineEvents   = new TimelineEvents();}, function(){self._chunkFailed('#data-coverage-timeline-events');});}, 200);
             }else{
                 this.timelineEvents.drawPlotLine();
                 $('#data-coverage-timeline-events').highcharts().xAxis[0].setExtremes(timelineStartDate, timelineEndDate);
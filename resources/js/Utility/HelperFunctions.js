@@ -7,7 +7,7 @@
  */
 /*jslint browser: true, white: true, onevar: true, undef: true, nomen: false, eqeqeq: true, plusplus: true,
 bitwise: false, regexp: true, strict: true, newcap: true, immed: true, maxlen: 120, sub: true, console: true */
-/*global window, console, $, navigator, Storage */
+/*global window, console, $, navigator, Storage, chunkURLs */
 "use strict";
 
 /**
@@ -202,6 +202,43 @@ var loadCSS = function (filename) {
     $("head").append("<link rel='stylesheet' type='text/css' href='" + filename + "' />");
 };
 
+/**
+ * @description Loads a chunk of the client split from the main bundle by the
+ * build (see resources/build/jsmin/depgraph.py) once, and calls callback when
+ * it has run. The URL of each chunk is set in chunkURLs by index.php; where
+ * it is not, as in debug mode, the page has loaded every file already and
+ * callback is called right away. If the chunk cannot be loaded, an error is
+ * shown in the message console and error, if given, is called; the next call
+ * tries again. The chunk's own $(function) handlers, such as the Highcharts
+ * plugins of the timelines, run asynchronously once the page has loaded, so
+ * callback is queued the same way to run after them.
+ */
+var loadChunk = (function () {
+    var loading = {};
+
+    return function (name, callback, error) {
+        if (typeof(chunkURLs) === "undefined" || !chunkURLs[name]) {
+            callback();
+            return;
+        }
+        if (!loading[name]) {
+            loading[name] = $.ajax({url: chunkURLs[name], dataType: "script", cache: true});
+            loading[name].fail(function () {
+                delete loading[name];
+                $(document).trigger("message-console-error", ["Unable to load part of Helioviewer. Please reload the page."]);
+            });
+        }
+        loading[name].done(function () {
+            $(callback);
+        });
+        if (error) {
+            loading[name].fail(function () {
+                error();
+            });
+        }
+    };
+}());
+
 /**
  * @description Determine what operating system the user is likely to be on: For use when chosing movie codecs, etc.
  * @returns {String} Abbreviation of the user's OS